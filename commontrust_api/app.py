@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from functools import partial
 
 from fastapi import Depends, FastAPI
 
 from commontrust_api.auth import require_api_token
+from commontrust_api.config import api_settings
 from commontrust_api.hub.routes import router as hub_router
+from commontrust_api.hub.transport import hub_transport
 from commontrust_api.identity.routes import router as identity_router
+from commontrust_api.ledger.locks import claim_process_role
 from commontrust_api.ledger.routes import router as ledger_router
+from commontrust_api.ledger.service import MutualCreditService
+from commontrust_api.observability import RequestMetricsMiddleware
+from commontrust_api.observability import router as observability_router
 from commontrust_api.pb import make_pb_client
 from commontrust_api.reputation.routes import router as reputation_router
+from commontrust_api.reputation.service import ReputationService
 
 logger = logging.getLogger(__name__)
 
@@ -22,16 +31,44 @@ def create_app() -> FastAPI:
     app.include_router(reputation_router, dependencies=[Depends(require_api_token)])
     app.include_router(ledger_router, dependencies=[Depends(require_api_token)])
     app.include_router(hub_router, dependencies=[Depends(require_api_token)])
+    # Probes and the Prometheus scrape sit outside the API token gate (/metrics has its own).
+    app.include_router(observability_router)
+    app.add_middleware(RequestMetricsMiddleware)
 
     pb = make_pb_client()
+    background_tasks: set[asyncio.Task] = set()
 
     @app.on_event("startup")
     async def _startup() -> None:
         await pb.authenticate()
         logger.info("CommonTrust API authenticated with PocketBase")
 
+        if (
+            api_settings.credit_limit_sweep_interval_seconds > 0
+            and api_settings.credit_limit_refresh_ttl_seconds > 0
+        ):
+            mc = MutualCreditService(
+                pb=pb,
+                reputation=ReputationService(pb=pb),
+                limit_refresh_ttl_seconds=api_settings.credit_limit_refresh_ttl_seconds,
+            )
+            # Every uvicorn worker starts this, but only the one holding the role sweeps;
+            # otherwise the workers would race each other (and payments) on the same accounts.
+            claim = partial(
+                claim_process_role, "credit-limit-sweeper", api_settings.ledger_lock_dir or None
+            )
+            background_tasks.add(
+                asyncio.create_task(
+                    mc.run_limit_sweeper(api_settings.credit_limit_sweep_interval_seconds, claim)
+                )
+            )
+
     @app.on_event("shutdown")
     async def _shutdown() -> None:
+        for task in background_tasks:
+            task.cancel()
+        background_tasks.clear()
+        await hub_transport.aclose()
         await pb.close()
 
     # Store on app state for handlers.
@@ -18,3 +18,14 @@ def require_api_token(
     if not token or token != api_settings.api_token:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+
+def require_metrics_token(
+    creds: HTTPAuthorizationCredentials | None = Depends(_bearer),
+) -> None:
+    # Optional: without METRICS_TOKEN the scrape endpoint is open, like most exporters.
+    if not api_settings.metrics_token:
+        return
+    token = creds.credentials if creds else ""
+    if not token or token != api_settings.metrics_token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
@@ -12,22 +12,64 @@ class ApiSettings(BaseSettings):
     # HTTP API auth
     api_token: str = Field(default="", alias="COMMONTRUST_API_TOKEN")
 
+    # Separate bearer token for /metrics (empty: unauthenticated); /healthz and /readyz are open
+    metrics_token: str = Field(default="", alias="METRICS_TOKEN")
+    # How long /readyz waits for PocketBase before reporting the worker unavailable
+    readiness_timeout_seconds: float = Field(default=2.0, alias="READINESS_TIMEOUT_SECONDS")
+
     # PocketBase (used as ledger store and/or hub remote config store)
     pocketbase_url: str = Field(default="http://localhost:8090", alias="POCKETBASE_URL")
     pocketbase_admin_token: str | None = Field(default=None, alias="POCKETBASE_ADMIN_TOKEN")
     pocketbase_admin_email: str | None = Field(default=None, alias="POCKETBASE_ADMIN_EMAIL")
     pocketbase_admin_password: str | None = Field(default=None, alias="POCKETBASE_ADMIN_PASSWORD")
 
+    # Log PocketBase requests slower than this (0 disables)
+    pocketbase_slow_query_seconds: float = Field(default=0.5, alias="POCKETBASE_SLOW_QUERY_SECONDS")
+
+    # In-process member record cache (0 disables)
+    member_cache_size: int = Field(default=10000, alias="MEMBER_CACHE_SIZE")
+    member_cache_ttl_seconds: float = Field(default=300.0, alias="MEMBER_CACHE_TTL_SECONDS")
+
+    # Chat -> group/mc_group/currency resolution kept per worker (0 disables)
+    group_directory_size: int = Field(default=10000, alias="GROUP_DIRECTORY_SIZE")
+    group_directory_ttl_seconds: float = Field(default=60.0, alias="GROUP_DIRECTORY_TTL_SECONDS")
+
     # Credit policy (reputation-based by default)
     credit_base_limit: int = Field(default=100, alias="CREDIT_BASE_LIMIT")
     credit_per_deal: int = Field(default=50, alias="CREDIT_PER_DEAL")
     credit_limit_refresh_ttl_seconds: int = Field(default=300, alias="CREDIT_LIMIT_REFRESH_TTL_SECONDS")
+    # Background refresh of stale credit limits (0 disables; payments then refresh inline)
+    credit_limit_sweep_interval_seconds: float = Field(
+        default=60.0, alias="CREDIT_LIMIT_SWEEP_INTERVAL_SECONDS"
+    )
+
+    # Cross-process ledger account locks for multi-worker deployments (empty: in-process only)
+    ledger_lock_dir: str = Field(default="", alias="LEDGER_LOCK_DIR")
+
+    # Recently applied payment idempotency keys kept per worker (0 disables)
+    idempotency_cache_size: int = Field(default=10000, alias="IDEMPOTENCY_CACHE_SIZE")
+    idempotency_cache_ttl_seconds: float = Field(
+        default=86400.0, alias="IDEMPOTENCY_CACHE_TTL_SECONDS"
+    )
 
     # Hub mode (optional): store and proxy per-chat remote ledger endpoints.
     ledger_mode: str = Field(default="local", alias="LEDGER_MODE")  # "local" | "hub"
     hub_remote_token_encryption_key: str | None = Field(
         default=None, alias="HUB_REMOTE_TOKEN_ENCRYPTION_KEY"
     )
+    # Pooled HTTP clients used to proxy to remote ledgers (one per remote base_url)
+    hub_max_connections: int = Field(default=100, alias="HUB_MAX_CONNECTIONS")
+    hub_max_keepalive_connections: int = Field(default=20, alias="HUB_MAX_KEEPALIVE_CONNECTIONS")
+    hub_timeout_seconds: float = Field(default=20.0, alias="HUB_TIMEOUT_SECONDS")
+    hub_connect_timeout_seconds: float = Field(default=3.0, alias="HUB_CONNECT_TIMEOUT_SECONDS")
+    hub_http2: bool = Field(default=False, alias="HUB_HTTP2")  # needs the `http2` extra
+    # Resolved remote config + decrypted token per chat (invalidated locally on set/delete)
+    hub_remote_cache_ttl_seconds: float = Field(
+        default=60.0, alias="HUB_REMOTE_CACHE_TTL_SECONDS"
+    )
+    # Per-remote circuit breaker: consecutive failures before failing fast, and for how long
+    hub_breaker_failure_threshold: int = Field(default=5, alias="HUB_BREAKER_FAILURE_THRESHOLD")
+    hub_breaker_reset_seconds: float = Field(default=30.0, alias="HUB_BREAKER_RESET_SECONDS")
 
     @property
     def is_configured(self) -> bool:
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from typing import Any
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, HTTPException, Request
@@ -7,6 +8,7 @@ from pydantic import BaseModel, Field
 
 from commontrust_api.config import api_settings
 from commontrust_api.hub.crypto import encrypt_token
+from commontrust_api.hub.transport import hub_transport
 
 
 router = APIRouter(prefix="/v1/hub", tags=["hub"])
@@ -29,6 +31,13 @@ def _validate_base_url(url: str) -> str:
     return u
 
 
+def _base_url_of(record: dict[str, Any] | None) -> str | None:
+    # Normalized the way HubTransport.resolve keys its clients.
+    if not record:
+        return None
+    return (record.get("base_url") or "").rstrip("/") or None
+
+
 @router.put("/groups/{telegram_chat_id}/ledger_remote", response_model=LedgerRemoteOut)
 async def set_ledger_remote(req: Request, telegram_chat_id: int, payload: LedgerRemoteIn) -> LedgerRemoteOut:
     if api_settings.ledger_mode != "hub":
@@ -42,7 +51,9 @@ async def set_ledger_remote(req: Request, telegram_chat_id: int, payload: Ledger
     pb = req.app.state.pb
     base_url = _validate_base_url(payload.base_url)
     token_enc = encrypt_token(api_settings.hub_remote_token_encryption_key, payload.token.strip())
+    previous = await pb.ledger_remote_get(telegram_chat_id)
     await pb.ledger_remote_upsert(telegram_chat_id=telegram_chat_id, base_url=base_url, token_encrypted=token_enc)
+    await hub_transport.invalidate(telegram_chat_id, _base_url_of(previous), base_url)
     return LedgerRemoteOut(base_url=base_url)
 
 
@@ -62,6 +73,13 @@ async def delete_ledger_remote(req: Request, telegram_chat_id: int) -> dict[str,
     if api_settings.ledger_mode != "hub":
         raise HTTPException(status_code=400, detail="Hub mode is not enabled (LEDGER_MODE=hub)")
     pb = req.app.state.pb
+    previous = await pb.ledger_remote_get(telegram_chat_id)
     await pb.ledger_remote_delete(telegram_chat_id)
+    await hub_transport.invalidate(telegram_chat_id, _base_url_of(previous))
     return {"status": "deleted"}
 
+
+@router.get("/remotes/stats")
+async def remote_stats() -> dict[str, Any]:
+    # Per-remote request/error/latency counters and circuit state for this worker.
+    return hub_transport.stats()
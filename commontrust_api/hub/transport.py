@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import httpx
+
+from commontrust_api.cache import TTLCache
+from commontrust_api.config import api_settings
+from commontrust_api.hub.breaker import CircuitBreaker, CircuitOpenError
+from commontrust_api.hub.crypto import HubCryptoError, decrypt_token
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RemoteLedger:
+    base_url: str
+    token: str
+
+
+@dataclass
+class RemoteStats:
+    requests: int = 0
+    errors: int = 0
+    # Refused locally because the remote's circuit was open.
+    rejected: int = 0
+    # Time to response headers; bodies are streamed through afterwards.
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+
+
+class HubTransport:
+    """Long-lived HTTP clients and resolved remote configs for hub-mode proxying.
+
+    One pooled keep-alive client is kept per remote base_url, so consecutive proxied calls reuse
+    connections instead of paying a TCP/TLS handshake each time. Each chat's remote (including
+    "no remote configured") is cached with its token already decrypted; the hub routes drop the
+    entry when a remote is set or removed, and the TTL bounds staleness across API workers.
+
+    Every remote also gets its own circuit breaker: once it keeps failing, calls for it fail
+    fast instead of each holding a connection until the timeout, so one dead remote ledger
+    can't tie up the hub for every other group.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 20.0,
+        connect_timeout: float = 3.0,
+        http2: bool = False,
+        remote_cache_size: int = 10000,
+        remote_cache_ttl_seconds: float = 60.0,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_seconds: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # Waiting for a connection or a pool slot is capped separately so a saturated remote
+        # fails quickly rather than queueing callers for the full read timeout.
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=connect_timeout)
+        self.http2 = http2 and _h2_available()
+        self.breaker_failure_threshold = breaker_failure_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.transport = transport
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._stats: dict[str, RemoteStats] = {}
+        # Wrapped in a 1-tuple so a cached "no remote" (None) is distinguishable from a miss.
+        self._remotes: TTLCache[tuple[RemoteLedger | None]] = TTLCache(
+            remote_cache_size, remote_cache_ttl_seconds
+        )
+
+    async def resolve(self, pb: Any, telegram_chat_id: int) -> RemoteLedger | None:
+        cached = self._remotes.get(telegram_chat_id)
+        if cached is not None:
+            return cached[0]
+
+        record = await pb.ledger_remote_get(telegram_chat_id)
+        remote = None
+        if record:
+            if not api_settings.hub_remote_token_encryption_key:
+                # Not cached: this is a deployment error, not a property of the chat.
+                raise HubCryptoError("Hub encryption key missing")
+            remote = RemoteLedger(
+                base_url=(record.get("base_url") or "").rstrip("/"),
+                token=decrypt_token(
+                    api_settings.hub_remote_token_encryption_key,
+                    record.get("token_encrypted") or "",
+                ),
+            )
+        self._remotes.set(telegram_chat_id, (remote,))
+        return remote
+
+    async def invalidate(
+        self,
+        telegram_chat_id: int,
+        previous_base_url: str | None = None,
+        base_url: str | None = None,
+    ) -> None:
+        """Forget the chat's cached remote after it was set to `base_url` or deleted (None).
+
+        If the chat moved off `previous_base_url`, that remote's pooled client is closed and its
+        breaker dropped; another chat still pointing there just opens a fresh client.
+        """
+        self._remotes.pop(telegram_chat_id)
+        if previous_base_url and previous_base_url != base_url:
+            self._breakers.pop(previous_base_url, None)
+            client = self._clients.pop(previous_base_url, None)
+            if client is not None:
+                await client.aclose()
+
+    def client_for(self, base_url: str) -> httpx.AsyncClient:
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                transport=self.transport,
+            )
+            self._clients[base_url] = client
+        return client
+
+    def breaker_for(self, base_url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(base_url)
+        if breaker is None:
+            breaker = CircuitBreaker(self.breaker_failure_threshold, self.breaker_reset_seconds)
+            self._breakers[base_url] = breaker
+        return breaker
+
+    async def send(
+        self,
+        remote: RemoteLedger,
+        method: str,
+        url: str,
+        content: Any = None,
+        headers: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        """Send a request to `remote` and return once the response headers are in.
+
+        The body is left unread (stream it, or `aread()` it) and the caller must `aclose()` the
+        response. Raises CircuitOpenError without touching the network while the remote's
+        circuit is open; transport errors and 5xx responses count against the circuit.
+        """
+        breaker = self.breaker_for(remote.base_url)
+        stats = self._stats.setdefault(remote.base_url, RemoteStats())
+        if not breaker.allow():
+            stats.rejected += 1
+            raise CircuitOpenError(remote.base_url, breaker.retry_after())
+
+        client = self.client_for(remote.base_url)
+        stats.requests += 1
+        started = time.perf_counter()
+        try:
+            request = client.build_request(
+                method,
+                url,
+                content=content,
+                headers={**(headers or {}), "Authorization": f"Bearer {remote.token}"},
+            )
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError:
+            stats.errors += 1
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats.latency_ms_total += elapsed_ms
+            stats.latency_ms_max = max(stats.latency_ms_max, elapsed_ms)
+
+        if response.status_code >= 500:
+            stats.errors += 1
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def record_failure(self, remote: RemoteLedger) -> None:
+        """Count a failure seen after `send` returned, e.g. the remote dropping mid-body."""
+        self._stats.setdefault(remote.base_url, RemoteStats()).errors += 1
+        self.breaker_for(remote.base_url).record_failure()
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+        self._remotes.clear()
+
+    def clients(self) -> dict[str, httpx.AsyncClient]:
+        """Pooled client per remote base_url, as opened so far."""
+        return dict(self._clients)
+
+    def stats(self) -> dict[str, Any]:
+        remotes = {
+            base_url: {**asdict(stats), "state": self.breaker_for(base_url).state}
+            for base_url, stats in self._stats.items()
+        }
+        return {
+            "clients": len(self._clients),
+            "remote_cache": self._remotes.stats(),
+            "remotes": remotes,
+        }
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HUB_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+        return False
+    return True
+
+
+hub_transport = HubTransport(
+    max_connections=api_settings.hub_max_connections,
+    max_keepalive_connections=api_settings.hub_max_keepalive_connections,
+    timeout=api_settings.hub_timeout_seconds,
+    connect_timeout=api_settings.hub_connect_timeout_seconds,
+    http2=api_settings.hub_http2,
+    remote_cache_ttl_seconds=api_settings.hub_remote_cache_ttl_seconds,
+    breaker_failure_threshold=api_settings.hub_breaker_failure_threshold,
+    breaker_reset_seconds=api_settings.hub_breaker_reset_seconds,
+)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+from commontrust_api.cache import TTLCache
+from commontrust_api.config import api_settings
+
+
+@dataclass(frozen=True)
+class GroupEntry:
+    telegram_chat_id: int
+    group_id: str
+    mc_enabled: bool
+    mc_group_id: str | None
+    currency_name: str
+    currency_symbol: str
+
+
+class GroupDirectory:
+    """Chat id -> group/mc_group resolution shared by every ledger route.
+
+    Resolving a chat takes two PocketBase reads (groups, then mc_groups) and the result rarely
+    changes, so it is kept per worker. `enable_ledger` (which also applies currency changes)
+    invalidates the chat's entry; the TTL bounds staleness for changes made by other workers or
+    the bots.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache: TTLCache[GroupEntry] = TTLCache(maxsize, ttl_seconds)
+
+    async def lookup(self, pb: Any, telegram_chat_id: int) -> GroupEntry | None:
+        entry = self._cache.get(telegram_chat_id)
+        if entry is not None:
+            return entry
+
+        group = await pb.group_get(telegram_chat_id)
+        if not group:
+            return None
+        mc_group = await pb.mc_group_get(group.get("id")) if group.get("mc_enabled") else None
+        entry = GroupEntry(
+            telegram_chat_id=telegram_chat_id,
+            group_id=str(group.get("id")),
+            mc_enabled=bool(group.get("mc_enabled")),
+            mc_group_id=str(mc_group.get("id")) if mc_group else None,
+            currency_name=str((mc_group or {}).get("currency_name") or "Credit"),
+            currency_symbol=str((mc_group or {}).get("currency_symbol") or "Cr"),
+        )
+        self._cache.set(telegram_chat_id, entry)
+        return entry
+
+    def invalidate(self, telegram_chat_id: int) -> None:
+        self._cache.pop(telegram_chat_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+
+group_directory = GroupDirectory(
+    api_settings.group_directory_size, api_settings.group_directory_ttl_seconds
+)
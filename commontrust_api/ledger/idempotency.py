@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from commontrust_api.cache import TTLCache
+from commontrust_api.config import api_settings
+from commontrust_api.ledger.models import PaymentOut
+
+
+class IdempotencyIndex:
+    """Recently applied payment idempotency keys and the response they produced.
+
+    This is only a fast path for retries that land on the same worker; the unique index on
+    (mc_group_id, idempotency_key) in PocketBase remains the source of truth.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache: TTLCache[PaymentOut] = TTLCache(maxsize, ttl_seconds)
+
+    def get(self, telegram_chat_id: int, idempotency_key: str) -> PaymentOut | None:
+        out = self._cache.get((telegram_chat_id, idempotency_key))
+        if out is None:
+            return None
+        return out.model_copy(update={"already_applied": True})
+
+    def remember(self, telegram_chat_id: int, idempotency_key: str, out: PaymentOut) -> None:
+        self._cache.set((telegram_chat_id, idempotency_key), out)
+
+    def stats(self) -> dict[str, int]:
+        return self._cache.stats()
+
+
+payment_idempotency = IdempotencyIndex(
+    api_settings.idempotency_cache_size, api_settings.idempotency_cache_ttl_seconds
+)
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import zlib
+from collections.abc import AsyncIterator, Hashable
+
+from commontrust_api.config import api_settings
+
+
+class AccountLockManager:
+    """Serializes balance read-modify-write cycles per ledger account.
+
+    Keys (typically `(mc_group_id, member_id)`) are hashed onto a fixed set of stripes so memory
+    stays bounded. `hold()` takes every stripe a call needs in ascending order, so two payments
+    touching the same pair of accounts in opposite directions cannot deadlock.
+
+    With `lock_dir` set, each stripe is additionally guarded by an `fcntl` file lock so several
+    API worker processes on the same host exclude each other too.
+    """
+
+    def __init__(self, stripes: int = 1024, lock_dir: str | None = None):
+        if stripes <= 0:
+            raise ValueError("stripes must be positive")
+        self.stripes = stripes
+        self.lock_dir = lock_dir
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+        if lock_dir:
+            import fcntl  # noqa: F401  (POSIX only; fail early rather than on first payment)
+
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def _stripe(self, key: Hashable) -> int:
+        # Stable across processes (unlike hash()), which the file-lock backend relies on.
+        return zlib.crc32(repr(key).encode("utf-8")) % self.stripes
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *keys: Hashable) -> AsyncIterator[None]:
+        stripes = sorted({self._stripe(k) for k in keys})
+        async with contextlib.AsyncExitStack() as stack:
+            for stripe in stripes:
+                await stack.enter_async_context(self._locks[stripe])
+                if self.lock_dir:
+                    await stack.enter_async_context(self._file_lock(stripe))
+            yield
+
+    @contextlib.asynccontextmanager
+    async def _file_lock(self, stripe: int) -> AsyncIterator[None]:
+        import fcntl
+
+        path = os.path.join(self.lock_dir or "", f"ledger-{stripe:04d}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # flock blocks; keep the event loop free while another process holds the stripe.
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+_claimed_roles: dict[str, int] = {}
+
+
+def claim_process_role(name: str, lock_dir: str | None) -> bool:
+    """Whether this process holds `name`, a job only one worker should run (e.g. a sweeper).
+
+    Without `lock_dir` the API runs as a single process and always holds it. Otherwise the first
+    worker to take a non-blocking `fcntl` lock on `<lock_dir>/<name>.lock` keeps it until it
+    exits; ask again later and another worker takes over. Replicas on other hosts don't share
+    the lock, so enable such jobs on one replica only.
+    """
+    if not lock_dir or name in _claimed_roles:
+        return True
+    import fcntl
+
+    os.makedirs(lock_dir, exist_ok=True)
+    fd = os.open(os.path.join(lock_dir, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _claimed_roles[name] = fd
+    return True
+
+
+account_locks = AccountLockManager(lock_dir=api_settings.ledger_lock_dir or None)
@@ -41,4 +41,9 @@ class ZeroSumOut(BaseModel):
     is_zero_sum: bool
     total_balance: int
     account_count: int
+    # Defaults keep responses from older (proxied) ledger hosts valid.
+    entry_count: int | None = None
+    is_reconciled: bool | None = None
+    mismatched_accounts: list[str] = Field(default_factory=list)
+    checkpoint: str | None = None
 
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+from collections.abc import AsyncIterator
 from typing import Any
 
 import httpx
-from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from commontrust_api.config import api_settings
-from commontrust_api.hub.crypto import decrypt_token
+from commontrust_api.hub.breaker import CircuitOpenError
+from commontrust_api.hub.crypto import HubCryptoError
+from commontrust_api.hub.transport import RemoteLedger, hub_transport
+from commontrust_api.ledger.directory import GroupEntry, group_directory
+from commontrust_api.ledger.idempotency import payment_idempotency
 from commontrust_api.ledger.models import (
     BalanceOut,
     EnableLedgerIn,
@@ -16,13 +23,20 @@ from commontrust_api.ledger.models import (
     ZeroSumOut,
 )
 from commontrust_api.ledger.service import InsufficientCreditError, MutualCreditService
+from commontrust_api.pocketbase_client import PocketBaseConflictError
 from commontrust_api.reputation.service import ReputationService
 
 
 router = APIRouter(prefix="/v1/ledger", tags=["ledger"])
 
 
-async def _maybe_proxy(req: Request) -> Response | None:
+async def _maybe_proxy(req: Request, buffered: bool = False) -> Response | None:
+    """Forward the request to the chat's remote ledger in hub mode; None means handle locally.
+
+    The remote's response body is streamed back. The request body is forwarded from the copy
+    FastAPI already read to validate the payload. Routes that re-validate the remote's answer
+    pass `buffered=True` and get a plain Response with `.body` instead.
+    """
     if api_settings.ledger_mode != "hub":
         return None
     pb = req.app.state.pb
@@ -34,46 +48,85 @@ async def _maybe_proxy(req: Request) -> Response | None:
     except Exception:
         return None
 
-    remote = await pb.ledger_remote_get(chat_id)
-    if not remote:
+    try:
+        remote = await hub_transport.resolve(pb, chat_id)
+    except HubCryptoError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+    if remote is None:
         return None
 
-    if not api_settings.hub_remote_token_encryption_key:
-        raise HTTPException(status_code=500, detail="Hub encryption key missing")
-
-    base_url = (remote.get("base_url") or "").rstrip("/")
-    token = decrypt_token(api_settings.hub_remote_token_encryption_key, remote.get("token_encrypted") or "")
-
     # Forward the request as-is, swapping auth header.
-    url = f"{base_url}{req.url.path}"
+    url = req.url.path
     if req.url.query:
         url += f"?{req.url.query}"
 
-    body: bytes = await req.body()
-    headers = {"Authorization": f"Bearer {token}"}
-    method = req.method.upper()
+    try:
+        upstream = await hub_transport.send(
+            remote,
+            req.method.upper(),
+            url,
+            content=await req.body() if req.method.upper() in ("POST", "PUT", "PATCH") else None,
+            headers={"Content-Type": req.headers.get("content-type", "application/json")},
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Remote ledger unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))},
+        ) from e
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail="Remote ledger unreachable") from e
+
+    content_type = upstream.headers.get("content-type", "application/json")
+    if buffered:
+        try:
+            content = await upstream.aread()
+        except httpx.HTTPError as e:
+            hub_transport.record_failure(remote)
+            raise HTTPException(status_code=502, detail="Remote ledger unreachable") from e
+        finally:
+            await upstream.aclose()
+        return Response(content=content, status_code=upstream.status_code, media_type=content_type)
+    return StreamingResponse(
+        _relay(remote, upstream),
+        status_code=upstream.status_code,
+        media_type=content_type,
+        background=BackgroundTask(upstream.aclose),
+    )
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        r = await client.request(method, url, content=body, headers=headers)
 
-    content_type = r.headers.get("content-type", "application/json")
-    return Response(content=r.content, status_code=r.status_code, media_type=content_type)
+async def _relay(remote: RemoteLedger, upstream: httpx.Response) -> AsyncIterator[bytes]:
+    # The status is already sent, so a remote dropping mid-body can only cut the response short,
+    # but it still counts against the remote's circuit.
+    try:
+        async for chunk in upstream.aiter_bytes():
+            yield chunk
+    except httpx.HTTPError:
+        hub_transport.record_failure(remote)
+        raise
 
 
 def _mc_service(req: Request) -> MutualCreditService:
     pb = req.app.state.pb
     reputation = ReputationService(pb=pb)
-    return MutualCreditService(pb=pb, reputation=reputation)
+    return MutualCreditService(
+        pb=pb,
+        reputation=reputation,
+        limit_refresh_ttl_seconds=api_settings.credit_limit_refresh_ttl_seconds,
+    )
 
 
-async def _get_mc_group_id_or_400(pb: Any, telegram_chat_id: int) -> str:
-    group = await pb.group_get(telegram_chat_id)
-    if not group or not group.get("mc_enabled"):
+async def _ledger_group_or_400(pb: Any, telegram_chat_id: int) -> GroupEntry:
+    entry = await group_directory.lookup(pb, telegram_chat_id)
+    if entry is None or not entry.mc_enabled:
         raise HTTPException(status_code=400, detail="Mutual credit is not enabled for this group")
-    mc_group = await pb.mc_group_get(group.get("id"))
-    if not mc_group:
+    if not entry.mc_group_id:
         raise HTTPException(status_code=400, detail="Mutual credit group not found")
-    return str(mc_group.get("id"))
+    return entry
+
+
+async def _get_mc_group_id_or_400(pb: Any, telegram_chat_id: int) -> str:
+    return str((await _ledger_group_or_400(pb, telegram_chat_id)).mc_group_id)
 
 
 @router.post("/groups/{telegram_chat_id}/enable")
@@ -95,22 +148,27 @@ async def enable_ledger(req: Request, telegram_chat_id: int, payload: EnableLedg
         currency_symbol=payload.currency_symbol,
     )
     await pb.update_record("groups", group.get("id"), {"mc_enabled": True})
+    group_directory.invalidate(telegram_chat_id)
     return {"mc_group_id": mc_group.get("id"), "currency_name": mc_group.get("currency_name"), "currency_symbol": mc_group.get("currency_symbol")}
 
 
 @router.get("/groups/{telegram_chat_id}/accounts/{telegram_user_id}/balance", response_model=BalanceOut)
 async def get_balance(req: Request, telegram_chat_id: int, telegram_user_id: int) -> BalanceOut:
-    proxied = await _maybe_proxy(req)
+    proxied = await _maybe_proxy(req, buffered=True)
     if proxied is not None:
         if proxied.status_code >= 400:
             return proxied  # type: ignore[return-value]
         return BalanceOut.model_validate_json(proxied.body)
 
     pb = req.app.state.pb
-    mc_group_id = await _get_mc_group_id_or_400(pb, telegram_chat_id)
+    group = await _ledger_group_or_400(pb, telegram_chat_id)
     member = await pb.member_get_or_create(telegram_user_id)
     mc = _mc_service(req)
-    info = await mc.get_account_balance(mc_group_id, member.get("id"))
+    info = await mc.get_account_balance(
+        str(group.mc_group_id),
+        member.get("id"),
+        currency=(group.currency_name, group.currency_symbol),
+    )
     return BalanceOut(
         balance=int(info["balance"]),
         credit_limit=int(info["credit_limit"]),
@@ -122,14 +180,21 @@ async def get_balance(req: Request, telegram_chat_id: int, telegram_user_id: int
 
 @router.post("/groups/{telegram_chat_id}/payments", response_model=PaymentOut)
 async def create_payment(req: Request, telegram_chat_id: int, payload: PaymentIn) -> PaymentOut:
-    proxied = await _maybe_proxy(req)
+    proxied = await _maybe_proxy(req, buffered=True)
     if proxied is not None:
         if proxied.status_code >= 400:
             return proxied  # type: ignore[return-value]
         return PaymentOut.model_validate_json(proxied.body)
 
+    # Client retries (e.g. after a Telegram timeout) are answered without touching PocketBase.
+    if payload.idempotency_key:
+        replay = payment_idempotency.get(telegram_chat_id, payload.idempotency_key)
+        if replay is not None:
+            return replay
+
     pb = req.app.state.pb
-    mc_group_id = await _get_mc_group_id_or_400(pb, telegram_chat_id)
+    group = await _ledger_group_or_400(pb, telegram_chat_id)
+    mc_group_id = str(group.mc_group_id)
     payer = await pb.member_get_or_create(payload.payer_telegram_user_id)
     payee = await pb.member_get_or_create(payload.payee_telegram_user_id)
     mc = _mc_service(req)
@@ -146,20 +211,28 @@ async def create_payment(req: Request, telegram_chat_id: int, payload: PaymentIn
         raise HTTPException(status_code=400, detail=str(e)) from e
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
+    except PocketBaseConflictError as e:
+        raise HTTPException(status_code=409, detail="Ledger busy, please retry") from e
 
-    mc_group = await pb.get_record("mc_groups", mc_group_id)
-    return PaymentOut(
+    out = PaymentOut(
         transaction_id=str(result["transaction"].get("id")),
         new_payer_balance=int(result["new_payer_balance"]),
         new_payee_balance=int(result["new_payee_balance"]),
-        symbol=str(mc_group.get("currency_symbol", "Cr")),
+        symbol=group.currency_symbol,
         already_applied=bool(result.get("already_applied", False)),
     )
+    if payload.idempotency_key:
+        payment_idempotency.remember(telegram_chat_id, payload.idempotency_key, out)
+    return out
 
 
 @router.get("/groups/{telegram_chat_id}/accounts/{telegram_user_id}/transactions")
 async def get_transactions(
-    req: Request, telegram_chat_id: int, telegram_user_id: int, limit: int = 20
+    req: Request,
+    telegram_chat_id: int,
+    telegram_user_id: int,
+    limit: int = Query(default=20, ge=1, le=200),
+    cursor: str | None = None,
 ) -> dict[str, object]:
     proxied = await _maybe_proxy(req)
     if proxied is not None:
@@ -169,26 +242,39 @@ async def get_transactions(
     mc_group_id = await _get_mc_group_id_or_400(pb, telegram_chat_id)
     member = await pb.member_get_or_create(telegram_user_id)
     mc = _mc_service(req)
-    items = await mc.get_transaction_history(mc_group_id, member.get("id"), limit=limit)
-
-    member_cache: dict[str, dict[str, Any]] = {}
+    try:
+        page = await mc.transaction_history_page(
+            mc_group_id, member.get("id"), limit=limit, cursor=cursor, expand="payer_id,payee_id"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    items = page["items"]
 
-    async def _member(rec_id: str) -> dict[str, Any]:
-        if rec_id not in member_cache:
-            member_cache[rec_id] = await pb.get_record("members", rec_id)
-        return member_cache[rec_id]
+    # Members normally arrive expanded with the page; anything missing (e.g. hidden by API rules)
+    # is fetched in one batched query, through the client's shared member cache.
+    members: dict[str, dict[str, Any]] = {}
+    for tx in items:
+        for field in ("payer_id", "payee_id"):
+            expanded = (tx.get("expand") or {}).get(field)
+            if isinstance(expanded, dict) and expanded.get("id"):
+                members[expanded["id"]] = expanded
+    missing = [
+        tx.get(field)
+        for tx in items
+        for field in ("payer_id", "payee_id")
+        if isinstance(tx.get(field), str) and tx.get(field) not in members
+    ]
+    if missing:
+        members.update(await pb.members_get_many(missing))
 
     out_items: list[dict[str, Any]] = []
     for tx in items:
-        payer_id = tx.get("payer_id")
-        payee_id = tx.get("payee_id")
-        if not isinstance(payer_id, str) or not isinstance(payee_id, str):
+        payer = members.get(tx.get("payer_id"))
+        payee = members.get(tx.get("payee_id"))
+        if payer is None or payee is None:
             continue
-        payer = await _member(payer_id)
-        payee = await _member(payee_id)
 
         payer_tid = int(payer.get("telegram_id", 0) or 0)
-        payee_tid = int(payee.get("telegram_id", 0) or 0)
         is_sender = payer_tid == telegram_user_id
         other = payee if is_sender else payer
 
@@ -196,7 +282,7 @@ async def get_transactions(
             {
                 "amount": int(tx.get("amount", 0) or 0),
                 "description": tx.get("description"),
-                "created": tx.get("created"),
+                "created": tx.get("created") or tx.get("created_at"),
                 "direction": "sent" if is_sender else "received",
                 "other_telegram_user_id": int(other.get("telegram_id", 0) or 0),
                 "other_username": other.get("username"),
@@ -204,7 +290,7 @@ async def get_transactions(
             }
         )
 
-    return {"items": out_items}
+    return {"items": out_items, "next_cursor": page["next_cursor"]}
 
 
 @router.patch("/groups/{telegram_chat_id}/accounts/{telegram_user_id}")
@@ -223,7 +309,7 @@ async def set_account(req: Request, telegram_chat_id: int, telegram_user_id: int
 
 @router.get("/groups/{telegram_chat_id}/verify_zero_sum", response_model=ZeroSumOut)
 async def verify_zero_sum(req: Request, telegram_chat_id: int) -> ZeroSumOut:
-    proxied = await _maybe_proxy(req)
+    proxied = await _maybe_proxy(req, buffered=True)
     if proxied is not None:
         if proxied.status_code >= 400:
             return proxied  # type: ignore[return-value]
@@ -237,4 +323,8 @@ async def verify_zero_sum(req: Request, telegram_chat_id: int) -> ZeroSumOut:
         is_zero_sum=bool(result["is_zero_sum"]),
         total_balance=int(result["total_balance"]),
         account_count=int(result["account_count"]),
+        entry_count=int(result["entry_count"]),
+        is_reconciled=bool(result["is_reconciled"]),
+        mismatched_accounts=list(result["mismatched_accounts"])[:50],
+        checkpoint=result["checkpoint"],
     )
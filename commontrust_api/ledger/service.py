@@ -1,16 +1,132 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import json
+import logging
+import random
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime, timedelta
+from functools import partial
+from typing import TypeVar
+
+from commontrust_api.ledger.locks import AccountLockManager, account_locks
+from commontrust_api.pocketbase_client import PocketBaseConflictError, PocketBaseDuplicateError
 from commontrust_api.reputation.service import ReputationService
 
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Accounts fetched per `id="a" || id="b"` list query when sweeping limits.
+_ACCOUNTS_PER_QUERY = 50
+
 
 class InsufficientCreditError(Exception):
     pass
 
 
+@dataclass
+class LedgerMetrics:
+    # Optimistic-concurrency outcomes on mc_accounts writes (process-wide counters).
+    conflicts: int = 0
+    retries: int = 0
+    exhausted: int = 0
+
+    def snapshot(self) -> dict[str, int]:
+        return asdict(self)
+
+
+ledger_metrics = LedgerMetrics()
+
+
+def _version(account: dict) -> int | None:
+    # Accounts created before the version field existed read as 0 from PocketBase; only a
+    # missing key (e.g. a backend without the field) disables the compare-and-swap.
+    version = account.get("version")
+    return int(version) if isinstance(version, (int, float)) else None
+
+
+def _pb_timestamp(moment: datetime) -> str:
+    # PocketBase autodate format ("2024-01-02 03:04:05.678Z"), which orders correctly as a string.
+    utc = moment.astimezone(UTC)
+    return utc.strftime("%Y-%m-%d %H:%M:%S.") + f"{utc.microsecond // 1000:03d}Z"
+
+
+def _entries_filter(
+    since: str, mc_group_id: str | None = None, account_id: str | None = None
+) -> str:
+    clauses = []
+    if mc_group_id:
+        clauses.append(f'account_id.mc_group_id="{mc_group_id}"')
+    if account_id:
+        clauses.append(f'account_id="{account_id}"')
+    if since:
+        clauses.append(f'created_at>="{since}"')
+    return " && ".join(clauses)
+
+
+def _encode_cursor(created_at: str, record_id: str) -> str:
+    raw = json.dumps([created_at, record_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(created_at, str) or not isinstance(record_id, str):
+        raise ValueError("Invalid cursor")
+    # Values are interpolated into a filter; refuse anything that could break out of the quotes.
+    if '"' in created_at or '"' in record_id or "\\" in created_at or "\\" in record_id:
+        raise ValueError("Invalid cursor")
+    return created_at, record_id
+
+
 class MutualCreditService:
-    def __init__(self, pb: object, reputation: ReputationService):
+    def __init__(
+        self,
+        pb: object,
+        reputation: ReputationService,
+        locks: AccountLockManager | None = None,
+        metrics: LedgerMetrics | None = None,
+        max_attempts: int = 5,
+        retry_base_delay: float = 0.01,
+        snapshot_settle_seconds: float = 60.0,
+        limit_refresh_ttl_seconds: float = 0.0,
+        clock: Callable[[], datetime] | None = None,
+    ):
         self.pb = pb
         self.reputation = reputation
+        self.locks = locks or account_locks
+        self.metrics = metrics or ledger_metrics
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.snapshot_settle_seconds = snapshot_settle_seconds
+        # 0 recomputes the credit limit from reputation on every read.
+        self.limit_refresh_ttl_seconds = limit_refresh_ttl_seconds
+        self.clock = clock or (lambda: datetime.now(UTC))
+
+    async def _retry_on_conflict(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        # The in-process lock only covers this worker; other workers/replicas are caught by the
+        # version check in PocketBase. On conflict, re-run the whole read-check-write attempt.
+        delay = self.retry_base_delay
+        for n in range(1, self.max_attempts + 1):
+            try:
+                return await attempt()
+            except PocketBaseConflictError:
+                self.metrics.conflicts += 1
+                if n >= self.max_attempts:
+                    self.metrics.exhausted += 1
+                    logger.warning("mc_accounts write still conflicting after %d attempts", n)
+                    raise
+                self.metrics.retries += 1
+                await asyncio.sleep(delay * (1 + random.random()))
+                delay = min(delay * 2, 1.0)
+        raise AssertionError("unreachable")
 
     async def get_or_create_mc_group(
         self, group_record_id: str, currency_name: str = "Credit", currency_symbol: str = "Cr"
@@ -35,27 +151,133 @@ class MutualCreditService:
 
         rep = await self.reputation.get_reputation(member_record_id)
         credit_limit = self.reputation.compute_credit_limit(int(rep["verified_deals"]))
-        return await self.pb.mc_account_create(mc_group_id, member_record_id, credit_limit)
+        return await self.pb.mc_account_create(
+            mc_group_id,
+            member_record_id,
+            credit_limit,
+            limit_refreshed_at=_pb_timestamp(self.clock()),
+        )
+
+    def _limit_is_fresh(self, account: dict) -> bool:
+        refreshed_at = str(account.get("limit_refreshed_at") or "")
+        if self.limit_refresh_ttl_seconds <= 0 or not refreshed_at:
+            return False
+        cutoff = self.clock() - timedelta(seconds=self.limit_refresh_ttl_seconds)
+        return refreshed_at >= _pb_timestamp(cutoff)
 
-    async def refresh_credit_limit(self, mc_group_id: str, member_record_id: str) -> dict:
+    async def refresh_credit_limit(
+        self, mc_group_id: str, member_record_id: str, force: bool = False
+    ) -> dict:
+        # A limit refreshed within the TTL is used as stored. Reputation changes clear
+        # limit_refreshed_at (pb_hooks/reputation_credit_limits.pb.js), so those still apply
+        # on the next read instead of waiting out the TTL.
         account = await self.get_or_create_account(mc_group_id, member_record_id)
+        if not force and self._limit_is_fresh(account):
+            return account
         rep = await self.reputation.get_reputation(member_record_id)
         new_limit = self.reputation.compute_credit_limit(int(rep["verified_deals"]))
-        if int(account.get("credit_limit", 0)) != new_limit:
-            return await self.pb.mc_account_update(account.get("id"), int(account.get("balance", 0)), new_limit)
-        return account
+        if int(account.get("credit_limit", 0)) == new_limit and self.limit_refresh_ttl_seconds <= 0:
+            return account
+        return await self.pb.mc_account_set_limit(
+            account.get("id"),
+            new_limit,
+            expected_version=_version(account),
+            limit_refreshed_at=_pb_timestamp(self.clock()),
+        )
+
+    async def _limits_due(self, max_accounts: int) -> list[dict]:
+        now = self.clock()
+        due = _pb_timestamp(now - timedelta(seconds=self.limit_refresh_ttl_seconds / 2))
+        active_since = _pb_timestamp(now - timedelta(seconds=self.limit_refresh_ttl_seconds))
+        # Limits a reputation change expired (pb_hooks clears limit_refreshed_at).
+        accounts: list[dict] = []
+        async for account in self.pb.iter_records("mc_accounts", filter='limit_refreshed_at=""'):
+            if len(accounts) >= max_accounts:
+                return accounts
+            accounts.append(account)
+        # Accounts that moved within the last TTL, once their limit is past half of it.
+        active = set()
+        async for entry in self.pb.iter_records(
+            "mc_entries", filter=f'created_at>="{active_since}"'
+        ):
+            active.add(str(entry["account_id"]))
+        active -= {account["id"] for account in accounts}
+        ids = sorted(active)
+        for start in range(0, len(ids), _ACCOUNTS_PER_QUERY):
+            chunk = ids[start : start + _ACCOUNTS_PER_QUERY]
+            result = await self.pb.list_records(
+                "mc_accounts",
+                per_page=len(chunk),
+                filter=f'limit_refreshed_at<"{due}" && ('
+                + " || ".join(f'id="{account_id}"' for account_id in chunk)
+                + ")",
+                skip_total=True,
+            )
+            accounts.extend(result.get("items", []))
+        return accounts[:max_accounts]
+
+    async def refresh_stale_limits(self, max_accounts: int = 1000) -> int:
+        """Refresh the credit limits the next payments are likely to need.
+
+        That is limits expired by a reputation change, and limits past half their TTL on
+        accounts with ledger entries within the last TTL. Idle accounts are left alone; their
+        next payment or balance check refreshes the limit inline.
+        """
+        if self.limit_refresh_ttl_seconds <= 0:
+            return 0
+        refreshed = 0
+        for account in await self._limits_due(max_accounts):
+            mc_group_id, member_record_id = str(account["mc_group_id"]), str(account["member_id"])
+            async with self.locks.hold((mc_group_id, member_record_id)):
+                await self._retry_on_conflict(
+                    partial(self.refresh_credit_limit, mc_group_id, member_record_id, force=True)
+                )
+            refreshed += 1
+        return refreshed
+
+    async def run_limit_sweeper(
+        self, interval_seconds: float, claim: Callable[[], bool] = lambda: True
+    ) -> None:
+        # `claim` says whether this process should sweep; it's asked before every sweep so
+        # another worker can take over when the one holding the role exits.
+        while True:
+            await asyncio.sleep(interval_seconds)
+            if not claim():
+                continue
+            try:
+                refreshed = await self.refresh_stale_limits()
+                if refreshed:
+                    logger.info("Refreshed %d credit limit(s)", refreshed)
+            except Exception:
+                logger.exception("Credit limit sweep failed")
 
-    async def get_account_balance(self, mc_group_id: str, member_record_id: str) -> dict:
-        account = await self.refresh_credit_limit(mc_group_id, member_record_id)
-        mc_group = await self.pb.get_record("mc_groups", mc_group_id)
+    async def get_account_balance(
+        self,
+        mc_group_id: str,
+        member_record_id: str,
+        currency: tuple[str, str] | None = None,
+    ) -> dict:
+        # refresh_credit_limit may write the account back (once its limit is stale); don't race a
+        # payment doing the same.
+        async with self.locks.hold((mc_group_id, member_record_id)):
+            account = await self._retry_on_conflict(
+                lambda: self.refresh_credit_limit(mc_group_id, member_record_id)
+            )
+        if currency is None:
+            # Callers that already resolved the group (name, symbol) skip this read.
+            mc_group = await self.pb.get_record("mc_groups", mc_group_id)
+            currency = (
+                mc_group.get("currency_name", "Credit"),
+                mc_group.get("currency_symbol", "Cr"),
+            )
         bal = int(account.get("balance", 0))
         limit = int(account.get("credit_limit", 0))
         return {
             "balance": bal,
             "credit_limit": limit,
             "available": bal + limit,
-            "currency": mc_group.get("currency_name", "Credit"),
-            "symbol": mc_group.get("currency_symbol", "Cr"),
+            "currency": currency[0],
+            "symbol": currency[1],
         }
 
     async def create_payment(
@@ -72,25 +294,53 @@ class MutualCreditService:
         if payer_member_record_id == payee_member_record_id:
             raise ValueError("Cannot pay yourself")
 
-        if idempotency_key:
-            existing = await self.pb.mc_transaction_get_by_idempotency(mc_group_id, idempotency_key)
-            if existing:
-                payer_account = await self.pb.mc_account_get(mc_group_id, payer_member_record_id)
-                payee_account = await self.pb.mc_account_get(mc_group_id, payee_member_record_id)
-                return {
-                    "transaction": existing,
-                    "new_payer_balance": int(payer_account.get("balance", 0)) if payer_account else 0,
-                    "new_payee_balance": int(payee_account.get("balance", 0)) if payee_account else 0,
-                    "already_applied": True,
-                }
+        # Balances are read, checked and written back; hold both accounts for the whole cycle.
+        async with self.locks.hold(
+            (mc_group_id, payer_member_record_id), (mc_group_id, payee_member_record_id)
+        ):
+            return await self._retry_on_conflict(
+                lambda: self._create_payment_locked(
+                    mc_group_id,
+                    payer_member_record_id,
+                    payee_member_record_id,
+                    amount,
+                    description,
+                    idempotency_key,
+                )
+            )
 
+    async def _create_payment_locked(
+        self,
+        mc_group_id: str,
+        payer_member_record_id: str,
+        payee_member_record_id: str,
+        amount: int,
+        description: str | None,
+        idempotency_key: str | None,
+    ) -> dict:
+        # Insert-first: the unique (mc_group_id, idempotency_key) index rejects a replayed batch
+        # as a whole, so the common (first-time) path needs no lookup query.
         payer_account = await self.refresh_credit_limit(mc_group_id, payer_member_record_id)
         payee_account = await self.refresh_credit_limit(mc_group_id, payee_member_record_id)
+        if idempotency_key and not await self.pb.mc_idempotency_indexed():
+            # Without the unique index a replay would post again; look the key up first.
+            replay = await self._already_applied(
+                mc_group_id, payer_account, payee_account, idempotency_key
+            )
+            if replay is not None:
+                return replay
 
         payer_balance = int(payer_account.get("balance", 0))
         payer_credit_limit = int(payer_account.get("credit_limit", 0))
         payer_available = payer_balance + payer_credit_limit
         if payer_available < amount:
+            # A replay of an applied payment can fail the credit check on its own debit.
+            if idempotency_key:
+                replay = await self._already_applied(
+                    mc_group_id, payer_account, payee_account, idempotency_key
+                )
+                if replay is not None:
+                    return replay
             raise InsufficientCreditError(
                 f"Insufficient credit. Available: {payer_available}, Required: {amount}"
             )
@@ -98,62 +348,212 @@ class MutualCreditService:
         new_payer_balance = payer_balance - amount
         new_payee_balance = int(payee_account.get("balance", 0)) + amount
 
-        transaction = await self.pb.mc_transaction_create(
-            mc_group_id=mc_group_id,
-            payer_id=payer_member_record_id,
-            payee_id=payee_member_record_id,
-            amount=amount,
-            description=description,
-            idempotency_key=idempotency_key,
-        )
-
-        transaction_id = transaction.get("id")
-        await self.pb.mc_entry_create(
-            transaction_id=transaction_id,
-            account_id=payer_account.get("id"),
-            amount=-amount,
-            balance_after=new_payer_balance,
-        )
-        await self.pb.mc_entry_create(
-            transaction_id=transaction_id,
-            account_id=payee_account.get("id"),
-            amount=amount,
-            balance_after=new_payee_balance,
-        )
-
-        await self.pb.mc_account_update(payer_account.get("id"), new_payer_balance)
-        await self.pb.mc_account_update(payee_account.get("id"), new_payee_balance)
+        # Posted atomically in one round-trip (transaction, both entries, both balances).
+        try:
+            posted = await self.pb.mc_payment_create(
+                mc_group_id=mc_group_id,
+                payer_id=payer_member_record_id,
+                payee_id=payee_member_record_id,
+                payer_account_id=payer_account.get("id"),
+                payee_account_id=payee_account.get("id"),
+                amount=amount,
+                new_payer_balance=new_payer_balance,
+                new_payee_balance=new_payee_balance,
+                description=description,
+                idempotency_key=idempotency_key,
+                payer_version=_version(payer_account),
+                payee_version=_version(payee_account),
+            )
+        except PocketBaseDuplicateError:
+            if not idempotency_key:
+                raise
+            replay = await self._already_applied(
+                mc_group_id, payer_account, payee_account, idempotency_key
+            )
+            if replay is None:
+                raise
+            return replay
 
         return {
-            "transaction": transaction,
+            "transaction": posted["transaction"],
             "new_payer_balance": new_payer_balance,
             "new_payee_balance": new_payee_balance,
             "already_applied": False,
         }
 
+    async def _already_applied(
+        self, mc_group_id: str, payer_account: dict, payee_account: dict, idempotency_key: str
+    ) -> dict | None:
+        existing = await self.pb.mc_transaction_get_by_idempotency(mc_group_id, idempotency_key)
+        if not existing:
+            return None
+        return {
+            "transaction": existing,
+            "new_payer_balance": int(payer_account.get("balance", 0)),
+            "new_payee_balance": int(payee_account.get("balance", 0)),
+            "already_applied": True,
+        }
+
     async def verify_zero_sum(self, mc_group_id: str) -> dict:
-        result = await self.pb.list_records(
-            "mc_accounts", filter=f'mc_group_id="{mc_group_id}"', per_page=500
-        )
-        accounts = result.get("items", [])
-        total_balance = sum(int(acc.get("balance", 0)) for acc in accounts)
+        """Check the group nets to zero and every balance equals the sum of its entries.
+
+        Entries and accounts are streamed page by page; the only state kept is one running sum
+        per account. Entries already folded into the group's snapshot are not read again, and a
+        clean run moves the snapshot forward so the next one starts where this one settled.
+        """
+        snapshot = await self.pb.mc_snapshot_latest(mc_group_id) or {}
+        base = {k: int(v) for k, v in (snapshot.get("account_sums") or {}).items()}
+        since = str(snapshot.get("checkpoint") or "")
+        horizon = await self._settled_horizon(mc_group_id)
+
+        sums = dict(base)
+        settled = dict(base)
+        settled_count = int(snapshot.get("entry_count") or 0)
+        entry_count = settled_count
+        async for entry in self.pb.iter_records(
+            "mc_entries", filter=_entries_filter(since, mc_group_id=mc_group_id)
+        ):
+            account_id = entry.get("account_id")
+            amount = int(entry.get("amount", 0))
+            sums[account_id] = sums.get(account_id, 0) + amount
+            entry_count += 1
+            if str(entry.get("created_at") or "") < horizon:
+                settled[account_id] = settled.get(account_id, 0) + amount
+                settled_count += 1
+
+        total_balance = 0
+        account_count = 0
+        suspects: list[str] = []
+        async for account in self.pb.iter_records(
+            "mc_accounts", filter=f'mc_group_id="{mc_group_id}"'
+        ):
+            balance = int(account.get("balance", 0))
+            total_balance += balance
+            account_count += 1
+            if balance != sums.pop(account["id"], 0):
+                suspects.append(account["id"])
+        # Whatever is left has entries but no account in this group; it must still net out.
+        suspects.extend(account_id for account_id, total in sums.items() if total != 0)
+
+        # A payment that lands between the two scans skews its accounts; re-check those alone.
+        mismatched = [
+            account_id
+            for account_id in suspects
+            if not await self._account_reconciles(account_id, base.get(account_id, 0), since)
+        ]
+
+        is_zero_sum = total_balance == 0
+        snapshot_id = snapshot.get("id")
+        checkpoint = since
+        if is_zero_sum and not mismatched and horizon > since and settled != base:
+            written = await self.pb.mc_snapshot_save(
+                mc_group_id,
+                checkpoint=horizon,
+                account_sums={k: v for k, v in settled.items() if v != 0},
+                entry_count=settled_count,
+                total_balance=sum(settled.values()),
+                snapshot_id=snapshot_id,
+            )
+            snapshot_id = written.get("id")
+            checkpoint = horizon
+        elif mismatched:
+            logger.warning(
+                "Ledger %s: %d account(s) disagree with their entries", mc_group_id, len(mismatched)
+            )
+
         return {
-            "is_zero_sum": total_balance == 0,
+            "is_zero_sum": is_zero_sum,
             "total_balance": total_balance,
-            "account_count": len(accounts),
+            "account_count": account_count,
+            "entry_count": entry_count,
+            "is_reconciled": not mismatched,
+            "mismatched_accounts": mismatched,
+            "snapshot_id": snapshot_id,
+            "checkpoint": checkpoint or None,
         }
 
+    async def _settled_horizon(self, mc_group_id: str) -> str:
+        # Batches that are still committing can land with a created_at just behind the newest
+        # entries, so only entries older than the settle window go into a checkpoint. The
+        # horizon is also capped at the newest stored created_at, which comes from PocketBase's
+        # clock: a fast local clock must never put a checkpoint ahead of entries not yet written.
+        horizon = _pb_timestamp(self.clock() - timedelta(seconds=self.snapshot_settle_seconds))
+        result = await self.pb.list_records(
+            "mc_entries",
+            per_page=1,
+            filter=_entries_filter("", mc_group_id=mc_group_id),
+            sort="-created_at",
+        )
+        items = result.get("items", [])
+        newest = str(items[0].get("created_at") or "") if items else ""
+        return min(horizon, newest)
+
+    async def _account_reconciles(
+        self, account_id: str, base: int, since: str, attempts: int = 3
+    ) -> bool:
+        for n in range(attempts):
+            if n:
+                await asyncio.sleep(self.retry_base_delay)
+            total = base
+            async for entry in self.pb.iter_records(
+                "mc_entries", filter=_entries_filter(since, account_id=account_id)
+            ):
+                total += int(entry.get("amount", 0))
+            account = await self.pb.get_first("mc_accounts", f'id="{account_id}"')
+            if int((account or {}).get("balance", 0)) == total:
+                return True
+        return False
+
     async def get_transaction_history(
         self, mc_group_id: str, member_record_id: str, limit: int = 20
     ) -> list[dict]:
+        page = await self.transaction_history_page(mc_group_id, member_record_id, limit=limit)
+        return page["items"]
+
+    async def transaction_history_page(
+        self,
+        mc_group_id: str,
+        member_record_id: str,
+        limit: int = 20,
+        cursor: str | None = None,
+        expand: str | None = None,
+    ) -> dict:
+        """Newest-first transactions for a member, `limit` at a time.
+
+        Pages by keyset on (created_at, id) rather than page number, so a cursor stays valid
+        while new payments arrive. `next_cursor` is None on the last page.
+        """
         filter_str = (
             f'mc_group_id="{mc_group_id}" && (payer_id="{member_record_id}" || payee_id="{member_record_id}")'
         )
+        if cursor:
+            created_at, tx_id = _decode_cursor(cursor)
+            filter_str += (
+                f' && (created_at<"{created_at}" || (created_at="{created_at}" && id<"{tx_id}"))'
+            )
+        # One extra row tells us whether another page exists without asking for a total.
         result = await self.pb.list_records(
-            "mc_transactions", filter=filter_str, per_page=limit, sort="-created"
+            "mc_transactions",
+            filter=filter_str,
+            per_page=limit + 1,
+            sort="-created_at,-id",
+            expand=expand,
+            skip_total=True,
         )
-        return result.get("items", [])
+        items = result.get("items", [])
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = _encode_cursor(str(items[-1].get("created_at") or ""), items[-1]["id"])
+        return {"items": items, "next_cursor": next_cursor}
 
     async def update_credit_limit(self, mc_group_id: str, member_record_id: str, new_limit: int) -> dict:
-        account = await self.get_or_create_account(mc_group_id, member_record_id)
-        return await self.pb.mc_account_update(account.get("id"), int(account.get("balance", 0)), new_limit)
+        async with self.locks.hold((mc_group_id, member_record_id)):
+
+            async def _attempt() -> dict:
+                account = await self.get_or_create_account(mc_group_id, member_record_id)
+                return await self.pb.mc_account_set_limit(
+                    account.get("id"), new_limit, expected_version=_version(account)
+                )
+
+            return await self._retry_on_conflict(_attempt)
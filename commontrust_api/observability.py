@@ -0,0 +1,162 @@
+"""Prometheus metrics and health probes for the API (served outside the API token gate)."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, Response
+
+from commontrust_api.auth import require_metrics_token
+from commontrust_api.config import api_settings
+from commontrust_api.hub.transport import hub_transport
+from commontrust_api.ledger.directory import group_directory
+from commontrust_api.ledger.idempotency import payment_idempotency
+from commontrust_api.ledger.service import ledger_metrics
+from commontrust_common.metrics import CONTENT_TYPE, pool_stats, registry
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = registry.histogram(
+    "api_request_seconds",
+    "Time to response headers by method and route template",
+    ["method", "route"],
+)
+RESPONSES = registry.counter(
+    "api_responses_total", "Responses by method, route template and status code",
+    ["method", "route", "status"],
+)
+IN_FLIGHT = registry.gauge("api_requests_in_flight", "Requests currently being handled")
+
+CACHE_HITS = registry.counter("api_cache_hits_total", "Per-worker cache hits", ["cache"])
+CACHE_MISSES = registry.counter("api_cache_misses_total", "Per-worker cache misses", ["cache"])
+CACHE_ENTRIES = registry.gauge("api_cache_entries", "Entries held per cache", ["cache"])
+POOL_CONNECTIONS = registry.gauge(
+    "api_http_pool_connections",
+    "Pooled HTTP connections by upstream (pocketbase or a hub remote) and state",
+    ["upstream", "state"],
+)
+HUB_REQUESTS = registry.counter(
+    "hub_remote_requests_total", "Requests proxied to each remote ledger", ["remote"]
+)
+HUB_ERRORS = registry.counter(
+    "hub_remote_errors_total", "Failed requests to each remote ledger", ["remote"]
+)
+HUB_REJECTED = registry.counter(
+    "hub_remote_rejected_total", "Requests failed fast because the remote's circuit was open",
+    ["remote"],
+)
+HUB_LATENCY = registry.counter(
+    "hub_remote_latency_seconds_total", "Summed time to response headers per remote ledger",
+    ["remote"],
+)
+HUB_CIRCUIT_OPEN = registry.gauge(
+    "hub_remote_circuit_open", "1 while the remote's circuit breaker is not closed", ["remote"]
+)
+LEDGER_CAS = registry.counter(
+    "ledger_account_cas_events_total",
+    "Compare-and-swap conflicts, retries and exhausted retries on ledger account writes",
+    ["outcome"],
+)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template, not its raw path."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                # Proxied bodies are streamed; the latency we own ends at the headers.
+                route = _route_of(scope)
+                REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, method=scope["method"], route=route
+                )
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.inc(-1)
+            RESPONSES.inc(method=scope["method"], route=_route_of(scope), status=status)
+
+
+def _route_of(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _collect(pb: Any) -> None:
+    """Copy stats the API keeps elsewhere into the registry, right before a scrape."""
+    caches = {
+        "members": pb.member_cache.stats(),
+        "group_directory": group_directory.stats(),
+        "payment_idempotency": payment_idempotency.stats(),
+    }
+    hub = hub_transport.stats()
+    caches["hub_remotes"] = hub["remote_cache"]
+    for name, stats in caches.items():
+        CACHE_HITS.set(stats["hits"], cache=name)
+        CACHE_MISSES.set(stats["misses"], cache=name)
+        CACHE_ENTRIES.set(stats["size"], cache=name)
+
+    # The PocketBase client is created on first use; until then its pool is empty.
+    upstreams = {"pocketbase": getattr(pb, "_client", None), **hub_transport.clients()}
+    for upstream, client in upstreams.items():
+        for state, count in pool_stats(client).items():
+            POOL_CONNECTIONS.set(count, upstream=upstream, state=state)
+
+    for remote, stats in hub["remotes"].items():
+        HUB_REQUESTS.set(stats["requests"], remote=remote)
+        HUB_ERRORS.set(stats["errors"], remote=remote)
+        HUB_REJECTED.set(stats["rejected"], remote=remote)
+        HUB_LATENCY.set(stats["latency_ms_total"] / 1000, remote=remote)
+        HUB_CIRCUIT_OPEN.set(0 if stats["state"] == "closed" else 1, remote=remote)
+
+    for outcome, count in ledger_metrics.snapshot().items():
+        LEDGER_CAS.set(count, outcome=outcome)
+
+
+router = APIRouter(include_in_schema=False)
+
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def metrics(req: Request) -> Response:
+    _collect(req.app.state.pb)
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/healthz")
+async def healthz() -> dict[str, str]:
+    # Liveness: the worker is serving requests. Dependencies are readyz's job.
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz(req: Request) -> Response:
+    """Ready when PocketBase answers an authenticated request within the probe timeout."""
+    pb = req.app.state.pb
+    try:
+        await asyncio.wait_for(pb.ping(), timeout=api_settings.readiness_timeout_seconds)
+    except Exception as e:
+        # Probes are unauthenticated: log the detail, answer with the error type only.
+        logger.warning("Readiness check failed: %r", e)
+        return JSONResponse(
+            {"status": "unavailable", "pocketbase": type(e).__name__}, status_code=503
+        )
+    return JSONResponse({"status": "ok", "pocketbase": "ok"})
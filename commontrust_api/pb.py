@@ -11,4 +11,7 @@ def make_pb_client() -> PocketBaseClient:
         admin_token=api_settings.pocketbase_admin_token,
         admin_email=api_settings.pocketbase_admin_email,
         admin_password=api_settings.pocketbase_admin_password,
+        member_cache_size=api_settings.member_cache_size,
+        member_cache_ttl_seconds=api_settings.member_cache_ttl_seconds,
+        slow_query_seconds=api_settings.pocketbase_slow_query_seconds,
     )
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 import logging
+import secrets
+import string
+import time
+from collections.abc import AsyncIterator
 from datetime import datetime
 from typing import Any
 
 import httpx
 
+from commontrust_api.cache import TTLCache
+from commontrust_common.pocketbase_metrics import observe_request
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +20,41 @@ class PocketBaseError(Exception):
     pass
 
 
+class PocketBaseConflictError(PocketBaseError):
+    """A compare-and-swap write lost the race (see pb_hooks/mc_accounts_version.pb.js)."""
+
+
+class PocketBaseDuplicateError(PocketBaseError):
+    """A write hit a unique index (PocketBase "validation_not_unique")."""
+
+
+_RECORD_ID_ALPHABET = string.ascii_lowercase + string.digits
+
+# Unique (mc_group_id, idempotency_key) index on mc_transactions; see pb_schema.json.
+IDEMPOTENCY_INDEX = "idx_mc_transactions_idempotency"
+
+# Keeps `id="..." || ...` member lookups well under common URL length limits.
+_MEMBERS_PER_QUERY = 50
+
+
+def new_record_id() -> str:
+    # PocketBase record ids are 15 chars of [a-z0-9]. Generating them client-side lets a batch
+    # reference a record created earlier in the same batch.
+    return "".join(secrets.choice(_RECORD_ID_ALPHABET) for _ in range(15))
+
+
+def _batch_create(collection: str, body: dict[str, Any]) -> dict[str, Any]:
+    return {"method": "POST", "url": f"/api/collections/{collection}/records", "body": body}
+
+
+def _batch_update(collection: str, record_id: str, body: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "method": "PATCH",
+        "url": f"/api/collections/{collection}/records/{record_id}",
+        "body": body,
+    }
+
+
 class PocketBaseClient:
     def __init__(
         self,
@@ -21,6 +62,9 @@ class PocketBaseClient:
         admin_token: str | None = None,
         admin_email: str | None = None,
         admin_password: str | None = None,
+        member_cache_size: int = 0,
+        member_cache_ttl_seconds: float = 0.0,
+        slow_query_seconds: float = 0.0,
     ):
         self.base_url = base_url
         self.admin_token = admin_token
@@ -28,6 +72,12 @@ class PocketBaseClient:
         self.admin_password = admin_password
         self.token: str | None = None
         self._client: httpx.AsyncClient | None = None
+        # Member records keyed by ("id", record_id) and ("tg", telegram_id); disabled unless sized.
+        self.member_cache: TTLCache[dict[str, Any]] = TTLCache(
+            member_cache_size, member_cache_ttl_seconds
+        )
+        self.slow_query_seconds = slow_query_seconds
+        self._idempotency_indexed: bool | None = None
 
     @property
     def client(self) -> httpx.AsyncClient:
@@ -66,22 +116,50 @@ class PocketBaseClient:
             raise PocketBaseError("Not authenticated")
         return {"Authorization": self.token}
 
+    @staticmethod
+    def _collection_of(path: str) -> str | None:
+        # "/api/collections/{collection}/records..." -> collection
+        parts = path.split("/")
+        if len(parts) > 3 and parts[1] == "api" and parts[2] == "collections":
+            return parts[3]
+        return None
+
+    async def _send(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """One HTTP round-trip, timed into the request metrics."""
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(method, f"{self.base_url}{path}", **kwargs)
+            return response
+        finally:
+            params = kwargs.get("params") or {}
+            observe_request(
+                method, self._collection_of(path) or path, params.get("filter"), response,
+                time.perf_counter() - started, self.slow_query_seconds,
+            )
+
     async def _request(
         self, method: str, path: str, data: dict[str, Any] | None = None
     ) -> dict[str, Any]:
-        url = f"{self.base_url}{path}"
         headers = self._headers()
         if method == "GET":
-            response = await self.client.get(url, headers=headers, params=data)
+            response = await self._send("GET", path, headers=headers, params=data)
         elif method == "POST":
-            response = await self.client.post(url, headers=headers, json=data)
+            response = await self._send("POST", path, headers=headers, json=data)
         elif method == "PATCH":
-            response = await self.client.patch(url, headers=headers, json=data)
+            response = await self._send("PATCH", path, headers=headers, json=data)
         elif method == "DELETE":
-            response = await self.client.delete(url, headers=headers)
+            response = await self._send("DELETE", path, headers=headers)
         else:
             raise PocketBaseError(f"Unsupported method: {method}")
 
+        if response.status_code == 409 or (
+            response.status_code >= 400 and "version_conflict" in response.text
+        ):
+            # Batch requests wrap the hook's 409 in a 400; both mean "re-read and retry".
+            raise PocketBaseConflictError(f"Version conflict: {response.text}")
+        if response.status_code == 400 and "validation_not_unique" in response.text:
+            raise PocketBaseDuplicateError(f"Duplicate record: {response.text}")
         if response.status_code >= 400:
             logger.error("PocketBase error %s: %s", response.status_code, response.text)
             raise PocketBaseError(f"Request failed: {response.status_code} - {response.text}")
@@ -89,6 +167,14 @@ class PocketBaseClient:
             return {}
         return response.json()
 
+    async def ping(self) -> None:
+        """One authenticated read; raises if PocketBase is unreachable or rejects the token."""
+        await self._request(
+            "GET",
+            "/api/collections/members/records",
+            {"perPage": 1, "skipTotal": 1, "fields": "id"},
+        )
+
     async def list_records(
         self,
         collection: str,
@@ -96,34 +182,118 @@ class PocketBaseClient:
         per_page: int = 50,
         filter: str | None = None,
         sort: str | None = None,
+        expand: str | None = None,
+        skip_total: bool = False,
     ) -> dict[str, Any]:
         params: dict[str, Any] = {"page": page, "perPage": per_page}
         if filter:
             params["filter"] = filter
         if sort:
             params["sort"] = sort
+        if expand:
+            params["expand"] = expand
+        if skip_total:
+            # Skips PocketBase's COUNT(*) for callers that don't need totalItems/totalPages.
+            params["skipTotal"] = 1
         return await self._request("GET", f"/api/collections/{collection}/records", params)
 
     async def get_record(self, collection: str, record_id: str) -> dict[str, Any]:
-        return await self._request("GET", f"/api/collections/{collection}/records/{record_id}")
+        if collection == "members":
+            cached = self._cached_member(("id", record_id))
+            if cached is not None:
+                return cached
+        record = await self._request("GET", f"/api/collections/{collection}/records/{record_id}")
+        if collection == "members":
+            self._remember_member(record)
+        return record
 
     async def create_record(self, collection: str, data: dict[str, Any]) -> dict[str, Any]:
-        return await self._request("POST", f"/api/collections/{collection}/records", data)
+        record = await self._request("POST", f"/api/collections/{collection}/records", data)
+        if collection == "members":
+            self._remember_member(record)
+        return record
 
     async def update_record(self, collection: str, record_id: str, data: dict[str, Any]) -> dict[str, Any]:
-        return await self._request("PATCH", f"/api/collections/{collection}/records/{record_id}", data)
+        if collection == "members":
+            self._forget_member(record_id)
+        record = await self._request(
+            "PATCH", f"/api/collections/{collection}/records/{record_id}", data
+        )
+        if collection == "members":
+            self._remember_member(record)
+        return record
 
     async def delete_record(self, collection: str, record_id: str) -> None:
+        if collection == "members":
+            self._forget_member(record_id)
         await self._request("DELETE", f"/api/collections/{collection}/records/{record_id}")
 
+    def _cached_member(self, key: tuple[str, Any]) -> dict[str, Any] | None:
+        record = self.member_cache.get(key)
+        return dict(record) if record is not None else None
+
+    def _remember_member(self, record: dict[str, Any] | None) -> None:
+        if not isinstance(record, dict) or not record.get("id"):
+            return
+        snapshot = dict(record)
+        self.member_cache.set(("id", record["id"]), snapshot)
+        telegram_id = record.get("telegram_id")
+        if isinstance(telegram_id, (int, float)):
+            self.member_cache.set(("tg", int(telegram_id)), snapshot)
+
+    def _forget_member(self, record_id: str) -> None:
+        record = self.member_cache.pop(("id", record_id))
+        if record is not None and isinstance(record.get("telegram_id"), (int, float)):
+            self.member_cache.pop(("tg", int(record["telegram_id"])))
+
+    def member_cache_stats(self) -> dict[str, int]:
+        return self.member_cache.stats()
+
+    async def batch(self, requests: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Run several record writes as one transaction via PocketBase's /api/batch.
+
+        Each request is {"method": "POST" | "PATCH" | "DELETE", "url": "/api/collections/...",
+        "body": {...}}. Returns the response bodies in order; if any write fails PocketBase rolls
+        back the whole batch and this raises PocketBaseError.
+        """
+        responses: Any = await self._request("POST", "/api/batch", {"requests": requests})
+        return [item.get("body") or {} for item in responses]
+
     async def get_first(self, collection: str, filter: str) -> dict[str, Any] | None:
         result = await self.list_records(collection, page=1, per_page=1, filter=filter)
         items = result.get("items", [])
         return items[0] if items else None
 
+    async def iter_records(
+        self, collection: str, filter: str | None = None, per_page: int = 500
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Yield every record matching `filter`, holding only one page in memory.
+
+        Pages by keyset on `id` instead of page number: deep pages cost the same as the first,
+        and records created mid-scan can't shift rows across page boundaries.
+        """
+        last_id = ""
+        while True:
+            clauses = [f"({filter})"] if filter else []
+            if last_id:
+                clauses.append(f'id>"{last_id}"')
+            params: dict[str, Any] = {"page": 1, "perPage": per_page, "sort": "id", "skipTotal": 1}
+            if clauses:
+                params["filter"] = " && ".join(clauses)
+            result = await self._request("GET", f"/api/collections/{collection}/records", params)
+            items = result.get("items", [])
+            for item in items:
+                yield item
+            if len(items) < per_page:
+                return
+            last_id = items[-1]["id"]
+
     async def member_get_or_create(self, telegram_id: int, username: str | None = None, display_name: str | None = None) -> dict[str, Any]:
         username_norm = username.strip().lstrip("@").lower() if username and username.strip() else None
-        existing = await self.get_first("members", f"telegram_id={telegram_id}")
+        existing = self._cached_member(("tg", telegram_id))
+        if existing is None:
+            existing = await self.get_first("members", f"telegram_id={telegram_id}")
+            self._remember_member(existing)
         if existing:
             update_data = {}
             if username_norm and username_norm != (existing.get("username") or ""):
@@ -147,7 +317,36 @@ class PocketBaseClient:
         username_norm = username.strip().lstrip("@").lower()
         if not username_norm:
             return None
-        return await self.get_first("members", f'username="{username_norm}"')
+        record = await self.get_first("members", f'username="{username_norm}"')
+        self._remember_member(record)
+        return record
+
+    async def members_get_many(self, member_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """Fetch members by record id, answering from the member cache where possible.
+
+        Misses are fetched with one `id="a" || id="b"` list query per chunk instead of one GET per
+        member.
+        """
+        found: dict[str, dict[str, Any]] = {}
+        missing: list[str] = []
+        for member_id in dict.fromkeys(member_ids):
+            cached = self._cached_member(("id", member_id))
+            if cached is not None:
+                found[member_id] = cached
+            else:
+                missing.append(member_id)
+        for start in range(0, len(missing), _MEMBERS_PER_QUERY):
+            chunk = missing[start : start + _MEMBERS_PER_QUERY]
+            result = await self.list_records(
+                "members",
+                per_page=len(chunk),
+                filter=" || ".join(f'id="{member_id}"' for member_id in chunk),
+                skip_total=True,
+            )
+            for record in result.get("items", []):
+                self._remember_member(record)
+                found[record["id"]] = record
+        return found
 
     async def group_get_or_create(self, telegram_id: int, title: str, mc_enabled: bool = False) -> dict[str, Any]:
         existing = await self.get_first("groups", f"telegram_id={telegram_id}")
@@ -160,19 +359,47 @@ class PocketBaseClient:
     async def group_get(self, telegram_id: int) -> dict[str, Any] | None:
         return await self.get_first("groups", f"telegram_id={telegram_id}")
 
-    async def reviews_for_member(self, member_id: str) -> list[dict[str, Any]]:
-        result = await self.list_records("reviews", filter=f'reviewee_id="{member_id}"')
-        return result.get("items", [])
-
-    async def reputation_update(self, member_id: str, verified_deals: int, avg_rating: float) -> dict[str, Any]:
-        existing = await self.get_first("reputation", f'member_id="{member_id}"')
-        if existing:
-            return await self.update_record(
-                "reputation", existing["id"], {"verified_deals": verified_deals, "avg_rating": avg_rating}
+    async def reviews_for_member(self, member_id: str, per_page: int = 200) -> list[dict[str, Any]]:
+        # Page through everything; busy members easily exceed a single page of reviews.
+        items: list[dict[str, Any]] = []
+        page = 1
+        while True:
+            result = await self.list_records(
+                "reviews", page=page, per_page=per_page, filter=f'reviewee_id="{member_id}"'
             )
-        return await self.create_record(
-            "reputation", {"member_id": member_id, "verified_deals": verified_deals, "avg_rating": avg_rating}
-        )
+            batch = result.get("items", [])
+            items.extend(batch)
+            if len(batch) < per_page:
+                return items
+            page += 1
+
+    async def reputation_get(self, member_id: str) -> dict[str, Any] | None:
+        return await self.get_first("reputation", f'member_id="{member_id}"')
+
+    async def reputation_update(
+        self,
+        member_id: str,
+        verified_deals: int,
+        avg_rating: float,
+        total_reviews: int | None = None,
+        reviewer_stats: dict[str, dict[str, int]] | None = None,
+        verified_deal_ids: list[str] | None = None,
+        record_id: str | None = None,
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = {"verified_deals": verified_deals, "avg_rating": avg_rating}
+        if total_reviews is not None:
+            data["total_reviews"] = total_reviews
+        if reviewer_stats is not None:
+            data["reviewer_stats"] = reviewer_stats
+        if verified_deal_ids is not None:
+            data["verified_deal_ids"] = verified_deal_ids
+
+        if record_id is None:
+            existing = await self.reputation_get(member_id)
+            record_id = existing["id"] if existing else None
+        if record_id:
+            return await self.update_record("reputation", record_id, data)
+        return await self.create_record("reputation", {"member_id": member_id, **data})
 
     async def mc_group_get(self, group_id: str) -> dict[str, Any] | None:
         return await self.get_first("mc_groups", f'group_id="{group_id}"')
@@ -190,17 +417,74 @@ class PocketBaseClient:
     async def mc_account_get(self, mc_group_id: str, member_id: str) -> dict[str, Any] | None:
         return await self.get_first("mc_accounts", f'mc_group_id="{mc_group_id}" && member_id="{member_id}"')
 
-    async def mc_account_create(self, mc_group_id: str, member_id: str, credit_limit: int = 0) -> dict[str, Any]:
-        return await self.create_record(
-            "mc_accounts", {"mc_group_id": mc_group_id, "member_id": member_id, "balance": 0, "credit_limit": credit_limit}
-        )
-
-    async def mc_account_update(self, account_id: str, balance: int, credit_limit: int | None = None) -> dict[str, Any]:
+    async def mc_account_create(
+        self,
+        mc_group_id: str,
+        member_id: str,
+        credit_limit: int = 0,
+        limit_refreshed_at: str | None = None,
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "mc_group_id": mc_group_id,
+            "member_id": member_id,
+            "balance": 0,
+            "credit_limit": credit_limit,
+            "version": 0,
+        }
+        if limit_refreshed_at is not None:
+            data["limit_refreshed_at"] = limit_refreshed_at
+        return await self.create_record("mc_accounts", data)
+
+    async def mc_account_update(
+        self,
+        account_id: str,
+        balance: int,
+        credit_limit: int | None = None,
+        expected_version: int | None = None,
+        limit_refreshed_at: str | None = None,
+    ) -> dict[str, Any]:
+        # With expected_version set this is a compare-and-swap: PocketBaseConflictError if the
+        # account changed since it was read.
         data: dict[str, Any] = {"balance": balance}
         if credit_limit is not None:
             data["credit_limit"] = credit_limit
+        if limit_refreshed_at is not None:
+            data["limit_refreshed_at"] = limit_refreshed_at
+        if expected_version is not None:
+            data["version"] = expected_version + 1
+        return await self.update_record("mc_accounts", account_id, data)
+
+    async def mc_account_set_limit(
+        self,
+        account_id: str,
+        credit_limit: int,
+        expected_version: int | None = None,
+        limit_refreshed_at: str | None = None,
+    ) -> dict[str, Any]:
+        # Limit-only write: never sends `balance`, so it can't overwrite a concurrent payment's.
+        data: dict[str, Any] = {"credit_limit": credit_limit}
+        if limit_refreshed_at is not None:
+            data["limit_refreshed_at"] = limit_refreshed_at
+        if expected_version is not None:
+            data["version"] = expected_version + 1
         return await self.update_record("mc_accounts", account_id, data)
 
+    async def mc_idempotency_indexed(self) -> bool:
+        """Whether mc_transactions has the unique idempotency-key index that rejects replays.
+
+        Checked once per client. Without it, keyed payments look their key up before posting.
+        """
+        if self._idempotency_indexed is None:
+            collection = await self._request("GET", "/api/collections/mc_transactions")
+            indexes = collection.get("indexes") or []
+            self._idempotency_indexed = any(IDEMPOTENCY_INDEX in sql for sql in indexes)
+            if not self._idempotency_indexed:
+                logger.warning(
+                    "mc_transactions has no %s index; run scripts/pb_setup_db.py to create it",
+                    IDEMPOTENCY_INDEX,
+                )
+        return self._idempotency_indexed
+
     async def mc_transaction_get_by_idempotency(self, mc_group_id: str, idempotency_key: str) -> dict[str, Any] | None:
         if not idempotency_key:
             return None
@@ -235,6 +519,98 @@ class PocketBaseClient:
             {"transaction_id": transaction_id, "account_id": account_id, "amount": amount, "balance_after": balance_after},
         )
 
+    async def mc_payment_create(
+        self,
+        mc_group_id: str,
+        payer_id: str,
+        payee_id: str,
+        payer_account_id: str,
+        payee_account_id: str,
+        amount: int,
+        new_payer_balance: int,
+        new_payee_balance: int,
+        description: str | None = None,
+        idempotency_key: str | None = None,
+        payer_version: int | None = None,
+        payee_version: int | None = None,
+    ) -> dict[str, Any]:
+        # Transaction, both entries and both balances go out as a single batch, so a payment is
+        # either fully posted or not at all. The transaction id is generated up front so the
+        # entries can reference it within the same batch. Account versions, when given, make the
+        # balance updates compare-and-swap (PocketBaseConflictError rolls back the whole batch).
+        payer_update: dict[str, Any] = {"balance": new_payer_balance}
+        if payer_version is not None:
+            payer_update["version"] = payer_version + 1
+        payee_update: dict[str, Any] = {"balance": new_payee_balance}
+        if payee_version is not None:
+            payee_update["version"] = payee_version + 1
+        transaction_id = new_record_id()
+        transaction, payer_entry, payee_entry, _, _ = await self.batch(
+            [
+                _batch_create(
+                    "mc_transactions",
+                    {
+                        "id": transaction_id,
+                        "mc_group_id": mc_group_id,
+                        "payer_id": payer_id,
+                        "payee_id": payee_id,
+                        "amount": amount,
+                        "description": description,
+                        "idempotency_key": idempotency_key,
+                    },
+                ),
+                _batch_create(
+                    "mc_entries",
+                    {
+                        "transaction_id": transaction_id,
+                        "account_id": payer_account_id,
+                        "amount": -amount,
+                        "balance_after": new_payer_balance,
+                    },
+                ),
+                _batch_create(
+                    "mc_entries",
+                    {
+                        "transaction_id": transaction_id,
+                        "account_id": payee_account_id,
+                        "amount": amount,
+                        "balance_after": new_payee_balance,
+                    },
+                ),
+                _batch_update("mc_accounts", payer_account_id, payer_update),
+                _batch_update("mc_accounts", payee_account_id, payee_update),
+            ]
+        )
+        return {"transaction": transaction, "payer_entry": payer_entry, "payee_entry": payee_entry}
+
+    async def mc_snapshot_latest(self, mc_group_id: str) -> dict[str, Any] | None:
+        result = await self.list_records(
+            "mc_snapshots", per_page=1, filter=f'mc_group_id="{mc_group_id}"', sort="-created_at"
+        )
+        items = result.get("items", [])
+        return items[0] if items else None
+
+    async def mc_snapshot_save(
+        self,
+        mc_group_id: str,
+        checkpoint: str,
+        account_sums: dict[str, int],
+        entry_count: int,
+        total_balance: int,
+        snapshot_id: str | None = None,
+    ) -> dict[str, Any]:
+        """Write the group's checkpoint, overwriting `snapshot_id` so each group keeps one row."""
+        data = {
+            "mc_group_id": mc_group_id,
+            "checkpoint": checkpoint,
+            "account_sums": account_sums,
+            "entry_count": entry_count,
+            "total_balance": total_balance,
+        }
+        if snapshot_id:
+            return await self.update_record("mc_snapshots", snapshot_id, data)
+        return await self.create_record("mc_snapshots", data)
+
     async def ledger_remote_get(self, telegram_chat_id: int) -> dict[str, Any] | None:
         return await self.get_first("ledger_remotes", f"telegram_chat_id={telegram_chat_id}")
 
@@ -1,38 +1,127 @@
 from __future__ import annotations
 
+import asyncio
 from collections.abc import Iterable
+from urllib.parse import quote
 
 from commontrust_api.config import api_settings
 
 
-def _aggregate_ratings_by_reviewer(reviews: Iterable[dict]) -> dict[str, float]:
+def _reviewer_stats(reviews: Iterable[dict]) -> dict[str, dict[str, int]]:
     # Prevent review farming: multiple reviews from the same reviewer count as one "vote".
-    buckets: dict[str, list[int]] = {}
+    stats: dict[str, dict[str, int]] = {}
     for r in reviews:
         reviewer_id = r.get("reviewer_id")
         rating = r.get("rating")
         if not isinstance(reviewer_id, str) or not isinstance(rating, int):
             continue
-        buckets.setdefault(reviewer_id, []).append(rating)
-
-    out: dict[str, float] = {}
-    for reviewer_id, rs in buckets.items():
-        if not rs:
-            continue
-        out[reviewer_id] = sum(rs) / len(rs)
-    return out
-
-
-async def _deal_is_fully_reviewed(pb: object, deal_id: str) -> bool:
-    # Only expose reviews once both parties have reviewed.
-    try:
-        result = await pb.list_records("reviews", filter=f'deal_id="{deal_id}"', per_page=200)
-    except TypeError:
-        result = await pb.list_records("reviews", filter=f'deal_id="{deal_id}"')
-
-    items = result.get("items", []) if isinstance(result, dict) else []
-    reviewer_ids = {r.get("reviewer_id") for r in items if r.get("reviewer_id")}
-    return len(reviewer_ids) >= 2
+        entry = stats.setdefault(reviewer_id, {"sum": 0, "count": 0})
+        entry["sum"] += rating
+        entry["count"] += 1
+    return stats
+
+
+def _summarize(aggregate: dict) -> dict[str, object]:
+    by_reviewer = [
+        s["sum"] / s["count"] for s in aggregate["reviewer_stats"].values() if s.get("count", 0) > 0
+    ]
+    if not by_reviewer:
+        return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
+    return {
+        "verified_deals": len(aggregate["verified_deal_ids"]),
+        "avg_rating": sum(by_reviewer) / len(by_reviewer),
+        "total_reviews": len(by_reviewer),
+    }
+
+
+def _public_stats(aggregate: dict) -> dict[str, object]:
+    summary = _summarize(aggregate)
+    return {**summary, "avg_rating": round(float(summary["avg_rating"]), 2)}
+
+
+def _stored_aggregate(record: dict | None) -> dict | None:
+    # The bot keeps this aggregate current as reviews are written; records that predate it
+    # only carry the summary numbers and are rebuilt on first read.
+    if not isinstance(record, dict):
+        return None
+    reviewer_stats = record.get("reviewer_stats")
+    deal_ids = record.get("verified_deal_ids")
+    if not isinstance(reviewer_stats, dict) or not isinstance(deal_ids, list):
+        return None
+    return {
+        "reviewer_stats": {
+            k: {"sum": int(v.get("sum", 0)), "count": int(v.get("count", 0))}
+            for k, v in reviewer_stats.items()
+            if isinstance(v, dict)
+        },
+        "verified_deal_ids": sorted({d for d in deal_ids if isinstance(d, str)}),
+    }
+
+
+# PocketBase filters travel in the query string; keep each OR-chain comfortably below common
+# proxy/server URL limits (measured after URL encoding).
+_MAX_FILTER_URL_LENGTH = 3000
+_REVIEWS_PAGE_SIZE = 500
+
+
+def _relation_id(value: object) -> str | None:
+    if isinstance(value, str) and value:
+        return value
+    if isinstance(value, list) and value:
+        first = value[0]
+        if isinstance(first, str) and first:
+            return first
+    return None
+
+
+def _chunked_or_filters(
+    field: str, values: Iterable[str], max_length: int = _MAX_FILTER_URL_LENGTH
+) -> list[str]:
+    # Build `field="a" || field="b" ...` filters, splitting into as few chunks as fit the limit.
+    separator_cost = len(quote(" || "))
+    filters: list[str] = []
+    terms: list[str] = []
+    length = 0
+    for value in sorted(set(values)):
+        term = f'{field}="{value}"'
+        cost = len(quote(term)) + separator_cost
+        if terms and length + cost > max_length:
+            filters.append(" || ".join(terms))
+            terms, length = [], 0
+        terms.append(term)
+        length += cost
+    if terms:
+        filters.append(" || ".join(terms))
+    return filters
+
+
+async def _fully_reviewed_deal_ids(pb: object, deal_ids: Iterable[str]) -> set[str]:
+    # Only expose reviews once both parties have reviewed. For 2-party deals,
+    # this means at least 2 distinct reviewers exist for that deal.
+    # Resolved for all deals at once: one paged query per filter chunk, chunks in parallel.
+    reviewers: dict[str, set[str]] = {}
+
+    async def _scan(filter_str: str) -> None:
+        page = 1
+        while True:
+            result = await pb.list_records(
+                "reviews", page=page, per_page=_REVIEWS_PAGE_SIZE, filter=filter_str
+            )
+            items = result.get("items", []) if isinstance(result, dict) else []
+            for r in items:
+                deal_id = _relation_id(r.get("deal_id"))
+                reviewer_id = _relation_id(r.get("reviewer_id"))
+                if deal_id and reviewer_id:
+                    reviewers.setdefault(deal_id, set()).add(reviewer_id)
+            total_pages = result.get("totalPages") if isinstance(result, dict) else None
+            if len(items) < _REVIEWS_PAGE_SIZE:
+                return
+            if isinstance(total_pages, int) and page >= total_pages:
+                return
+            page += 1
+
+    await asyncio.gather(*(_scan(f) for f in _chunked_or_filters("deal_id", deal_ids)))
+    return {deal_id for deal_id, ids in reviewers.items() if len(ids) >= 2}
 
 
 def _visible_reviews(pb: object, reviews: Iterable[dict], fully_reviewed_deal_ids: set[str]) -> list[dict]:
@@ -54,36 +143,28 @@ class ReputationService:
 
     async def calculate_reputation(self, member_id: str) -> dict[str, object]:
         reviews = await self.pb.reviews_for_member(member_id)
-        if not reviews:
-            await self.pb.reputation_update(member_id, 0, 0.0)
-            return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
 
         deal_ids = {r.get("deal_id") for r in reviews if isinstance(r.get("deal_id"), str)}
-        fully_reviewed: set[str] = set()
-        for deal_id in deal_ids:
-            if await _deal_is_fully_reviewed(self.pb, deal_id):
-                fully_reviewed.add(deal_id)
+        fully_reviewed = await _fully_reviewed_deal_ids(self.pb, deal_ids) if deal_ids else set()
 
         visible = _visible_reviews(self.pb, reviews, fully_reviewed)
-        if not visible:
-            await self.pb.reputation_update(member_id, 0, 0.0)
-            return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
-
-        by_reviewer = _aggregate_ratings_by_reviewer(visible)
-        if not by_reviewer:
-            await self.pb.reputation_update(member_id, 0, 0.0)
-            return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
-
-        avg_rating = sum(by_reviewer.values()) / len(by_reviewer)
-        verified_deals = len({r.get("deal_id") for r in visible if r.get("deal_id")})
-        await self.pb.reputation_update(member_id, verified_deals, avg_rating)
-
-        return {
-            "verified_deals": verified_deals,
-            "avg_rating": round(avg_rating, 2),
-            "total_reviews": len(by_reviewer),
+        aggregate = {
+            "reviewer_stats": _reviewer_stats(visible),
+            "verified_deal_ids": sorted({r["deal_id"] for r in visible}),
         }
+        summary = _summarize(aggregate)
+        await self.pb.reputation_update(
+            member_id,
+            int(summary["verified_deals"]),
+            float(summary["avg_rating"]),
+            total_reviews=int(summary["total_reviews"]),
+            reviewer_stats=aggregate["reviewer_stats"],
+            verified_deal_ids=aggregate["verified_deal_ids"],
+        )
+        return _public_stats(aggregate)
 
     async def get_reputation(self, member_id: str) -> dict[str, object]:
-        return await self.calculate_reputation(member_id)
-
+        aggregate = _stored_aggregate(await self.pb.reputation_get(member_id))
+        if aggregate is None:
+            return await self.calculate_reputation(member_id)
+        return _public_stats(aggregate)
@@ -29,6 +29,96 @@ class Settings(BaseSettings):
 
     credit_base_limit: int = Field(default=100, description="Base credit limit for new members")
     credit_per_deal: int = Field(default=50, description="Credit limit increase per verified deal")
+    reputation_verify_interval_seconds: int = Field(
+        default=3600,
+        description=(
+            "How often to rebuild reputation aggregates from scratch and repair drift (0 disables)"
+        ),
+    )
+
+    member_cache_size: int = Field(
+        default=10000, description="Max member records kept in the in-process cache (0 disables)"
+    )
+    member_cache_ttl_seconds: float = Field(
+        default=300.0,
+        description="Seconds a cached member record stays valid (0 disables the member cache)",
+    )
+
+    response_cache_size: int = Field(
+        default=1000,
+        description="Max GET responses kept for consistency='cached' reads (0 disables)",
+    )
+    response_cache_ttl_seconds: float = Field(
+        default=30.0,
+        description="Seconds a cached GET response is served without contacting PocketBase",
+    )
+
+    state_store_path: str = Field(
+        default="",
+        description="SQLite file for DM conversation state, shareable by bot processes on one "
+        "host (empty: in-memory, per process)",
+    )
+    state_ttl_seconds: float = Field(
+        default=604800.0, description="Seconds an abandoned DM flow (draft, pending reply) is kept"
+    )
+    state_max_entries: int = Field(
+        default=10000, description="Max DM conversation states kept before the oldest are dropped"
+    )
+
+    metrics_port: int = Field(
+        default=0, description="Port for a local Prometheus /metrics endpoint (0 disables)"
+    )
+    metrics_host: str = Field(
+        default="127.0.0.1", description="Address the /metrics endpoint binds"
+    )
+    pocketbase_slow_query_seconds: float = Field(
+        default=0.5, description="Log PocketBase requests slower than this (0 disables)"
+    )
+    slow_handler_seconds: float = Field(
+        default=1.0,
+        description="Log handlers slower than this with a backend call breakdown (0 disables)",
+    )
+
+    send_global_rate: float = Field(
+        default=30.0, description="Max messages sent per second across all chats (0 disables)"
+    )
+    send_chat_rate: float = Field(
+        default=1.0, description="Max messages per second to one private chat (0 disables)"
+    )
+    send_group_rate_per_minute: float = Field(
+        default=20.0, description="Max messages per minute to one group (0 disables)"
+    )
+    send_max_retries: int = Field(
+        default=3, description="Retries of a send Telegram answered with RetryAfter"
+    )
+
+    webhook_url: str = Field(
+        default="",
+        description="Public HTTPS base URL Telegram delivers updates to (empty: long polling)",
+    )
+    webhook_path: str = Field(
+        default="/telegram/webhook", description="Path of the webhook endpoint"
+    )
+    webhook_secret: str = Field(
+        default="",
+        description="Secret token Telegram sends with every webhook request (required)",
+    )
+    webhook_listen_host: str = Field(
+        default="0.0.0.0", description="Address the webhook server binds"
+    )
+    webhook_listen_port: int = Field(default=8080, description="Port the webhook server listens on")
+    update_workers: int = Field(
+        default=8, description="Webhook mode: updates handled at once (one at a time per chat)"
+    )
+    update_queue_size: int = Field(
+        default=1000,
+        description="Webhook mode: updates buffered before Telegram is asked to redeliver (503)",
+    )
+
+    ledger_lock_dir: str = Field(
+        default="",
+        description="Directory for cross-process ledger account file locks (empty: in-process)",
+    )
 
     commontrust_web_url: str = Field(
         default="",
@@ -49,6 +139,21 @@ class Settings(BaseSettings):
         description="Venice.ai model for report analysis (e.g. llama-3.3-70b, deepseek-ai-DeepSeek-R1)",
     )
 
+    ai_review_queue_path: str = Field(
+        default="",
+        description="SQLite file for queued AI report reviews (empty: in-memory; pending reports "
+        "are re-queued from PocketBase on startup either way)",
+    )
+    ai_review_concurrency: int = Field(
+        default=2, description="Max AI report analyses running at once"
+    )
+    ai_review_max_attempts: int = Field(
+        default=5, description="AI analysis attempts per report before admins get it without one"
+    )
+    ai_review_retry_base_seconds: float = Field(
+        default=30.0, description="Delay before the first AI analysis retry; doubles per attempt"
+    )
+
     @property
     def is_configured(self) -> bool:
         has_pb_auth = bool(
@@ -113,6 +113,8 @@ async def cmd_pay(message: Message) -> None:
             payee_member_id=payee_member.get("id"),
             amount=amount,
             description=description,
+            # Same message redelivered (e.g. after a timeout) must not pay twice.
+            idempotency_key=f"{message.chat.id}:{getattr(message, 'message_id', 0)}",
         )
 
         currency = mc_group.get("currency_symbol", "Cr")
@@ -4,6 +4,7 @@ from aiogram.types import Message
 
 from commontrust_bot.services.deal import deal_service
 from commontrust_bot.review_notify import maybe_dm_reviewee_with_respond_link
+from commontrust_bot.send_scheduler import send_notification
 from commontrust_bot.ui import review_kb
 
 router = Router()
@@ -142,11 +143,13 @@ async def cmd_complete(message: Message) -> None:
                     f"If you need it later, here is the review link:\n{link}"
                 )
                 for tid in {initiator_tid, counterparty_tid}:
-                    await message.bot.send_message(
-                        tid,
-                        review_msg,
-                        parse_mode="HTML",
-                        reply_markup=review_kb(deal_id),
+                    send_notification(
+                        message.bot.send_message(
+                            tid,
+                            review_msg,
+                            parse_mode="HTML",
+                            reply_markup=review_kb(deal_id),
+                        )
                     )
         except Exception:
             # Best-effort: don't fail /complete if DMing fails.
@@ -16,12 +16,27 @@ from commontrust_bot.review_notify import (
     clear_pending_review_response,
 )
 from commontrust_bot.pocketbase_client import pb_client
+from commontrust_bot.send_scheduler import send_notification
+from commontrust_bot.state import state_store
 
 router = Router()
 
-# Very small in-memory state for "optional comment after rating".
-# If the bot restarts, the user can just re-open the review link or run /review manually.
-_PENDING_REVIEW_COMMENT: dict[int, tuple[str, int]] = {}
+# State store namespace for "optional comment after rating":
+# telegram_user_id -> [deal_id, rating].
+# If the state expires, the user can just re-open the review link or run /review manually.
+_PENDING_REVIEW_COMMENT = "review_comment"
+
+
+async def _has_pending_review_comment(m: Message) -> bool:
+    user = getattr(m, "from_user", None)
+    if user is None:
+        return False
+    return await state_store.get(_PENDING_REVIEW_COMMENT, user.id) is not None
+
+
+async def _has_pending_review_response(m: Message) -> bool:
+    user = getattr(m, "from_user", None)
+    return user is not None and await get_pending_review_response(user.id) is not None
 
 
 def _relation_id(value: object) -> str | None:
@@ -54,11 +69,13 @@ async def _send_review_prompt(message: Message, deal_id: str) -> None:
         f"If you need it later, here is the review link:\n{html.quote(link)}"
     )
     for tid in {initiator_tid, counterparty_tid}:
-        await message.bot.send_message(
-            tid,
-            review_msg,
-            parse_mode="HTML",
-            reply_markup=review_kb(deal_id),
+        send_notification(
+            message.bot.send_message(
+                tid,
+                review_msg,
+                parse_mode="HTML",
+                reply_markup=review_kb(deal_id),
+            )
         )
 
 
@@ -200,7 +217,7 @@ async def cb_review_rating(query: CallbackQuery) -> None:
             comment=None,
             keep_existing_comment_if_none=True,
         )
-        _PENDING_REVIEW_COMMENT[user_id] = (deal_id, rating)
+        await state_store.set(_PENDING_REVIEW_COMMENT, user_id, [deal_id, rating])
         if bool(result.get("review_updated")):
             await query.answer("Rating updated.")
             await query.message.answer(
@@ -256,7 +273,7 @@ async def cb_deal_complete(query: CallbackQuery) -> None:
 
 @router.message(
     F.chat.type == "private",
-    lambda m: bool(getattr(m, "from_user", None)) and get_pending_review_response(getattr(m.from_user, "id", 0)) is not None,  # type: ignore[attr-defined]
+    _has_pending_review_response,
 )
 async def maybe_capture_review_response(message: Message) -> None:
     """
@@ -266,7 +283,7 @@ async def maybe_capture_review_response(message: Message) -> None:
     if not message.from_user:
         raise SkipHandler
 
-    review_id = get_pending_review_response(message.from_user.id)
+    review_id = await get_pending_review_response(message.from_user.id)
     if not review_id:
         # No pending review response for this user
         raise SkipHandler
@@ -275,7 +292,7 @@ async def maybe_capture_review_response(message: Message) -> None:
 
     # Allow /skip to cancel
     if response_text.startswith("/skip"):
-        clear_pending_review_response(message.from_user.id)
+        await clear_pending_review_response(message.from_user.id)
         await message.answer("Response cancelled. You can respond later from the review page.")
         return
 
@@ -296,7 +313,7 @@ async def maybe_capture_review_response(message: Message) -> None:
         review = await pb_client.get_record("reviews", review_id)
         reviewee_id = review.get("reviewee_id")
         if not reviewee_id:
-            clear_pending_review_response(message.from_user.id)
+            await clear_pending_review_response(message.from_user.id)
             await message.answer("Error: Could not find review.")
             return
 
@@ -304,14 +321,14 @@ async def maybe_capture_review_response(message: Message) -> None:
         reviewee_member = await pb_client.get_record("members", reviewee_id)
         reviewee_telegram_id = reviewee_member.get("telegram_id")
         if reviewee_telegram_id != message.from_user.id:
-            clear_pending_review_response(message.from_user.id)
+            await clear_pending_review_response(message.from_user.id)
             await message.answer("Error: You are not the reviewee for this review.")
             return
 
         # Check if they already responded.
         existing_response = (review.get("response") or "").strip()
         if existing_response or review.get("response_at"):
-            clear_pending_review_response(message.from_user.id)
+            await clear_pending_review_response(message.from_user.id)
             await message.answer("You have already submitted a response to this review.")
             return
 
@@ -320,26 +337,25 @@ async def maybe_capture_review_response(message: Message) -> None:
             "reviews", review_id, {"response": response_text, "response_at": datetime.now().isoformat()}
         )
 
-        clear_pending_review_response(message.from_user.id)
+        await clear_pending_review_response(message.from_user.id)
         await message.answer(
             "✅ Your response has been published on the ledger. "
             "It will appear next to the review for everyone to see."
         )
     except Exception as e:
-        clear_pending_review_response(message.from_user.id)
+        await clear_pending_review_response(message.from_user.id)
         await message.answer(f"Failed to submit response: {e}")
 
 
 @router.message(
     F.chat.type == "private",
-    lambda m: bool(getattr(m, "from_user", None))
-    and getattr(m.from_user, "id", None) in _PENDING_REVIEW_COMMENT,  # type: ignore[attr-defined]
+    _has_pending_review_comment,
 )
 async def maybe_capture_review_comment(message: Message) -> None:
     if not message.from_user:
         raise SkipHandler
 
-    pending = _PENDING_REVIEW_COMMENT.get(message.from_user.id)
+    pending = await state_store.get(_PENDING_REVIEW_COMMENT, message.from_user.id)
     if not pending:
         raise SkipHandler
 
@@ -365,7 +381,7 @@ async def maybe_capture_review_comment(message: Message) -> None:
             rating=rating,
             comment=comment,
         )
-        _PENDING_REVIEW_COMMENT.pop(message.from_user.id, None)
+        await state_store.delete(_PENDING_REVIEW_COMMENT, message.from_user.id)
         if not bool(result.get("deal_fully_reviewed")):
             await message.answer("waiting on their review")
             return
@@ -3,10 +3,11 @@
 from __future__ import annotations
 
 import asyncio
-import io
 import logging
-from dataclasses import dataclass, field
+import tempfile
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
+from typing import Any, BinaryIO
 
 from aiogram import F, Router, html
 from aiogram.dispatcher.event.bases import SkipHandler
@@ -15,15 +16,23 @@ from aiogram.types import CallbackQuery, Message
 
 from commontrust_bot.config import settings
 from commontrust_bot.pocketbase_client import pb_client
+from commontrust_bot.send_scheduler import notification_priority, send_notification
+from commontrust_bot.services.ai_queue import ai_review_pool
 from commontrust_bot.services.report import report_service
+from commontrust_bot.state import state_store
 from commontrust_bot.ui import report_admin_kb, report_confirm_kb
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Evidence downloads run a few at a time and spill to disk past this size, so a report with
+# ten full-size photos never sits in memory while it is uploaded to PocketBase.
+_EVIDENCE_DOWNLOADS = asyncio.Semaphore(4)
+_EVIDENCE_SPOOL_BYTES = 256 * 1024
+
 
 # ---------------------------------------------------------------------------
-# In-memory DM conversation state for evidence collection
+# DM conversation state for evidence collection (kept in the shared state store)
 # ---------------------------------------------------------------------------
 
 @dataclass
@@ -38,15 +47,26 @@ class ReportDraft:
     step: str = "description"  # "description" | "evidence" | "confirm"
 
 
-_PENDING_REPORT: dict[int, ReportDraft] = {}
+_REPORT_DRAFTS = "report_draft"
+
+
+async def get_pending_report(user_id: int) -> ReportDraft | None:
+    data = await state_store.get(_REPORT_DRAFTS, user_id)
+    return ReportDraft(**data) if data else None
+
 
+async def save_pending_report(user_id: int, draft: ReportDraft) -> None:
+    # Drafts are stored by value; every change must be saved back.
+    await state_store.set(_REPORT_DRAFTS, user_id, asdict(draft))
 
-def get_pending_report(user_id: int) -> ReportDraft | None:
-    return _PENDING_REPORT.get(user_id)
 
+async def clear_pending_report(user_id: int) -> None:
+    await state_store.delete(_REPORT_DRAFTS, user_id)
 
-def clear_pending_report(user_id: int) -> None:
-    _PENDING_REPORT.pop(user_id, None)
+
+async def _has_pending_report(message: Message) -> bool:
+    user = getattr(message, "from_user", None)
+    return user is not None and await get_pending_report(user.id) is not None
 
 
 def _is_admin(user_id: int) -> bool:
@@ -143,7 +163,7 @@ async def cmd_report(message: Message) -> None:
         deal_id=deal_id,
         step="description",
     )
-    _PENDING_REPORT[message.from_user.id] = draft
+    await save_pending_report(message.from_user.id, draft)
 
     # If in a group, move to DM.
     if message.chat.type != "private":
@@ -159,7 +179,7 @@ async def cmd_report(message: Message) -> None:
             me = await message.bot.get_me()
             link = f"https://t.me/{me.username}?start=report"
             await message.answer(f"I couldn't DM you. Please start the bot first: {link}")
-            clear_pending_report(message.from_user.id)
+            await clear_pending_report(message.from_user.id)
         return
 
     # Already in DM.
@@ -176,14 +196,13 @@ async def cmd_report(message: Message) -> None:
 
 @router.message(
     F.chat.type == "private",
-    lambda m: bool(getattr(m, "from_user", None))
-    and getattr(m.from_user, "id", None) in _PENDING_REPORT,
+    _has_pending_report,
 )
 async def capture_report_evidence(message: Message) -> None:
     if not message.from_user:
         raise SkipHandler
 
-    draft = _PENDING_REPORT.get(message.from_user.id)
+    draft = await get_pending_report(message.from_user.id)
     if not draft:
         raise SkipHandler
 
@@ -191,7 +210,7 @@ async def capture_report_evidence(message: Message) -> None:
 
     # Allow /cancel at any step.
     if text.lower() == "/cancel":
-        clear_pending_report(message.from_user.id)
+        await clear_pending_report(message.from_user.id)
         await message.answer("Report cancelled.")
         return
 
@@ -212,6 +231,7 @@ async def capture_report_evidence(message: Message) -> None:
             return
         draft.description = text
         draft.step = "evidence"
+        await save_pending_report(message.from_user.id, draft)
         await message.answer(
             "Got it. Now send any evidence:\n\n"
             "• Screenshots or photos\n"
@@ -224,6 +244,7 @@ async def capture_report_evidence(message: Message) -> None:
     if draft.step == "evidence":
         if text.lower() in ("/done", "/skip"):
             draft.step = "confirm"
+            await save_pending_report(message.from_user.id, draft)
             await _show_confirmation(message, draft)
             return
 
@@ -233,6 +254,7 @@ async def capture_report_evidence(message: Message) -> None:
                 await message.answer("Maximum 10 photos per report. Type /done to finish.")
                 return
             draft.photo_file_ids.append(message.photo[-1].file_id)
+            await save_pending_report(message.from_user.id, draft)
             await message.answer(
                 f"Photo received ({len(draft.photo_file_ids)}/10). "
                 "Send more, forward messages, or type /done."
@@ -255,6 +277,7 @@ async def capture_report_evidence(message: Message) -> None:
             if message.photo:
                 if len(draft.photo_file_ids) < 10:
                     draft.photo_file_ids.append(message.photo[-1].file_id)
+            await save_pending_report(message.from_user.id, draft)
             await message.answer(
                 f"Forwarded message captured ({len(draft.forwarded_messages)} total). "
                 "Send more or type /done."
@@ -268,6 +291,7 @@ async def capture_report_evidence(message: Message) -> None:
                 "from_name": "Reporter note",
                 "date": datetime.now().isoformat(),
             })
+            await save_pending_report(message.from_user.id, draft)
             await message.answer("Note captured. Send more evidence or type /done.")
             return
 
@@ -303,27 +327,44 @@ async def _show_confirmation(message: Message, draft: ReportDraft) -> None:
 # Confirmation callbacks (Submit / Cancel)
 # ---------------------------------------------------------------------------
 
+async def _download_evidence(bot: Any, file_ids: list[str]) -> list[tuple[str, BinaryIO, str]]:
+    """Download evidence photos into spooled temp files, ready to stream into the upload.
+
+    Photos that fail to download are skipped. The caller closes the returned files.
+    """
+
+    async def _download(file_id: str) -> BinaryIO | None:
+        spool = tempfile.SpooledTemporaryFile(max_size=_EVIDENCE_SPOOL_BYTES)  # noqa: SIM115
+        try:
+            async with _EVIDENCE_DOWNLOADS:
+                file = await bot.get_file(file_id)
+                await bot.download_file(file.file_path, destination=spool)
+        except Exception as e:
+            spool.close()
+            logger.warning("Failed to download photo %s: %s", file_id, e)
+            return None
+        spool.seek(0)
+        return spool
+
+    results = await asyncio.gather(*(_download(file_id) for file_id in file_ids))
+    return [
+        (f"evidence_{i}.jpg", spool, "image/jpeg")
+        for i, spool in enumerate(results)
+        if spool is not None
+    ]
+
+
 @router.callback_query(F.data.startswith("report_submit:"))
 async def cb_report_submit(query: CallbackQuery) -> None:
     user_id = query.from_user.id
-    draft = _PENDING_REPORT.get(user_id)
+    draft = await get_pending_report(user_id)
     if not draft:
         await query.answer("No pending report found.", show_alert=True)
         return
 
     await query.answer("Submitting...")
 
-    # Download photos from Telegram.
-    photo_data: list[tuple[str, bytes, str]] = []
-    for i, file_id in enumerate(draft.photo_file_ids):
-        try:
-            file = await query.bot.get_file(file_id)
-            buf = io.BytesIO()
-            await query.bot.download_file(file.file_path, buf)
-            photo_data.append((f"evidence_{i}.jpg", buf.getvalue(), "image/jpeg"))
-        except Exception as e:
-            logger.warning("Failed to download photo %s: %s", file_id, e)
-
+    photo_data = await _download_evidence(query.bot, draft.photo_file_ids)
     try:
         record = await report_service.create_report(
             reporter_telegram_id=user_id,
@@ -333,7 +374,7 @@ async def cb_report_submit(query: CallbackQuery) -> None:
             forwarded_messages=draft.forwarded_messages,
             deal_id=draft.deal_id,
         )
-        clear_pending_report(user_id)
+        await clear_pending_report(user_id)
 
         await query.message.edit_text(
             "Your report has been submitted and is being reviewed.\n\n"
@@ -341,41 +382,28 @@ async def cb_report_submit(query: CallbackQuery) -> None:
             parse_mode="HTML",
         )
 
-        # Trigger AI review asynchronously, then notify admins.
-        asyncio.create_task(_run_ai_and_notify(query.bot, record["id"], user_id))
+        # Queued for the AI review workers, which notify admins when the analysis is done.
+        await ai_review_pool.submit(record["id"])
     except Exception as e:
-        clear_pending_report(user_id)
+        await clear_pending_report(user_id)
         await query.message.answer(f"Failed to submit report: {e}")
+    finally:
+        for _, content, _ in photo_data:
+            content.close()
 
 
 @router.callback_query(F.data.startswith("report_cancel:"))
 async def cb_report_cancel(query: CallbackQuery) -> None:
-    clear_pending_report(query.from_user.id)
+    await clear_pending_report(query.from_user.id)
     await query.answer("Report cancelled.")
     await query.message.edit_text("Report cancelled.")
 
 
 # ---------------------------------------------------------------------------
-# AI review + admin notification (runs as background task)
+# Admin notification (called by the AI review workers once a report is analysed)
 # ---------------------------------------------------------------------------
 
-async def _run_ai_and_notify(bot: object, report_id: str, reporter_tid: int) -> None:
-    try:
-        report = await report_service.trigger_ai_review(report_id)
-    except Exception as e:
-        logger.error("AI review failed for report %s: %s", report_id, e)
-        # Still proceed — mark as pending_admin so admins can review manually.
-        try:
-            report = await pb_client.update_record(
-                "reports", report_id, {"status": "pending_admin", "ai_summary": f"AI analysis failed: {e}"}
-            )
-        except Exception:
-            return
-
-    await _notify_admins(bot, report)
-
-
-async def _notify_admins(bot: object, report: dict) -> None:
+async def notify_admins_of_report(bot: object, report: dict) -> None:
     send_message = getattr(bot, "send_message", None)
     if not callable(send_message):
         return
@@ -411,12 +439,13 @@ async def _notify_admins(bot: object, report: dict) -> None:
 
     for admin_id in settings.admin_user_ids:
         try:
-            await send_message(
-                admin_id,
-                text,
-                parse_mode="HTML",
-                reply_markup=report_admin_kb(report["id"]),
-            )
+            with notification_priority():
+                await send_message(
+                    admin_id,
+                    text,
+                    parse_mode="HTML",
+                    reply_markup=report_admin_kb(report["id"]),
+                )
         except Exception as e:
             logger.warning("Could not notify admin %s: %s", admin_id, e)
 
@@ -492,7 +521,7 @@ async def cb_report_action(query: CallbackQuery) -> None:
                 msg = f"Your report against {reported_name} has been reviewed. No action was taken at this time."
             send_message = getattr(query.bot, "send_message", None)
             if callable(send_message):
-                await send_message(reporter_tid, msg)
+                send_notification(send_message(reporter_tid, msg))
     except Exception as e:
         logger.warning("Could not notify reporter: %s", e)
 
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import sys
 from contextlib import suppress
+from functools import partial
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
@@ -9,13 +10,24 @@ from aiogram.enums import ParseMode
 
 from commontrust_bot.config import settings
 from commontrust_bot.handlers import router
+from commontrust_bot.handlers.report import notify_admins_of_report
 from commontrust_bot.pocketbase_client import pb_client
+from commontrust_bot.send_scheduler import drain_notifications, send_scheduler
+from commontrust_bot.services import ai_review
+from commontrust_bot.services.ai_queue import ai_review_pool
+from commontrust_bot.services.reputation import reputation_service
+from commontrust_bot.state import state_store
+from commontrust_common.instrumentation import install as install_instrumentation
+from commontrust_common.instrumentation import start_metrics_server
+from commontrust_common.webhook import run_webhook
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+_background_tasks: set[asyncio.Task] = set()
+
 
 async def on_startup(bot: Bot) -> None:
     logger.info("Starting bot...")
@@ -27,12 +39,26 @@ async def on_startup(bot: Bot) -> None:
         logger.error(f"Failed to authenticate with PocketBase: {e}")
         sys.exit(1)
 
+    if settings.reputation_verify_interval_seconds > 0:
+        _background_tasks.add(
+            asyncio.create_task(reputation_service.run_verifier(settings.reputation_verify_interval_seconds))
+        )
+
+    await ai_review_pool.start(notify=partial(notify_admins_of_report, bot))
+
     me = await bot.get_me()
     logger.info(f"Bot started as @{me.username}")
 
 
 async def on_shutdown(bot: Bot) -> None:
     logger.info("Shutting down bot...")
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    await ai_review_pool.stop()
+    ai_review_pool.queue.close()
+    await ai_review.aclose()
+    state_store.close()
     await pb_client.close()
 
 
@@ -40,23 +66,50 @@ async def main() -> None:
     if not settings.is_configured:
         logger.error("Bot is not configured. Please set required environment variables.")
         sys.exit(1)
+    if settings.webhook_url and not settings.webhook_secret:
+        logger.error("WEBHOOK_SECRET is required when WEBHOOK_URL is set.")
+        sys.exit(1)
 
     bot = Bot(
         token=settings.telegram_bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
+    # Every outgoing message is paced against Telegram's flood limits.
+    bot.session.middleware(send_scheduler)
     dp = Dispatcher()
 
     dp.include_router(router)
+    install_instrumentation(dp, settings.slow_handler_seconds)
 
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
+    metrics_server = None
+    if settings.metrics_port:
+        metrics_server = await start_metrics_server(settings.metrics_host, settings.metrics_port)
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.webhook_url:
+            await run_webhook(
+                dp,
+                bot,
+                url=settings.webhook_url,
+                secret=settings.webhook_secret,
+                path=settings.webhook_path,
+                host=settings.webhook_listen_host,
+                port=settings.webhook_listen_port,
+                workers=settings.update_workers,
+                max_pending=settings.update_queue_size,
+            )
+        else:
+            # getUpdates is refused while a webhook is set, e.g. after switching modes.
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     finally:
+        if metrics_server is not None:
+            await metrics_server.cleanup()
+        await drain_notifications(timeout=10)
         await bot.session.close()
 
 
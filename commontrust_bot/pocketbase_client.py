@@ -1,10 +1,19 @@
+import copy
+from collections.abc import AsyncIterator
 from datetime import datetime
 import logging
-from typing import Any
+import os
+import secrets
+import string
+import time
+from typing import Any, BinaryIO, Literal
 
 import httpx
 
+from commontrust_bot.cache import TTLCache
 from commontrust_bot.config import settings
+from commontrust_common.instrumentation import record_backend_call
+from commontrust_common.pocketbase_metrics import observe_request
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +22,114 @@ class PocketBaseError(Exception):
     pass
 
 
+class PocketBaseDuplicateError(PocketBaseError):
+    """A write hit a unique index (PocketBase "validation_not_unique")."""
+
+
+# How fresh a read must be:
+# - "strong": bypass every cache (read-after-write paths such as review gating).
+# - "default": plain GET.
+# - "cached": may be answered from the client's response cache (read-mostly collections).
+Consistency = Literal["strong", "default", "cached"]
+
+_ETAG_RETENTION_FACTOR = 10
+
+_RECORD_ID_ALPHABET = string.ascii_lowercase + string.digits
+
+# Unique (mc_group_id, idempotency_key) index on mc_transactions; see pb_schema.json.
+IDEMPOTENCY_INDEX = "idx_mc_transactions_idempotency"
+
+# Multipart field: (field_name, filename, content, mime_type). Content is either bytes or a
+# readable, seekable binary file (e.g. a spooled download), which is streamed in chunks.
+UploadFile = tuple[str, str, bytes | BinaryIO, str]
+
+_UPLOAD_CHUNK_SIZE = 65536
+
+
+def _quote_form_name(value: str) -> str:
+    # Same escaping browsers apply to multipart names and filenames.
+    return value.replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+def _file_size(content: bytes | BinaryIO) -> int:
+    if isinstance(content, bytes):
+        return len(content)
+    content.seek(0, os.SEEK_END)
+    size = content.tell()
+    content.seek(0)
+    return size
+
+
+class _MultipartStream:
+    """multipart/form-data body that reads file contents chunk by chunk while it is sent.
+
+    Only the small part headers are built up front, so the length is known (no chunked encoding)
+    but at most one chunk of file data is held in memory.
+    """
+
+    def __init__(self, fields: dict[str, str], files: list[UploadFile]):
+        self.boundary = secrets.token_hex(16)
+        self._parts: list[tuple[bytes, bytes | BinaryIO | None]] = []
+        for name, value in fields.items():
+            head = (
+                f"--{self.boundary}\r\nContent-Disposition: form-data; "
+                f'name="{_quote_form_name(name)}"\r\n\r\n'
+            ).encode()
+            self._parts.append((head + value.encode() + b"\r\n", None))
+        for field_name, filename, content, mime in files:
+            head = (
+                f"--{self.boundary}\r\nContent-Disposition: form-data; "
+                f'name="{_quote_form_name(field_name)}"; filename="{_quote_form_name(filename)}"'
+                f"\r\nContent-Type: {mime}\r\n\r\n"
+            ).encode()
+            self._parts.append((head, content))
+        self._tail = f"--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def content_length(self) -> int:
+        total = len(self._tail)
+        for head, content in self._parts:
+            total += len(head)
+            if content is not None:
+                total += _file_size(content) + 2
+        return total
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for head, content in self._parts:
+            yield head
+            if content is None:
+                continue
+            if isinstance(content, bytes):
+                yield content
+            else:
+                content.seek(0)
+                while chunk := content.read(_UPLOAD_CHUNK_SIZE):
+                    yield chunk
+            yield b"\r\n"
+        yield self._tail
+
+
+def new_record_id() -> str:
+    # PocketBase record ids are 15 chars of [a-z0-9]. Generating them client-side lets a batch
+    # reference a record created earlier in the same batch.
+    return "".join(secrets.choice(_RECORD_ID_ALPHABET) for _ in range(15))
+
+
+def _batch_create(collection: str, body: dict[str, Any]) -> dict[str, Any]:
+    return {"method": "POST", "url": f"/api/collections/{collection}/records", "body": body}
+
+
+def _batch_update(collection: str, record_id: str, body: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "method": "PATCH",
+        "url": f"/api/collections/{collection}/records/{record_id}",
+        "body": body,
+    }
+
+
 class PocketBaseClient:
     def __init__(
         self,
@@ -20,6 +137,11 @@ class PocketBaseClient:
         admin_token: str | None = None,
         admin_email: str | None = None,
         admin_password: str | None = None,
+        member_cache_size: int | None = None,
+        member_cache_ttl_seconds: float | None = None,
+        response_cache_size: int | None = None,
+        response_cache_ttl_seconds: float | None = None,
+        slow_query_seconds: float | None = None,
     ):
         # Allow callers (API service) to provide isolated credentials; default to bot settings.
         self.base_url = base_url or settings.pocketbase_url
@@ -28,6 +150,36 @@ class PocketBaseClient:
         self.admin_password = admin_password
         self.token: str | None = None
         self._client: httpx.AsyncClient | None = None
+        # Member records are read on nearly every handler; keep them keyed by record id
+        # ("id", ...) and by Telegram user id ("tg", ...). Writes through this client keep it fresh.
+        self.member_cache: TTLCache[dict[str, Any]] = TTLCache(
+            settings.member_cache_size if member_cache_size is None else member_cache_size,
+            settings.member_cache_ttl_seconds
+            if member_cache_ttl_seconds is None
+            else member_cache_ttl_seconds,
+        )
+        # Responses for consistency="cached" reads, keyed by (collection, generation, path, params).
+        # Any write through this client bumps the collection's generation, orphaning old entries.
+        cache_size = (
+            settings.response_cache_size if response_cache_size is None else response_cache_size
+        )
+        cache_ttl = (
+            settings.response_cache_ttl_seconds
+            if response_cache_ttl_seconds is None
+            else response_cache_ttl_seconds
+        )
+        self.response_cache: TTLCache[dict[str, Any]] = TTLCache(cache_size, cache_ttl)
+        # Expired responses that carried an ETag can still be revalidated with If-None-Match.
+        self._etag_cache: TTLCache[tuple[str, dict[str, Any]]] = TTLCache(
+            cache_size, cache_ttl * _ETAG_RETENTION_FACTOR
+        )
+        self._collection_generation: dict[str, int] = {}
+        self.slow_query_seconds = (
+            settings.pocketbase_slow_query_seconds
+            if slow_query_seconds is None
+            else slow_query_seconds
+        )
+        self._idempotency_indexed: bool | None = None
 
     @property
     def client(self) -> httpx.AsyncClient:
@@ -75,34 +227,92 @@ class PocketBaseClient:
             raise PocketBaseError("Not authenticated")
         return {"Authorization": self.token}
 
+    @staticmethod
+    def _collection_of(path: str) -> str | None:
+        # "/api/collections/{collection}/records..." -> collection
+        parts = path.split("/")
+        if len(parts) > 3 and parts[1] == "api" and parts[2] == "collections":
+            return parts[3]
+        return None
+
+    async def _send(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        """One HTTP round-trip: timed into the request metrics and the current handler's trace."""
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.client.request(method, f"{self.base_url}{path}", **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            collection = self._collection_of(path) or path
+            record_backend_call(f"{method} {collection}", elapsed)
+            params = kwargs.get("params") or {}
+            observe_request(
+                method, collection, params.get("filter"), response, elapsed,
+                self.slow_query_seconds,
+            )
+
+    def _response_cache_key(self, path: str, params: dict[str, Any]) -> tuple[Any, ...]:
+        collection = self._collection_of(path)
+        generation = self._collection_generation.get(collection or "", 0)
+        return (collection, generation, path, tuple(sorted((k, str(v)) for k, v in params.items())))
+
+    def invalidate_collection(self, collection: str) -> None:
+        self._collection_generation[collection] = self._collection_generation.get(collection, 0) + 1
+
     async def _request(
-        self, method: str, path: str, data: dict[str, Any] | None = None
+        self,
+        method: str,
+        path: str,
+        data: dict[str, Any] | None = None,
+        consistency: Consistency = "default",
     ) -> dict[str, Any]:
-        url = f"{self.base_url}{path}"
         headers = self._headers()
 
         if method == "GET":
             params = dict(data or {})
-            # Avoid stale intermediary caches for read-after-write flows (e.g. review gating).
-            params["_ts"] = int(datetime.now().timestamp() * 1000)
-            response = await self.client.get(
-                url,
-                headers={
+            cache_key = None
+            stale: tuple[str, dict[str, Any]] | None = None
+            if consistency == "strong":
+                # Avoid stale intermediary caches for read-after-write flows (e.g. review gating).
+                params["_ts"] = int(datetime.now().timestamp() * 1000)
+                headers = {
                     **headers,
                     "Cache-Control": "no-cache, no-store, max-age=0",
                     "Pragma": "no-cache",
-                },
-                params=params,
-            )
+                }
+            elif consistency == "cached" and self.response_cache.enabled:
+                cache_key = self._response_cache_key(path, params)
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    # Callers own what they get back; never hand out the cached object itself.
+                    return copy.deepcopy(cached)
+                stale = self._etag_cache.get(cache_key)
+                if stale is not None:
+                    headers = {**headers, "If-None-Match": stale[0]}
+            response = await self._send("GET", path, headers=headers, params=params)
+            if cache_key is not None:
+                if response.status_code == 304 and stale is not None:
+                    self.response_cache.set(cache_key, stale[1])
+                    return copy.deepcopy(stale[1])
+                if response.status_code == 200:
+                    body = response.json()
+                    self.response_cache.set(cache_key, body)
+                    etag = response.headers.get("ETag")
+                    if etag:
+                        self._etag_cache.set(cache_key, (etag, body))
+                    return copy.deepcopy(body)
         elif method == "POST":
-            response = await self.client.post(url, headers=headers, json=data)
+            response = await self._send("POST", path, headers=headers, json=data)
         elif method == "PATCH":
-            response = await self.client.patch(url, headers=headers, json=data)
+            response = await self._send("PATCH", path, headers=headers, json=data)
         elif method == "DELETE":
-            response = await self.client.delete(url, headers=headers)
+            response = await self._send("DELETE", path, headers=headers)
         else:
             raise PocketBaseError(f"Unsupported method: {method}")
 
+        if response.status_code == 400 and "validation_not_unique" in response.text:
+            raise PocketBaseDuplicateError(f"Duplicate record: {response.text}")
         if response.status_code >= 400:
             logger.error(f"PocketBase error: {response.status_code} - {response.text}")
             raise PocketBaseError(f"Request failed: {response.status_code} - {response.text}")
@@ -118,40 +328,132 @@ class PocketBaseClient:
         per_page: int = 50,
         filter: str | None = None,
         sort: str | None = None,
+        consistency: Consistency = "default",
     ) -> dict[str, Any]:
         params = {"page": page, "perPage": per_page}
         if filter:
             params["filter"] = filter
         if sort:
             params["sort"] = sort
-        return await self._request("GET", f"/api/collections/{collection}/records", params)
+        return await self._request(
+            "GET", f"/api/collections/{collection}/records", params, consistency=consistency
+        )
 
-    async def get_record(self, collection: str, record_id: str) -> dict[str, Any]:
-        return await self._request("GET", f"/api/collections/{collection}/records/{record_id}")
+    async def get_record(
+        self, collection: str, record_id: str, consistency: Consistency = "default"
+    ) -> dict[str, Any]:
+        if collection == "members" and consistency != "strong":
+            cached = self._cached_member(("id", record_id))
+            if cached is not None:
+                return cached
+        record = await self._request(
+            "GET", f"/api/collections/{collection}/records/{record_id}", consistency=consistency
+        )
+        if collection == "members":
+            self._remember_member(record)
+        return record
 
     async def create_record(self, collection: str, data: dict[str, Any]) -> dict[str, Any]:
-        return await self._request("POST", f"/api/collections/{collection}/records", data)
+        self.invalidate_collection(collection)
+        record = await self._request("POST", f"/api/collections/{collection}/records", data)
+        if collection == "members":
+            self._remember_member(record)
+        return record
 
     async def update_record(
         self, collection: str, record_id: str, data: dict[str, Any]
     ) -> dict[str, Any]:
-        return await self._request(
+        self.invalidate_collection(collection)
+        if collection == "members":
+            # Drop first so a failed PATCH never leaves a stale entry behind.
+            self._forget_member(record_id)
+        record = await self._request(
             "PATCH", f"/api/collections/{collection}/records/{record_id}", data
         )
+        if collection == "members":
+            self._remember_member(record)
+        return record
 
     async def delete_record(self, collection: str, record_id: str) -> None:
+        self.invalidate_collection(collection)
+        if collection == "members":
+            self._forget_member(record_id)
         await self._request("DELETE", f"/api/collections/{collection}/records/{record_id}")
 
-    async def get_first(self, collection: str, filter: str) -> dict[str, Any] | None:
-        result = await self.list_records(collection, page=1, per_page=1, filter=filter)
+    def _cached_member(self, key: tuple[str, Any]) -> dict[str, Any] | None:
+        record = self.member_cache.get(key)
+        # Hand out copies so callers can't mutate the cached record.
+        return dict(record) if record is not None else None
+
+    def _remember_member(self, record: dict[str, Any] | None) -> None:
+        if not isinstance(record, dict) or not record.get("id"):
+            return
+        snapshot = dict(record)
+        self.member_cache.set(("id", record["id"]), snapshot)
+        telegram_id = record.get("telegram_id")
+        if isinstance(telegram_id, (int, float)):
+            self.member_cache.set(("tg", int(telegram_id)), snapshot)
+
+    def _forget_member(self, record_id: str) -> None:
+        record = self.member_cache.pop(("id", record_id))
+        if record is not None and isinstance(record.get("telegram_id"), (int, float)):
+            self.member_cache.pop(("tg", int(record["telegram_id"])))
+
+    def member_cache_stats(self) -> dict[str, int]:
+        return self.member_cache.stats()
+
+    async def batch(self, requests: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Run several record writes as one transaction via PocketBase's /api/batch.
+
+        Each request is {"method": "POST" | "PATCH" | "DELETE", "url": "/api/collections/...",
+        "body": {...}}. Returns the response bodies in order; if any write fails PocketBase rolls
+        back the whole batch and this raises PocketBaseError.
+        """
+        for request in requests:
+            collection = self._collection_of(request.get("url", ""))
+            if collection:
+                self.invalidate_collection(collection)
+        responses: Any = await self._request("POST", "/api/batch", {"requests": requests})
+        return [item.get("body") or {} for item in responses]
+
+    async def get_first(
+        self, collection: str, filter: str, consistency: Consistency = "default"
+    ) -> dict[str, Any] | None:
+        result = await self.list_records(
+            collection, page=1, per_page=1, filter=filter, consistency=consistency
+        )
         items = result.get("items", [])
         return items[0] if items else None
 
+    async def iter_records(
+        self, collection: str, filter: str | None = None, per_page: int = 500
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Yield every record matching `filter`, holding only one page in memory.
+
+        Pages by keyset on `id` instead of page number: deep pages cost the same as the first,
+        and records created mid-scan can't shift rows across page boundaries.
+        """
+        last_id = ""
+        while True:
+            clauses = [f"({filter})"] if filter else []
+            if last_id:
+                clauses.append(f'id>"{last_id}"')
+            params: dict[str, Any] = {"page": 1, "perPage": per_page, "sort": "id", "skipTotal": 1}
+            if clauses:
+                params["filter"] = " && ".join(clauses)
+            result = await self._request("GET", f"/api/collections/{collection}/records", params)
+            items = result.get("items", [])
+            for item in items:
+                yield item
+            if len(items) < per_page:
+                return
+            last_id = items[-1]["id"]
+
     async def member_get_or_create(
         self, telegram_id: int, username: str | None = None, display_name: str | None = None
     ) -> dict[str, Any]:
         username_norm = username.strip().lstrip("@").lower() if username and username.strip() else None
-        existing = await self.get_first("members", f"telegram_id={telegram_id}")
+        existing = await self.member_get(telegram_id)
         if existing:
             update_data = {}
             if username_norm and username_norm != (existing.get("username") or ""):
@@ -173,13 +475,20 @@ class PocketBaseClient:
         )
 
     async def member_get(self, telegram_id: int) -> dict[str, Any] | None:
-        return await self.get_first("members", f"telegram_id={telegram_id}")
+        cached = self._cached_member(("tg", telegram_id))
+        if cached is not None:
+            return cached
+        record = await self.get_first("members", f"telegram_id={telegram_id}")
+        self._remember_member(record)
+        return record
 
     async def member_get_by_username(self, username: str) -> dict[str, Any] | None:
         username_norm = username.strip().lstrip("@").lower()
         if not username_norm:
             return None
-        return await self.get_first("members", f'username="{username_norm}"')
+        record = await self.get_first("members", f'username="{username_norm}"')
+        self._remember_member(record)
+        return record
 
     async def group_get_or_create(
         self, telegram_id: int, title: str, mc_enabled: bool = False
@@ -194,7 +503,7 @@ class PocketBaseClient:
         )
 
     async def group_get(self, telegram_id: int) -> dict[str, Any] | None:
-        return await self.get_first("groups", f"telegram_id={telegram_id}")
+        return await self.get_first("groups", f"telegram_id={telegram_id}", consistency="cached")
 
     async def deal_create(
         self,
@@ -253,27 +562,51 @@ class PocketBaseClient:
             },
         )
 
-    async def reviews_for_member(self, member_id: str) -> list[dict[str, Any]]:
-        result = await self.list_records("reviews", filter=f'reviewee_id="{member_id}"')
-        return result.get("items", [])
+    async def reviews_for_member(self, member_id: str, per_page: int = 200) -> list[dict[str, Any]]:
+        # Page through everything; busy members easily exceed a single page of reviews.
+        items: list[dict[str, Any]] = []
+        page = 1
+        while True:
+            result = await self.list_records(
+                "reviews", page=page, per_page=per_page, filter=f'reviewee_id="{member_id}"'
+            )
+            batch = result.get("items", [])
+            items.extend(batch)
+            if len(batch) < per_page:
+                return items
+            page += 1
 
     async def reputation_get(self, member_id: str) -> dict[str, Any] | None:
         return await self.get_first("reputation", f'member_id="{member_id}"')
 
     async def reputation_update(
-        self, member_id: str, verified_deals: int, avg_rating: float
+        self,
+        member_id: str,
+        verified_deals: int,
+        avg_rating: float,
+        total_reviews: int | None = None,
+        reviewer_stats: dict[str, dict[str, int]] | None = None,
+        verified_deal_ids: list[str] | None = None,
+        record_id: str | None = None,
     ) -> dict[str, Any]:
-        existing = await self.reputation_get(member_id)
-        if existing:
-            return await self.update_record(
-                "reputation", existing["id"], {"verified_deals": verified_deals, "avg_rating": avg_rating}
-            )
-        return await self.create_record(
-            "reputation", {"member_id": member_id, "verified_deals": verified_deals, "avg_rating": avg_rating}
-        )
+        data: dict[str, Any] = {"verified_deals": verified_deals, "avg_rating": avg_rating}
+        # Incremental aggregate (see ReputationService.apply_review_deltas).
+        if total_reviews is not None:
+            data["total_reviews"] = total_reviews
+        if reviewer_stats is not None:
+            data["reviewer_stats"] = reviewer_stats
+        if verified_deal_ids is not None:
+            data["verified_deal_ids"] = verified_deal_ids
+
+        if record_id is None:
+            existing = await self.reputation_get(member_id)
+            record_id = existing["id"] if existing else None
+        if record_id:
+            return await self.update_record("reputation", record_id, data)
+        return await self.create_record("reputation", {"member_id": member_id, **data})
 
     async def mc_group_get(self, group_id: str) -> dict[str, Any] | None:
-        return await self.get_first("mc_groups", f'group_id="{group_id}"')
+        return await self.get_first("mc_groups", f'group_id="{group_id}"', consistency="cached")
 
     async def mc_group_create(
         self, group_id: str, currency_name: str = "Credit", currency_symbol: str = "Cr"
@@ -313,6 +646,22 @@ class PocketBaseClient:
             data["credit_limit"] = credit_limit
         return await self.update_record("mc_accounts", account_id, data)
 
+    async def mc_idempotency_indexed(self) -> bool:
+        """Whether mc_transactions has the unique idempotency-key index that rejects replays.
+
+        Checked once per client. Without it, keyed payments look their key up before posting.
+        """
+        if self._idempotency_indexed is None:
+            collection = await self._request("GET", "/api/collections/mc_transactions")
+            indexes = collection.get("indexes") or []
+            self._idempotency_indexed = any(IDEMPOTENCY_INDEX in sql for sql in indexes)
+            if not self._idempotency_indexed:
+                logger.warning(
+                    "mc_transactions has no %s index; run scripts/pb_setup_db.py to create it",
+                    IDEMPOTENCY_INDEX,
+                )
+        return self._idempotency_indexed
+
     async def mc_transaction_get_by_idempotency(
         self, mc_group_id: str, idempotency_key: str
     ) -> dict[str, Any] | None:
@@ -356,6 +705,61 @@ class PocketBaseClient:
             },
         )
 
+    async def mc_payment_create(
+        self,
+        mc_group_id: str,
+        payer_id: str,
+        payee_id: str,
+        payer_account_id: str,
+        payee_account_id: str,
+        amount: int,
+        new_payer_balance: int,
+        new_payee_balance: int,
+        description: str | None = None,
+        idempotency_key: str | None = None,
+    ) -> dict[str, Any]:
+        # Transaction, both entries and both balances go out as a single batch, so a payment is
+        # either fully posted or not at all. The transaction id is generated up front so the
+        # entries can reference it within the same batch.
+        transaction_id = new_record_id()
+        transaction, payer_entry, payee_entry, _, _ = await self.batch(
+            [
+                _batch_create(
+                    "mc_transactions",
+                    {
+                        "id": transaction_id,
+                        "mc_group_id": mc_group_id,
+                        "payer_id": payer_id,
+                        "payee_id": payee_id,
+                        "amount": amount,
+                        "description": description,
+                        "idempotency_key": idempotency_key,
+                    },
+                ),
+                _batch_create(
+                    "mc_entries",
+                    {
+                        "transaction_id": transaction_id,
+                        "account_id": payer_account_id,
+                        "amount": -amount,
+                        "balance_after": new_payer_balance,
+                    },
+                ),
+                _batch_create(
+                    "mc_entries",
+                    {
+                        "transaction_id": transaction_id,
+                        "account_id": payee_account_id,
+                        "amount": amount,
+                        "balance_after": new_payee_balance,
+                    },
+                ),
+                _batch_update("mc_accounts", payer_account_id, {"balance": new_payer_balance}),
+                _batch_update("mc_accounts", payee_account_id, {"balance": new_payee_balance}),
+            ]
+        )
+        return {"transaction": transaction, "payer_entry": payer_entry, "payee_entry": payee_entry}
+
     async def mc_entries_for_transaction(self, transaction_id: str) -> list[dict[str, Any]]:
         result = await self.list_records("mc_entries", filter=f'transaction_id="{transaction_id}"')
         return result.get("items", [])
@@ -393,28 +797,30 @@ class PocketBaseClient:
         self,
         collection: str,
         data: dict[str, Any],
-        files: list[tuple[str, str, bytes, str]] | None = None,
+        files: list[UploadFile] | None = None,
     ) -> dict[str, Any]:
         """Create a record using multipart form (required when uploading file fields).
 
-        *files* is a list of (field_name, filename, content_bytes, mime_type) tuples.
+        *files* is a list of (field_name, filename, content, mime_type) tuples, where content is
+        bytes or a seekable binary file. File contents are streamed, not loaded into memory.
         """
         import json as _json
 
-        url = f"{self.base_url}/api/collections/{collection}/records"
-        headers = self._headers()
+        path = f"/api/collections/{collection}/records"
         form_data: dict[str, str] = {}
         for k, v in data.items():
             if isinstance(v, (dict, list)):
                 form_data[k] = _json.dumps(v)
             else:
                 form_data[k] = str(v) if not isinstance(v, str) else v
-        upload_files: list[tuple[str, tuple[str, bytes, str]]] = []
-        for field_name, filename, content, mime in (files or []):
-            upload_files.append((field_name, (filename, content, mime)))
-        response = await self.client.post(
-            url, headers=headers, data=form_data, files=upload_files
-        )
+        body = _MultipartStream(form_data, list(files or []))
+        headers = {
+            **self._headers(),
+            "Content-Type": body.content_type,
+            "Content-Length": str(body.content_length()),
+        }
+        self.invalidate_collection(collection)
+        response = await self._send("POST", path, headers=headers, content=body)
         if response.status_code >= 400:
             logger.error(f"PocketBase file-upload error: {response.status_code} - {response.text}")
             raise PocketBaseError(f"Request failed: {response.status_code} - {response.text}")
@@ -427,7 +833,9 @@ class PocketBaseClient:
 
     # Hub mode: per-chat remote ledger config (stored in PB).
     async def ledger_remote_get(self, telegram_chat_id: int) -> dict[str, Any] | None:
-        return await self.get_first("ledger_remotes", f"telegram_chat_id={telegram_chat_id}")
+        return await self.get_first(
+            "ledger_remotes", f"telegram_chat_id={telegram_chat_id}", consistency="cached"
+        )
 
     async def ledger_remote_upsert(
         self, telegram_chat_id: int, base_url: str, token_encrypted: str
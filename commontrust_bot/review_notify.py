@@ -4,11 +4,13 @@ from aiogram import html
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from commontrust_bot.review_response_token import make_review_response_token
+from commontrust_bot.send_scheduler import send_notification
+from commontrust_bot.state import state_store
 from commontrust_bot.web_links import review_respond_url, review_url, user_reviews_url, user_reviews_url_by_telegram_id
 
-# In-memory state: telegram_user_id -> review_id
+# State store namespace: telegram_user_id -> review_id
 # When a user receives a review notification, we store their pending response state.
-_PENDING_REVIEW_RESPONSE: dict[int, str] = {}
+_PENDING_REVIEW_RESPONSE = "review_response"
 
 
 async def maybe_dm_reviewee_with_respond_link(bot: object, *, result: dict) -> None:
@@ -92,25 +94,35 @@ async def maybe_dm_reviewee_with_respond_link(bot: object, *, result: dict) -> N
         kwargs = {"parse_mode": "HTML"}
         if keyboard is not None:
             kwargs["reply_markup"] = keyboard
-        await send_message(reviewee_tid, "\n".join(lines), **kwargs)
 
-        # Mark the user as pending a review response.
-        # The next message they send will be captured as their response.
-        _PENDING_REVIEW_RESPONSE[reviewee_tid] = review_id
+        async def deliver() -> None:
+            await send_message(reviewee_tid, "\n".join(lines), **kwargs)
+            # Mark the user as pending a review response.
+            # The next message they send will be captured as their response.
+            await set_pending_review_response(reviewee_tid, review_id)
+
+        send_notification(deliver())
     except Exception:
         return
 
 
-def get_pending_review_response(user_id: int) -> str | None:
+async def set_pending_review_response(user_id: int, review_id: str) -> None:
+    """
+    Capture the user's next DM as their public response to `review_id`.
+    """
+    await state_store.set(_PENDING_REVIEW_RESPONSE, user_id, review_id)
+
+
+async def get_pending_review_response(user_id: int) -> str | None:
     """
     Check if a user has a pending review response.
     Returns the review_id if they do, None otherwise.
     """
-    return _PENDING_REVIEW_RESPONSE.get(user_id)
+    return await state_store.get(_PENDING_REVIEW_RESPONSE, user_id)
 
 
-def clear_pending_review_response(user_id: int) -> None:
+async def clear_pending_review_response(user_id: int) -> None:
     """
     Clear a user's pending review response state.
     """
-    _PENDING_REVIEW_RESPONSE.pop(user_id, None)
+    await state_store.delete(_PENDING_REVIEW_RESPONSE, user_id)
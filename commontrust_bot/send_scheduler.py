@@ -0,0 +1,253 @@
+"""Outbound Telegram send scheduling: flood-limit token buckets, priority lanes, RetryAfter."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Callable, Coroutine, Iterator
+from contextvars import ContextVar
+from typing import Any
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from commontrust_bot.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: replies to what a user just did go ahead of fan-out notifications.
+INTERACTIVE = 0
+NOTIFICATION = 1
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+# Methods that post or change messages in a chat; lookups such as getChatMember aren't limited.
+_SEND_PREFIXES = ("send", "copy", "forward", "edit")
+_UNLIMITED_METHODS = {"sendChatAction"}
+
+
+@contextlib.contextmanager
+def notification_priority() -> Iterator[None]:
+    """Send everything in this block (and tasks it starts) in the notification lane."""
+    token = _send_priority.set(NOTIFICATION)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+_notifications: set[asyncio.Task] = set()
+
+
+def send_notification(send: Coroutine[Any, Any, Any]) -> asyncio.Task:
+    """Run `send` in the notification lane as a tracked background task instead of awaiting it.
+
+    A RetryAfter on a notification can hold its sender for `max_retries` pauses; the handler
+    that queued it (and, in webhook mode, the rest of its chat's updates) shouldn't wait for
+    that. Notifications are best-effort: failures are logged, not raised.
+    """
+
+    async def run() -> None:
+        with notification_priority():
+            try:
+                await send
+            except Exception:
+                logger.warning("Notification failed", exc_info=True)
+
+    task = asyncio.create_task(run())
+    _notifications.add(task)
+    task.add_done_callback(_notifications.discard)
+    return task
+
+
+async def drain_notifications(timeout: float | None = None) -> None:
+    """Wait for notifications still being sent, e.g. before closing the bot session."""
+    if _notifications:
+        await asyncio.wait(set(_notifications), timeout=timeout)
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `capacity`. Waiters are served by priority, then FIFO."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def idle(self) -> bool:
+        return not self._waiters and self._delay() == 0 and self._tokens >= self.capacity
+
+    def pause(self, seconds: float) -> None:
+        """Hand out nothing for `seconds` (Telegram asked us to back off), then start empty."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        if not self._waiters and self._delay() == 0:
+            self._tokens -= 1
+            return
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self) -> None:
+        while self._waiters:
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # the sender was cancelled while waiting
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Session middleware pacing every message the bot sends against Telegram's flood limits.
+
+    A send first waits for its chat's bucket (about 1/s in private chats, 20/min in groups), then
+    for the global bucket (30/s), so a busy chat never holds a global slot. Within a bucket,
+    INTERACTIVE sends go before NOTIFICATION ones. A RetryAfter pauses the chat's bucket for
+    the requested time, or the global bucket when the global limit was hit (see `_pause`), and
+    the send is retried, up to `max_retries` times.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_rate, clock) if global_rate > 0 else None
+        self._chats: dict[int | str, TokenBucket] = {}
+        # (chat id, end of its pause) for the last RetryAfter.
+        self._last_retry_after: tuple[int | str, float] | None = None
+        self._stats = {
+            "sent_interactive": 0,
+            "sent_notification": 0,
+            "retry_after": 0,
+            "global_pauses": 0,
+            "throttled": 0,
+            "wait_seconds": 0.0,
+        }
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket | None:
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            return bucket
+        # Negative ids and @usernames are groups and channels.
+        is_group = not isinstance(chat_id, int) or chat_id < 0
+        rate = self.group_rate if is_group else self.chat_rate
+        if rate <= 0:
+            return None
+        if len(self._chats) >= self.max_chats:
+            self._chats = {cid: b for cid, b in self._chats.items() if not b.idle()}
+        bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst, self._clock)
+        return bucket
+
+    async def __call__(self, make_request: Any, bot: Any, method: Any) -> Any:
+        api_method = getattr(method, "__api_method__", "")
+        chat_id = getattr(method, "chat_id", None)
+        if (
+            chat_id is None
+            or not api_method.startswith(_SEND_PREFIXES)
+            or api_method in _UNLIMITED_METHODS
+        ):
+            return await make_request(bot, method)
+
+        priority = _send_priority.get()
+        bucket = self._chat_bucket(chat_id)
+        attempt = 0
+        while True:
+            started = self._clock()
+            if bucket is not None:
+                await bucket.acquire(priority)
+            if self._global is not None:
+                await self._global.acquire(priority)
+            waited = self._clock() - started
+            if waited > 0.001:
+                self._stats["throttled"] += 1
+                self._stats["wait_seconds"] += waited
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._stats["retry_after"] += 1
+                if attempt >= self.max_retries or (bucket is None and self._global is None):
+                    raise
+                scope = self._pause(chat_id, bucket, e.retry_after)
+                logger.warning(
+                    "Flood control (%s) on %s in chat %s, retrying in %ss", scope, api_method,
+                    chat_id, e.retry_after,
+                )
+                attempt += 1
+                continue
+            self._stats["sent_interactive" if priority == INTERACTIVE else "sent_notification"] += 1
+            return response
+
+    def _pause(self, chat_id: int | str, bucket: TokenBucket | None, seconds: float) -> str:
+        # Telegram doesn't say which limit was hit. One chat flooding is that chat's limit; a
+        # second chat hitting one while the first is still paused (or no chat bucket to blame)
+        # means the global limit, which pauses every send.
+        now = self._clock()
+        last = self._last_retry_after
+        self._last_retry_after = (chat_id, now + seconds)
+        is_global = bucket is None or (last is not None and last[0] != chat_id and now < last[1])
+        if bucket is not None:
+            bucket.pause(seconds)
+        if is_global and self._global is not None:
+            self._global.pause(seconds)
+            self._stats["global_pauses"] += 1
+            return "global"
+        return "chat"
+
+    def stats(self) -> dict[str, float]:
+        waiting = sum(b.waiting for b in self._chats.values())
+        if self._global is not None:
+            waiting += self._global.waiting
+        return {**self._stats, "waiting": waiting, "chats": len(self._chats)}
+
+
+send_scheduler = SendScheduler(
+    global_rate=settings.send_global_rate,
+    chat_rate=settings.send_chat_rate,
+    group_rate=settings.send_group_rate_per_minute / 60,
+    max_retries=settings.send_max_retries,
+)
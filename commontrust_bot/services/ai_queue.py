@@ -0,0 +1,241 @@
+"""Durable queue and bounded worker pool for AI report analysis."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from commontrust_bot.config import settings
+from commontrust_bot.services.report import ReportService, report_service
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_review_jobs (
+    report_id TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT
+)
+"""
+
+
+class AIReviewQueue:
+    """Report ids waiting for AI analysis, kept in SQLite so a restart doesn't drop them.
+
+    A job stays in the table until it is finished; `claim` only hides it from the other workers
+    of this process. With the default in-memory database nothing survives a restart, but
+    `recover` re-queues every report PocketBase still has in pending_ai.
+    """
+
+    def __init__(self, path: str = "", clock: Callable[[], float] = time.time):
+        self.path = path or ":memory:"
+        self._clock = clock
+        self._conn: sqlite3.Connection | None = None
+        # sqlite3 connections aren't safe to use from two threads at once.
+        self._lock = threading.Lock()
+        self._claimed: set[str] = set()
+
+    def _execute(self, sql: str, params: tuple[Any, ...] = ()) -> list[tuple[Any, ...]]:
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute(_SCHEMA)
+            with self._conn:
+                return self._conn.execute(sql, params).fetchall()
+
+    async def _run(self, sql: str, params: tuple[Any, ...] = ()) -> list[tuple[Any, ...]]:
+        # Commits fsync; keep them off the event loop.
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def put(self, report_id: str) -> None:
+        await self._run(
+            "INSERT OR IGNORE INTO ai_review_jobs (report_id, next_attempt_at) VALUES (?, ?)",
+            (report_id, self._clock()),
+        )
+
+    async def claim(self) -> tuple[str, int] | None:
+        """Return the oldest due (report_id, attempts) not already being worked on."""
+        rows = await self._run(
+            "SELECT report_id, attempts FROM ai_review_jobs WHERE next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (self._clock(), len(self._claimed) + 1),
+        )
+        for report_id, attempts in rows:
+            if report_id not in self._claimed:
+                self._claimed.add(report_id)
+                return report_id, int(attempts)
+        return None
+
+    async def next_due_in(self) -> float | None:
+        """Seconds until the next unclaimed job is due, or None if there is none."""
+        rows = await self._run(
+            "SELECT report_id, next_attempt_at FROM ai_review_jobs "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (len(self._claimed) + 1,),
+        )
+        for report_id, next_attempt_at in rows:
+            if report_id not in self._claimed:
+                return max(0.0, float(next_attempt_at) - self._clock())
+        return None
+
+    async def retry(self, report_id: str, attempts: int, delay: float, error: str) -> None:
+        await self._run(
+            "UPDATE ai_review_jobs SET attempts = ?, next_attempt_at = ?, last_error = ? "
+            "WHERE report_id = ?",
+            (attempts, self._clock() + delay, error[:500], report_id),
+        )
+        self._claimed.discard(report_id)
+
+    async def done(self, report_id: str) -> None:
+        await self._run("DELETE FROM ai_review_jobs WHERE report_id = ?", (report_id,))
+        self._claimed.discard(report_id)
+
+    def release(self, report_id: str) -> None:
+        self._claimed.discard(report_id)
+
+    async def pending_count(self) -> int:
+        rows = await self._run("SELECT COUNT(*) FROM ai_review_jobs")
+        return int(rows[0][0])
+
+    async def recover(self, pb: Any) -> int:
+        """Queue every report still in pending_ai (e.g. submitted just before a crash)."""
+        count = 0
+        async for report in pb.iter_records("reports", filter='status="pending_ai"'):
+            await self.put(str(report["id"]))
+            count += 1
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class AIReviewWorkerPool:
+    """Runs queued report analyses with at most `concurrency` LLM calls in flight.
+
+    Handlers only `submit` a report id. Failed calls are retried with exponential backoff;
+    after `max_attempts` the report goes to admins without an assessment, like any finished
+    analysis, through the `notify` callback.
+    """
+
+    def __init__(
+        self,
+        queue: AIReviewQueue,
+        reports: ReportService | None = None,
+        concurrency: int = 2,
+        max_attempts: int = 5,
+        retry_base_delay: float = 30.0,
+        retry_max_delay: float = 900.0,
+        idle_poll_seconds: float = 60.0,
+    ):
+        self.queue = queue
+        self.reports = reports or report_service
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.idle_poll_seconds = idle_poll_seconds
+        self._notify: Callable[[dict[str, Any]], Awaitable[None]] | None = None
+        self._wake = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    async def start(
+        self, notify: Callable[[dict[str, Any]], Awaitable[None]] | None = None
+    ) -> None:
+        self._notify = notify
+        try:
+            recovered = await self.queue.recover(self.reports.pb)
+            if recovered:
+                logger.info("Queued %d report(s) still waiting for AI analysis", recovered)
+        except Exception as e:
+            logger.error("Could not re-queue pending AI reviews: %s", e)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def submit(self, report_id: str) -> None:
+        await self.queue.put(report_id)
+        self._wake.set()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error("AI review queue read failed: %s", e)
+                job = None
+            if job is None:
+                await self._idle()
+                continue
+            try:
+                await self._process(*job)
+            except Exception as e:
+                logger.error("AI review job for report %s failed: %s", job[0], e)
+                self.queue.release(job[0])
+            # A retry may now be the earliest job; let idle siblings recompute their wait.
+            self._wake.set()
+
+    async def _idle(self) -> None:
+        # Clear before the await: a submit() landing while next_due_in() runs must stay set.
+        self._wake.clear()
+        try:
+            due_in = await self.queue.next_due_in()
+        except Exception:
+            due_in = None
+        timeout = self.idle_poll_seconds if due_in is None else min(due_in, self.idle_poll_seconds)
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._wake.wait(), timeout=max(timeout, 0.01))
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1))
+        return delay * (1 + random.random() / 4)
+
+    async def _process(self, report_id: str, attempts: int) -> None:
+        try:
+            report = await self.reports.trigger_ai_review(report_id, raise_errors=True)
+        except Exception as e:
+            attempts += 1
+            if attempts < self.max_attempts:
+                delay = self._backoff(attempts)
+                logger.warning(
+                    "AI review of report %s failed (attempt %d), retrying in %.0fs: %s",
+                    report_id, attempts, delay, e,
+                )
+                await self.queue.retry(report_id, attempts, delay, str(e))
+                return
+            logger.error("AI review failed for report %s: %s", report_id, e)
+            try:
+                report = await self.reports.mark_ai_failed(report_id, str(e))
+            except Exception as e2:
+                # Still pending_ai in PocketBase, so the next start re-queues it via recover().
+                logger.error("Could not hand report %s to admins: %s", report_id, e2)
+                report = None
+
+        await self.queue.done(report_id)
+        if report is not None and self._notify is not None:
+            try:
+                await self._notify(report)
+            except Exception as e:
+                logger.warning("Could not notify admins about report %s: %s", report_id, e)
+
+
+ai_review_pool = AIReviewWorkerPool(
+    AIReviewQueue(settings.ai_review_queue_path),
+    concurrency=settings.ai_review_concurrency,
+    max_attempts=settings.ai_review_max_attempts,
+    retry_base_delay=settings.ai_review_retry_base_seconds,
+)
@@ -14,6 +14,13 @@ logger = logging.getLogger(__name__)
 
 VENICE_API_URL = "https://api.venice.ai/api/v1/chat/completions"
 
+# One keep-alive client for every analysis; created on first use, closed on shutdown.
+_client: httpx.AsyncClient | None = None
+
+
+class AIReviewError(Exception):
+    """The analysis call failed in a way worth retrying (network error, 429, 5xx)."""
+
 SYSTEM_PROMPT = (
     "You are a trust and safety analyst for a peer-to-peer trading community on Telegram. "
     "Your job is to evaluate scam reports submitted by community members. "
@@ -65,6 +72,20 @@ class AIReviewResult:
     model_used: str = ""
 
 
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=60.0)
+    return _client
+
+
+async def aclose() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 async def analyze_report(
     *,
     description: str,
@@ -78,8 +99,13 @@ async def analyze_report(
     deal_description: str | None = None,
     forwarded_messages: list[dict] | None = None,
     photo_count: int = 0,
+    raise_errors: bool = False,
 ) -> AIReviewResult:
-    """Run AI analysis on a report via Venice.ai. Returns a result even if the call fails."""
+    """Run AI analysis on a report via Venice.ai. Returns a result even if the call fails.
+
+    With `raise_errors`, retryable failures raise AIReviewError instead so the caller can try
+    again later.
+    """
     if not settings.venice_api_key:
         return AIReviewResult(
             summary="AI analysis unavailable (no VENICE_API_KEY configured).",
@@ -102,26 +128,27 @@ async def analyze_report(
 
     model = settings.ai_model or "llama-3.3-70b"
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(
-                VENICE_API_URL,
-                headers={
-                    "Authorization": f"Bearer {settings.venice_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": model,
-                    "messages": [
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt},
-                    ],
-                    "temperature": 0.1,
-                },
-            )
-            resp.raise_for_status()
-            content = resp.json()["choices"][0]["message"]["content"]
-            return _parse_response(content, model)
+        resp = await _get_client().post(
+            VENICE_API_URL,
+            headers={
+                "Authorization": f"Bearer {settings.venice_api_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                "temperature": 0.1,
+            },
+        )
+        resp.raise_for_status()
+        content = resp.json()["choices"][0]["message"]["content"]
+        return _parse_response(content, model)
     except Exception as e:
+        if raise_errors and _is_retryable(e):
+            raise AIReviewError(str(e)) from e
         logger.error("Venice.ai report analysis failed: %s", e)
         return AIReviewResult(
             summary=f"AI analysis failed: {e}",
@@ -129,6 +156,13 @@ async def analyze_report(
         )
 
 
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
 def _build_prompt(
     *,
     description: str,
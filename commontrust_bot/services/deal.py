@@ -3,7 +3,7 @@ from datetime import datetime
 from enum import Enum
 
 from commontrust_bot.pocketbase_client import pb_client
-from commontrust_bot.services.reputation import reputation_service
+from commontrust_bot.services.reputation import ReviewDelta, reputation_service
 
 
 class DealStatus(str, Enum):
@@ -299,7 +299,9 @@ class DealService:
 
         # Relation filter behavior can vary by backend shape (string vs 1-item list),
         # so inspect all reviews for this deal and find the current reviewer's record.
-        existing_reviews = await self.pb.list_records("reviews", filter=f'deal_id="{deal_id}"')
+        existing_reviews = await self.pb.list_records(
+            "reviews", filter=f'deal_id="{deal_id}"', consistency="strong"
+        )
         existing_items = existing_reviews.get("items", [])
         existing_reviewer_ids = {self._relation_id(r.get("reviewer_id")) for r in existing_items}
         existing_review = next(
@@ -345,13 +347,37 @@ class DealService:
             and counterparty_id in current_reviewer_ids
         )
 
-        # Recompute for both participants:
-        # When the second party submits their review, the deal becomes "fully reviewed"
-        # and the other party's incoming review becomes visible for reputation purposes.
-        await asyncio.gather(
-            self.reputation.calculate_reputation(initiator_id),
-            self.reputation.calculate_reputation(counterparty_id),
-        )
+        # Apply the change to the persisted reputation aggregates instead of recomputing:
+        # when the second party submits their review, the deal becomes "fully reviewed"
+        # and both reviews become visible; later edits only shift the rating sum.
+        deltas: dict[str, list[ReviewDelta]] = {}
+        if is_fully_reviewed and not was_fully_reviewed:
+            for r in existing_items:
+                if r is existing_review:
+                    continue
+                r_reviewer = self._relation_id(r.get("reviewer_id"))
+                r_reviewee = self._relation_id(r.get("reviewee_id"))
+                r_rating = r.get("rating")
+                if r_reviewer and r_reviewee and isinstance(r_rating, int):
+                    deltas.setdefault(r_reviewee, []).append(
+                        ReviewDelta(r_reviewer, deal_id, r_rating, 1)
+                    )
+            deltas.setdefault(reviewee_id, []).append(ReviewDelta(reviewer_id, deal_id, rating, 1))
+        elif was_fully_reviewed:
+            previous_rating = existing_review.get("rating") if review_updated else None
+            if isinstance(previous_rating, int):
+                delta = ReviewDelta(reviewer_id, deal_id, rating - previous_rating, 0)
+            else:
+                delta = ReviewDelta(reviewer_id, deal_id, rating, 1)
+            deltas.setdefault(reviewee_id, []).append(delta)
+
+        if deltas:
+            await asyncio.gather(
+                *(
+                    self.reputation.apply_review_deltas(member_id, ds)
+                    for member_id, ds in deltas.items()
+                )
+            )
 
         return {
             "review": review,
@@ -376,7 +402,9 @@ class DealService:
         if not initiator_id or not counterparty_id:
             return []
 
-        result = await self.pb.list_records("reviews", filter=f'deal_id="{deal_id}"')
+        result = await self.pb.list_records(
+            "reviews", filter=f'deal_id="{deal_id}"', consistency="strong"
+        )
         items = result.get("items", [])
 
         # Hide reviews until both specific participants have submitted reviews.
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import zlib
+from collections.abc import AsyncIterator, Hashable
+
+from commontrust_bot.config import settings
+
+
+class AccountLockManager:
+    """Serializes balance read-modify-write cycles per ledger account.
+
+    Keys (typically `(mc_group_id, member_id)`) are hashed onto a fixed set of stripes so memory
+    stays bounded. `hold()` takes every stripe a call needs in ascending order, so two payments
+    touching the same pair of accounts in opposite directions cannot deadlock.
+
+    With `lock_dir` set, each stripe is additionally guarded by an `fcntl` file lock so several
+    bot processes on the same host exclude each other too. Managers that must not contend with
+    each other (see `member_locks`) use a different `prefix` for their lock files.
+    """
+
+    def __init__(self, stripes: int = 1024, lock_dir: str | None = None, prefix: str = "ledger"):
+        if stripes <= 0:
+            raise ValueError("stripes must be positive")
+        self.stripes = stripes
+        self.lock_dir = lock_dir
+        self.prefix = prefix
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+        if lock_dir:
+            import fcntl  # noqa: F401  (POSIX only; fail early rather than on first payment)
+
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def _stripe(self, key: Hashable) -> int:
+        # Stable across processes (unlike hash()), which the file-lock backend relies on.
+        return zlib.crc32(repr(key).encode("utf-8")) % self.stripes
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *keys: Hashable) -> AsyncIterator[None]:
+        stripes = sorted({self._stripe(k) for k in keys})
+        async with contextlib.AsyncExitStack() as stack:
+            for stripe in stripes:
+                await stack.enter_async_context(self._locks[stripe])
+                if self.lock_dir:
+                    await stack.enter_async_context(self._file_lock(stripe))
+            yield
+
+    @contextlib.asynccontextmanager
+    async def _file_lock(self, stripe: int) -> AsyncIterator[None]:
+        import fcntl
+
+        path = os.path.join(self.lock_dir or "", f"{self.prefix}-{stripe:04d}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # flock blocks; keep the event loop free while another process holds the stripe.
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+account_locks = AccountLockManager(lock_dir=settings.ledger_lock_dir or None)
+# Reputation aggregate updates, keyed by member id. Separate stripes, so a credit limit refresh
+# that reads reputation while holding an account lock can never wait on itself.
+member_locks = AccountLockManager(lock_dir=settings.ledger_lock_dir or None, prefix="reputation")
@@ -1,4 +1,5 @@
-from commontrust_bot.pocketbase_client import pb_client
+from commontrust_bot.pocketbase_client import PocketBaseDuplicateError, pb_client
+from commontrust_bot.services.locks import AccountLockManager, account_locks
 from commontrust_bot.services.reputation import reputation_service
 
 
@@ -7,10 +8,11 @@ class InsufficientCreditError(Exception):
 
 
 class MutualCreditService:
-    def __init__(self, pb=None, reputation=None):
+    def __init__(self, pb=None, reputation=None, locks: AccountLockManager | None = None):
         # Allow injection for tests; default to global singletons.
         self.pb = pb or pb_client
         self.reputation = reputation or reputation_service
+        self.locks = locks or account_locks
 
     async def get_or_create_mc_group(
         self, group_id: str, currency_name: str = "Credit", currency_symbol: str = "Cr"
@@ -67,6 +69,7 @@ class MutualCreditService:
         payee_member_id: str,
         amount: int,
         description: str | None = None,
+        idempotency_key: str | None = None,
     ) -> dict:
         if amount <= 0:
             raise ValueError("Amount must be positive")
@@ -74,14 +77,45 @@ class MutualCreditService:
         if payer_member_id == payee_member_id:
             raise ValueError("Cannot pay yourself")
 
+        # Balances are read, checked and written back; hold both accounts for the whole cycle.
+        async with self.locks.hold((mc_group_id, payer_member_id), (mc_group_id, payee_member_id)):
+            return await self._create_payment_locked(
+                mc_group_id, payer_member_id, payee_member_id, amount, description, idempotency_key
+            )
+
+    async def _create_payment_locked(
+        self,
+        mc_group_id: str,
+        payer_member_id: str,
+        payee_member_id: str,
+        amount: int,
+        description: str | None,
+        idempotency_key: str | None,
+    ) -> dict:
+        # Insert-first: the unique (mc_group_id, idempotency_key) index rejects a replayed payment.
         payer_account = await self.get_or_create_account(mc_group_id, payer_member_id)
         payee_account = await self.get_or_create_account(mc_group_id, payee_member_id)
 
+        if idempotency_key and not await self.pb.mc_idempotency_indexed():
+            # Without the unique index a replay would post again; look the key up first.
+            replay = await self._already_applied(
+                mc_group_id, payer_account, payee_account, idempotency_key
+            )
+            if replay is not None:
+                return replay
+
         payer_balance = payer_account.get("balance", 0)
         payer_credit_limit = payer_account.get("credit_limit", 0)
         payer_available = payer_balance + payer_credit_limit
 
         if payer_available < amount:
+            # A replay of an applied payment can fail the credit check on its own debit.
+            if idempotency_key:
+                replay = await self._already_applied(
+                    mc_group_id, payer_account, payee_account, idempotency_key
+                )
+                if replay is not None:
+                    return replay
             raise InsufficientCreditError(
                 f"Insufficient credit. Available: {payer_available}, Required: {amount}"
             )
@@ -89,51 +123,67 @@ class MutualCreditService:
         new_payer_balance = payer_balance - amount
         new_payee_balance = payee_account.get("balance", 0) + amount
 
-        transaction = await self.pb.mc_transaction_create(
-            mc_group_id=mc_group_id,
-            payer_id=payer_member_id,
-            payee_id=payee_member_id,
-            amount=amount,
-            description=description,
-        )
-
-        transaction_id = transaction.get("id")
-
-        payer_entry = await self.pb.mc_entry_create(
-            transaction_id=transaction_id,
-            account_id=payer_account.get("id"),
-            amount=-amount,
-            balance_after=new_payer_balance,
-        )
-
-        payee_entry = await self.pb.mc_entry_create(
-            transaction_id=transaction_id,
-            account_id=payee_account.get("id"),
-            amount=amount,
-            balance_after=new_payee_balance,
-        )
-
-        await self.pb.mc_account_update(payer_account.get("id"), new_payer_balance)
-        await self.pb.mc_account_update(payee_account.get("id"), new_payee_balance)
+        # Posted atomically in one round-trip (transaction, both entries, both balances).
+        try:
+            posted = await self.pb.mc_payment_create(
+                mc_group_id=mc_group_id,
+                payer_id=payer_member_id,
+                payee_id=payee_member_id,
+                payer_account_id=payer_account.get("id"),
+                payee_account_id=payee_account.get("id"),
+                amount=amount,
+                new_payer_balance=new_payer_balance,
+                new_payee_balance=new_payee_balance,
+                description=description,
+                idempotency_key=idempotency_key,
+            )
+        except PocketBaseDuplicateError:
+            if not idempotency_key:
+                raise
+            replay = await self._already_applied(
+                mc_group_id, payer_account, payee_account, idempotency_key
+            )
+            if replay is None:
+                raise
+            return replay
 
         return {
-            "transaction": transaction,
-            "payer_entry": payer_entry,
-            "payee_entry": payee_entry,
+            "transaction": posted["transaction"],
+            "payer_entry": posted["payer_entry"],
+            "payee_entry": posted["payee_entry"],
             "new_payer_balance": new_payer_balance,
             "new_payee_balance": new_payee_balance,
         }
 
+    async def _already_applied(
+        self, mc_group_id: str, payer_account: dict, payee_account: dict, idempotency_key: str
+    ) -> dict | None:
+        existing = await self.pb.mc_transaction_get_by_idempotency(mc_group_id, idempotency_key)
+        if not existing:
+            return None
+        return {
+            "transaction": existing,
+            "payer_entry": None,
+            "payee_entry": None,
+            "new_payer_balance": payer_account.get("balance", 0),
+            "new_payee_balance": payee_account.get("balance", 0),
+            "already_applied": True,
+        }
+
     async def verify_zero_sum(self, mc_group_id: str) -> dict:
-        result = await self.pb.list_records("mc_accounts", filter=f'mc_group_id="{mc_group_id}"', per_page=500)
-        accounts = result.get("items", [])
+        # Streamed so groups with more than one page of accounts are counted in full.
+        total_balance = 0
+        account_count = 0
+        async for account in self.pb.iter_records(
+            "mc_accounts", filter=f'mc_group_id="{mc_group_id}"'
+        ):
+            total_balance += account.get("balance", 0)
+            account_count += 1
 
-        total_balance = sum(acc.get("balance", 0) for acc in accounts)
-        
         return {
             "is_zero_sum": total_balance == 0,
             "total_balance": total_balance,
-            "account_count": len(accounts),
+            "account_count": account_count,
         }
 
     async def get_transaction_history(
@@ -146,8 +196,12 @@ class MutualCreditService:
         return result.get("items", [])
 
     async def update_credit_limit(self, mc_group_id: str, member_id: str, new_limit: int) -> dict:
-        account = await self.get_or_create_account(mc_group_id, member_id)
-        return await self.pb.mc_account_update(account.get("id"), account.get("balance", 0), new_limit)
+        # Writes the balance back too, so it must not interleave with a payment.
+        async with self.locks.hold((mc_group_id, member_id)):
+            account = await self.get_or_create_account(mc_group_id, member_id)
+            return await self.pb.mc_account_update(
+                account.get("id"), account.get("balance", 0), new_limit
+            )
 
     async def recalculate_credit_limit(self, mc_group_id: str, member_id: str) -> dict:
         rep = await self.reputation.get_reputation(member_id)
@@ -4,8 +4,10 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from collections.abc import Awaitable, Callable
 from datetime import datetime
-from typing import Any
+from functools import partial
+from typing import Any, BinaryIO
 
 from commontrust_bot.pocketbase_client import pb_client
 from commontrust_bot.services.ai_review import analyze_report
@@ -25,11 +27,15 @@ class ReportService:
         reporter_telegram_id: int,
         reported_telegram_id: int,
         description: str,
-        photo_data: list[tuple[str, bytes, str]] | None = None,
+        photo_data: list[tuple[str, bytes | BinaryIO, str]] | None = None,
         forwarded_messages: list[dict] | None = None,
         deal_id: str | None = None,
     ) -> dict[str, Any]:
-        """Create a report record with optional file uploads. Returns the PB record."""
+        """Create a report record with optional file uploads. Returns the PB record.
+
+        Photo contents may be open binary files; they are streamed into the upload, not read
+        into memory. The caller keeps ownership and closes them.
+        """
         reporter = await self.reputation.get_or_create_member(reporter_telegram_id)
         reported = await self.reputation.get_or_create_member(reported_telegram_id)
 
@@ -43,7 +49,7 @@ class ReportService:
         if deal_id:
             data["deal_id"] = deal_id
 
-        files: list[tuple[str, str, bytes, str]] = []
+        files: list[tuple[str, str, bytes | BinaryIO, str]] = []
         for filename, content, mime in (photo_data or []):
             files.append(("evidence_photos", filename, content, mime))
 
@@ -54,27 +60,23 @@ class ReportService:
 
         return record
 
-    async def trigger_ai_review(self, report_id: str) -> dict[str, Any]:
-        """Run AI analysis and update the report. Returns the updated record."""
-        report = await self.pb.get_record("reports", report_id)
-
-        reporter = await self.pb.get_record("members", report["reporter_id"])
-        reported = await self.pb.get_record("members", report["reported_id"])
-
-        reporter_stats = await self.reputation.get_member_stats(reporter["id"])
-        reported_stats = await self.reputation.get_member_stats(reported["id"])
-        reporter_rep = reporter_stats.get("reputation", {})
-        reported_rep = reported_stats.get("reputation", {})
+    async def trigger_ai_review(
+        self, report_id: str, raise_errors: bool = False
+    ) -> dict[str, Any] | None:
+        """Run AI analysis and update the report. Returns the updated record.
 
-        prior_reports = await self.get_reports_against(reported["id"])
+        Returns None if the report is no longer waiting for analysis (e.g. a queued job that
+        already ran before a restart). With `raise_errors`, a retryable LLM failure raises
+        AIReviewError and leaves the report in pending_ai.
+        """
+        report = await self.pb.get_record("reports", report_id)
+        if report.get("status") != "pending_ai":
+            return None
 
-        deal_description = None
-        if report.get("deal_id"):
-            try:
-                deal = await self.pb.deal_get(report["deal_id"])
-                deal_description = (deal or {}).get("description")
-            except Exception:
-                pass
+        ctx = await self._review_context(report)
+        reporter, reported = ctx["reporter"], ctx["reported"]
+        reporter_rep = ctx["reporter_rep"] or {}
+        reported_rep = ctx["reported_rep"] or {}
 
         forwarded = report.get("forwarded_messages") or []
         photo_count = len(report.get("evidence_photos") or [])
@@ -87,10 +89,11 @@ class ReportService:
             reported_name=reported.get("display_name") or reported.get("username") or "Unknown",
             reported_deals=reported_rep.get("verified_deals", 0),
             reported_rating=reported_rep.get("avg_rating", 0.0),
-            prior_reports=len(prior_reports),
-            deal_description=deal_description,
+            prior_reports=ctx["prior_reports"],
+            deal_description=ctx["deal_description"],
             forwarded_messages=forwarded,
             photo_count=photo_count,
+            raise_errors=raise_errors,
         )
 
         update_data: dict[str, Any] = {
@@ -103,6 +106,53 @@ class ReportService:
         }
         return await self.pb.update_record("reports", report_id, update_data)
 
+    async def _review_context(self, report: dict[str, Any]) -> dict[str, Any]:
+        """Fetch everything the analysis prompt needs besides the report, in one wave.
+
+        Each lookup depends only on the report, so they all run concurrently. Lookups are keyed,
+        so a record needed twice (a member reporting themselves) is fetched once. Reputation
+        comes from the stored aggregate rather than a recompute.
+        """
+        reporter_id, reported_id = report["reporter_id"], report["reported_id"]
+        lookups: dict[tuple[str, str], Callable[[], Awaitable[Any]]] = {
+            ("member", reporter_id): partial(self.pb.get_record, "members", reporter_id),
+            ("member", reported_id): partial(self.pb.get_record, "members", reported_id),
+            ("reputation", reporter_id): partial(self.reputation.get_reputation, reporter_id),
+            ("reputation", reported_id): partial(self.reputation.get_reputation, reported_id),
+            ("reports_against", reported_id): partial(self.count_reports_against, reported_id),
+            ("deal", report.get("deal_id") or ""): partial(
+                self._deal_description, report.get("deal_id")
+            ),
+        }
+        results = dict(
+            zip(lookups, await asyncio.gather(*(f() for f in lookups.values())), strict=True)
+        )
+        return {
+            "reporter": results[("member", reporter_id)],
+            "reported": results[("member", reported_id)],
+            "reporter_rep": results[("reputation", reporter_id)],
+            "reported_rep": results[("reputation", reported_id)],
+            "prior_reports": results[("reports_against", reported_id)],
+            "deal_description": results[("deal", report.get("deal_id") or "")],
+        }
+
+    async def _deal_description(self, deal_id: str | None) -> str | None:
+        if not deal_id:
+            return None
+        try:
+            deal = await self.pb.deal_get(deal_id)
+        except Exception:
+            return None
+        return (deal or {}).get("description")
+
+    async def mark_ai_failed(self, report_id: str, error: str) -> dict[str, Any]:
+        """Hand the report to admins without an AI assessment."""
+        return await self.pb.update_record(
+            "reports",
+            report_id,
+            {"status": "pending_admin", "ai_summary": f"AI analysis failed: {error}"},
+        )
+
     async def resolve_report(
         self,
         report_id: str,
@@ -152,6 +202,12 @@ class ReportService:
         )
         return result.get("items", [])
 
+    async def count_reports_against(self, member_id: str) -> int:
+        result = await self.pb.list_records(
+            "reports", per_page=1, filter=f'reported_id="{member_id}"'
+        )
+        return int(result.get("totalItems", len(result.get("items", []))))
+
     async def get_report(self, report_id: str) -> dict[str, Any]:
         return await self.pb.get_record("reports", report_id)
 
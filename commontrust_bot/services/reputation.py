@@ -1,42 +1,142 @@
+import asyncio
 import logging
 from collections.abc import Iterable
+from dataclasses import dataclass
+from urllib.parse import quote
 
 from commontrust_bot.config import settings
 from commontrust_bot.pocketbase_client import pb_client
+from commontrust_bot.services.locks import AccountLockManager, member_locks
 
 logger = logging.getLogger(__name__)
 
 
-def _aggregate_ratings_by_reviewer(reviews: Iterable[dict]) -> dict[str, float]:
+@dataclass(frozen=True)
+class ReviewDelta:
+    """A change to one reviewer's contribution to a member's persisted aggregate."""
+
+    reviewer_id: str
+    deal_id: str
+    rating: int
+    count: int = 0
+
+
+def _reviewer_stats(reviews: Iterable[dict]) -> dict[str, dict[str, int]]:
     # Prevent review farming: multiple reviews from the same reviewer count as one "vote".
-    buckets: dict[str, list[int]] = {}
+    # Keep sums and counts (not averages) so the aggregate can be updated incrementally.
+    stats: dict[str, dict[str, int]] = {}
     for r in reviews:
         reviewer_id = r.get("reviewer_id")
         rating = r.get("rating")
         if not isinstance(reviewer_id, str) or not isinstance(rating, int):
             continue
-        buckets.setdefault(reviewer_id, []).append(rating)
+        entry = stats.setdefault(reviewer_id, {"sum": 0, "count": 0})
+        entry["sum"] += rating
+        entry["count"] += 1
+    return stats
+
+
+def _summarize(aggregate: dict) -> dict:
+    by_reviewer = [
+        s["sum"] / s["count"] for s in aggregate["reviewer_stats"].values() if s.get("count", 0) > 0
+    ]
+    if not by_reviewer:
+        return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
+    return {
+        "verified_deals": len(aggregate["verified_deal_ids"]),
+        "avg_rating": sum(by_reviewer) / len(by_reviewer),
+        "total_reviews": len(by_reviewer),
+    }
+
+
+def _public_stats(aggregate: dict) -> dict:
+    summary = _summarize(aggregate)
+    return {**summary, "avg_rating": round(summary["avg_rating"], 2)}
 
-    out: dict[str, float] = {}
-    for reviewer_id, rs in buckets.items():
-        if not rs:
-            continue
-        out[reviewer_id] = sum(rs) / len(rs)
-    return out
 
+def _stored_aggregate(record: dict | None) -> dict | None:
+    # Reputation records written before aggregates were persisted only carry the summary
+    # numbers; treat those as missing so the caller rebuilds them once.
+    if not isinstance(record, dict):
+        return None
+    reviewer_stats = record.get("reviewer_stats")
+    deal_ids = record.get("verified_deal_ids")
+    if not isinstance(reviewer_stats, dict) or not isinstance(deal_ids, list):
+        return None
+    return {
+        "reviewer_stats": {
+            k: {"sum": int(v.get("sum", 0)), "count": int(v.get("count", 0))}
+            for k, v in reviewer_stats.items()
+            if isinstance(v, dict)
+        },
+        "verified_deal_ids": sorted({d for d in deal_ids if isinstance(d, str)}),
+    }
 
-async def _deal_is_fully_reviewed(pb: object, deal_id: str) -> bool:
+
+# PocketBase filters travel in the query string; keep each OR-chain comfortably below common
+# proxy/server URL limits (measured after URL encoding).
+_MAX_FILTER_URL_LENGTH = 3000
+_REVIEWS_PAGE_SIZE = 500
+
+
+def _relation_id(value: object) -> str | None:
+    if isinstance(value, str) and value:
+        return value
+    if isinstance(value, list) and value:
+        first = value[0]
+        if isinstance(first, str) and first:
+            return first
+    return None
+
+
+def _chunked_or_filters(
+    field: str, values: Iterable[str], max_length: int = _MAX_FILTER_URL_LENGTH
+) -> list[str]:
+    # Build `field="a" || field="b" ...` filters, splitting into as few chunks as fit the limit.
+    separator_cost = len(quote(" || "))
+    filters: list[str] = []
+    terms: list[str] = []
+    length = 0
+    for value in sorted(set(values)):
+        term = f'{field}="{value}"'
+        cost = len(quote(term)) + separator_cost
+        if terms and length + cost > max_length:
+            filters.append(" || ".join(terms))
+            terms, length = [], 0
+        terms.append(term)
+        length += cost
+    if terms:
+        filters.append(" || ".join(terms))
+    return filters
+
+
+async def _fully_reviewed_deal_ids(pb: object, deal_ids: Iterable[str]) -> set[str]:
     # Only expose reviews once both parties have reviewed. For 2-party deals,
     # this means at least 2 distinct reviewers exist for that deal.
-    try:
-        result = await pb.list_records("reviews", filter=f'deal_id="{deal_id}"', per_page=200)
-    except TypeError:
-        # Some PB clients don't accept per_page keyword; fall back.
-        result = await pb.list_records("reviews", filter=f'deal_id="{deal_id}"')
+    # Resolved for all deals at once: one paged query per filter chunk, chunks in parallel.
+    reviewers: dict[str, set[str]] = {}
+
+    async def _scan(filter_str: str) -> None:
+        page = 1
+        while True:
+            result = await pb.list_records(
+                "reviews", page=page, per_page=_REVIEWS_PAGE_SIZE, filter=filter_str
+            )
+            items = result.get("items", []) if isinstance(result, dict) else []
+            for r in items:
+                deal_id = _relation_id(r.get("deal_id"))
+                reviewer_id = _relation_id(r.get("reviewer_id"))
+                if deal_id and reviewer_id:
+                    reviewers.setdefault(deal_id, set()).add(reviewer_id)
+            total_pages = result.get("totalPages") if isinstance(result, dict) else None
+            if len(items) < _REVIEWS_PAGE_SIZE:
+                return
+            if isinstance(total_pages, int) and page >= total_pages:
+                return
+            page += 1
 
-    items = result.get("items", []) if isinstance(result, dict) else []
-    reviewer_ids = {r.get("reviewer_id") for r in items if r.get("reviewer_id")}
-    return len(reviewer_ids) >= 2
+    await asyncio.gather(*(_scan(f) for f in _chunked_or_filters("deal_id", deal_ids)))
+    return {deal_id for deal_id, ids in reviewers.items() if len(ids) >= 2}
 
 
 def _visible_reviews(pb: object, reviews: Iterable[dict], fully_reviewed_deal_ids: set[str]) -> list[dict]:
@@ -50,9 +150,10 @@ def _visible_reviews(pb: object, reviews: Iterable[dict], fully_reviewed_deal_id
 
 
 class ReputationService:
-    def __init__(self, pb=None):
+    def __init__(self, pb=None, locks: AccountLockManager | None = None):
         # Allow injection for tests; default to global singleton.
         self.pb = pb or pb_client
+        self.locks = locks or member_locks
 
     async def get_or_create_member(
         self, telegram_id: int, username: str | None = None, display_name: str | None = None
@@ -62,42 +163,131 @@ class ReputationService:
     async def get_member(self, telegram_id: int) -> dict | None:
         return await self.pb.member_get(telegram_id)
 
-    async def calculate_reputation(self, member_id: str) -> dict:
+    async def _rebuild_aggregate(self, member_id: str) -> dict:
         reviews = await self.pb.reviews_for_member(member_id)
 
-        if not reviews:
-            return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
-
         deal_ids = {r.get("deal_id") for r in reviews if isinstance(r.get("deal_id"), str)}
-        fully_reviewed: set[str] = set()
-        for deal_id in deal_ids:
-            if await _deal_is_fully_reviewed(self.pb, deal_id):
-                fully_reviewed.add(deal_id)
+        fully_reviewed = await _fully_reviewed_deal_ids(self.pb, deal_ids) if deal_ids else set()
 
         visible = _visible_reviews(self.pb, reviews, fully_reviewed)
-        if not visible:
-            return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
-
-        # Average is computed per unique reviewer to avoid review farming between pairs.
-        by_reviewer = _aggregate_ratings_by_reviewer(visible)
-        if not by_reviewer:
-            return {"verified_deals": 0, "avg_rating": 0.0, "total_reviews": 0}
+        return {
+            # Average is computed per unique reviewer to avoid review farming between pairs.
+            "reviewer_stats": _reviewer_stats(visible),
+            "verified_deal_ids": sorted({r["deal_id"] for r in visible}),
+        }
 
-        avg_rating = sum(by_reviewer.values()) / len(by_reviewer)
-        verified_deals = len({r.get("deal_id") for r in visible if r.get("deal_id")})
+    async def _save_aggregate(
+        self, member_id: str, aggregate: dict, record_id: str | None = None
+    ) -> None:
+        summary = _summarize(aggregate)
+        await self.pb.reputation_update(
+            member_id,
+            summary["verified_deals"],
+            summary["avg_rating"],
+            total_reviews=summary["total_reviews"],
+            reviewer_stats=aggregate["reviewer_stats"],
+            verified_deal_ids=aggregate["verified_deal_ids"],
+            record_id=record_id,
+        )
 
-        await self.pb.reputation_update(member_id, verified_deals, avg_rating)
+    async def calculate_reputation(self, member_id: str) -> dict:
+        # Full rebuild from the reviews collection. Also (re)writes the persisted aggregate
+        # that `get_reputation` and `apply_review_deltas` work from.
+        async with self.locks.hold(member_id):
+            return await self._recalculate(member_id)
 
-        return {
-            "verified_deals": verified_deals,
-            "avg_rating": round(avg_rating, 2),
-            "total_reviews": len(by_reviewer),
-        }
+    async def _recalculate(self, member_id: str) -> dict:
+        aggregate = await self._rebuild_aggregate(member_id)
+        await self._save_aggregate(member_id, aggregate)
+        return _public_stats(aggregate)
 
     async def get_reputation(self, member_id: str) -> dict | None:
-        # Always recompute so gating ("both parties reviewed") is enforced even if a stale
-        # record exists in PocketBase.
-        return await self.calculate_reputation(member_id)
+        # One record fetch: the aggregate is kept current by `apply_review_deltas` and only
+        # includes reviews whose deal has been reviewed by both parties.
+        aggregate = _stored_aggregate(await self.pb.reputation_get(member_id))
+        if aggregate is None:
+            return await self.calculate_reputation(member_id)
+        return _public_stats(aggregate)
+
+    async def apply_review_deltas(self, member_id: str, deltas: Iterable[ReviewDelta]) -> dict:
+        # Read-modify-write of the stored aggregate; concurrent reviews of the same member
+        # would otherwise each save their own delta over the other's.
+        async with self.locks.hold(member_id):
+            return await self._apply_review_deltas(member_id, deltas)
+
+    async def _apply_review_deltas(self, member_id: str, deltas: Iterable[ReviewDelta]) -> dict:
+        record = await self.pb.reputation_get(member_id)
+        aggregate = _stored_aggregate(record)
+        if aggregate is None:
+            # Nothing to apply the delta to yet; the rebuild already includes the new review.
+            return await self._recalculate(member_id)
+
+        stats = aggregate["reviewer_stats"]
+        deal_ids = set(aggregate["verified_deal_ids"])
+        for delta in deltas:
+            entry = stats.setdefault(delta.reviewer_id, {"sum": 0, "count": 0})
+            entry["sum"] += delta.rating
+            entry["count"] += delta.count
+            if entry["count"] <= 0:
+                stats.pop(delta.reviewer_id, None)
+            deal_ids.add(delta.deal_id)
+        aggregate["verified_deal_ids"] = sorted(deal_ids)
+
+        await self._save_aggregate(member_id, aggregate, record_id=record.get("id"))
+        return _public_stats(aggregate)
+
+    async def verify_reputation(self, member_id: str) -> bool:
+        """Rebuild a member's aggregate from scratch; repair and return True if it drifted."""
+        async with self.locks.hold(member_id):
+            return await self._verify_reputation(member_id)
+
+    async def _verify_reputation(self, member_id: str) -> bool:
+        record = await self.pb.reputation_get(member_id)
+        stored = _stored_aggregate(record)
+        rebuilt = await self._rebuild_aggregate(member_id)
+        if stored == rebuilt:
+            return False
+
+        logger.warning(
+            "Reputation drift for member %s: stored=%s rebuilt=%s",
+            member_id,
+            _summarize(stored) if stored else None,
+            _summarize(rebuilt),
+        )
+        await self._save_aggregate(member_id, rebuilt, record_id=(record or {}).get("id"))
+        return True
+
+    async def verify_all(self, per_page: int = 200) -> int:
+        drifted = 0
+        page = 1
+        while True:
+            result = await self.pb.list_records("reputation", page=page, per_page=per_page)
+            items = result.get("items", [])
+            for record in items:
+                member_id = record.get("member_id")
+                if isinstance(member_id, list):
+                    member_id = member_id[0] if member_id else None
+                if not isinstance(member_id, str) or not member_id:
+                    continue
+                try:
+                    if await self.verify_reputation(member_id):
+                        drifted += 1
+                except Exception as e:
+                    logger.error(f"Failed to verify reputation for {member_id}: {e}")
+            if len(items) < per_page:
+                return drifted
+            page += 1
+
+    async def run_verifier(self, interval_seconds: float) -> None:
+        # Background safety net for the incremental aggregates (lost updates, manual PB edits).
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                drifted = await self.verify_all()
+                if drifted:
+                    logger.warning(f"Reputation verifier repaired {drifted} aggregate(s)")
+            except Exception as e:
+                logger.error(f"Reputation verifier run failed: {e}")
 
     def compute_credit_limit(self, verified_deals: int, base_limit: int | None = None) -> int:
         base = base_limit or settings.credit_base_limit
@@ -0,0 +1,165 @@
+"""Short-lived per-user conversation state for multi-step DM flows."""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Hashable
+from typing import Any
+
+from commontrust_bot.cache import TTLCache
+from commontrust_bot.config import settings
+
+
+class StateStore(abc.ABC):
+    """Namespaced key -> JSON value store whose entries expire.
+
+    Flows keep their step/draft here instead of in module dicts. Values must be JSON-serializable,
+    and callers write them back after every change, so a backend can live outside the process.
+    """
+
+    @abc.abstractmethod
+    async def get(self, namespace: str, key: Hashable) -> Any | None: ...
+
+    @abc.abstractmethod
+    async def set(self, namespace: str, key: Hashable, value: Any) -> None: ...
+
+    @abc.abstractmethod
+    async def delete(self, namespace: str, key: Hashable) -> None: ...
+
+    @abc.abstractmethod
+    async def clear(self) -> None: ...
+
+    def close(self) -> None:
+        return None
+
+
+class MemoryStateStore(StateStore):
+    """Per-process backend: LRU-bounded to `maxsize` users, each entry expiring after the TTL."""
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl_seconds: float = 604800.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._cache: TTLCache[str] = TTLCache(maxsize, ttl_seconds, clock)
+
+    async def get(self, namespace: str, key: Hashable) -> Any | None:
+        raw = self._cache.get((namespace, str(key)))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        # Stored serialized so mutating a value without saving it behaves like the SQLite backend.
+        self._cache.set((namespace, str(key)), json.dumps(value))
+
+    async def delete(self, namespace: str, key: Hashable) -> None:
+        self._cache.pop((namespace, str(key)))
+
+    async def clear(self) -> None:
+        self._cache.clear()
+
+
+class SQLiteStateStore(StateStore):
+    """File-backed store; survives restarts and can be shared by bot processes on one host.
+
+    Expired rows are ignored on read and purged every `purge_every` writes, which also trims the
+    table back to `maxsize` rows (soonest-expiring first).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        maxsize: int = 10000,
+        ttl_seconds: float = 604800.0,
+        clock: Callable[[], float] = time.time,
+        purge_every: int = 100,
+    ):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+        self._clock = clock
+        self._writes = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_state ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple[Any, ...] = ()) -> list[tuple[Any, ...]]:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                return conn.execute(sql, params).fetchall()
+
+    async def _run(self, sql: str, params: tuple[Any, ...] = ()) -> list[tuple[Any, ...]]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    async def get(self, namespace: str, key: Hashable) -> Any | None:
+        rows = await self._run(
+            "SELECT value FROM conversation_state "
+            "WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, str(key), self._clock()),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, namespace: str, key: Hashable, value: Any) -> None:
+        await self._run(
+            "INSERT OR REPLACE INTO conversation_state (namespace, key, value, expires_at) "
+            "VALUES (?, ?, ?, ?)",
+            (namespace, str(key), json.dumps(value), self._clock() + self.ttl_seconds),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            await self.purge()
+
+    async def delete(self, namespace: str, key: Hashable) -> None:
+        await self._run(
+            "DELETE FROM conversation_state WHERE namespace = ? AND key = ?",
+            (namespace, str(key)),
+        )
+
+    async def purge(self) -> None:
+        await self._run("DELETE FROM conversation_state WHERE expires_at <= ?", (self._clock(),))
+        await self._run(
+            "DELETE FROM conversation_state WHERE rowid IN ("
+            "SELECT rowid FROM conversation_state ORDER BY expires_at "
+            "LIMIT MAX(0, (SELECT COUNT(*) FROM conversation_state) - ?))",
+            (self.maxsize,),
+        )
+
+    async def clear(self) -> None:
+        await self._run("DELETE FROM conversation_state")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def make_state_store() -> StateStore:
+    if settings.state_store_path:
+        return SQLiteStateStore(
+            settings.state_store_path,
+            maxsize=settings.state_max_entries,
+            ttl_seconds=settings.state_ttl_seconds,
+        )
+    return MemoryStateStore(settings.state_max_entries, settings.state_ttl_seconds)
+
+
+state_store = make_state_store()
@@ -0,0 +1 @@
+"""Code shared by the CommonTrust bots and API: metrics, bot instrumentation and webhooks."""
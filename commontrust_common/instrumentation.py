@@ -0,0 +1,145 @@
+"""Per-handler latency and backend round-trip accounting for the bots' aiogram dispatchers.
+
+Shared by `commontrust_bot` and `commontrust_credit_bot`, with the bots' `/metrics` server.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiohttp import web
+
+from commontrust_common.metrics import CONTENT_TYPE, registry
+
+logger = logging.getLogger(__name__)
+
+HANDLER_SECONDS = registry.histogram(
+    "bot_handler_seconds", "Wall time to handle one update, by handler", ["handler"]
+)
+HANDLER_BACKEND_CALLS = registry.histogram(
+    "bot_handler_backend_calls",
+    "Backend round-trips made while handling one update, by handler",
+    ["handler"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34),
+)
+HANDLER_BACKEND_SECONDS = registry.histogram(
+    "bot_handler_backend_seconds",
+    "Time spent waiting on backend round-trips while handling one update, by handler",
+    ["handler"],
+)
+
+
+@dataclass
+class HandlerTrace:
+    handler: str = "unhandled"
+    # (operation, seconds) per backend round-trip, e.g. ("GET members", 0.012).
+    calls: list[tuple[str, float]] = field(default_factory=list)
+
+    def breakdown(self) -> str:
+        totals: dict[str, tuple[int, float]] = {}
+        for operation, seconds in self.calls:
+            count, total = totals.get(operation, (0, 0.0))
+            totals[operation] = (count + 1, total + seconds)
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+        return ", ".join(f"{op} x{count} {total * 1000:.0f}ms" for op, (count, total) in ranked)
+
+
+_current_trace: ContextVar[HandlerTrace | None] = ContextVar("handler_trace", default=None)
+
+
+def record_backend_call(operation: str, seconds: float) -> None:
+    """Attribute one backend round-trip to the update being handled, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.calls.append((operation, seconds))
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Outer update middleware: times each update and logs the slow ones with a breakdown.
+
+    Backend clients report their round-trips through `record_backend_call`; tasks started
+    while handling (e.g. `asyncio.gather`) inherit the trace, so their calls count too.
+    """
+
+    def __init__(
+        self, slow_threshold_seconds: float = 1.0, clock: Callable[[], float] = time.perf_counter
+    ):
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self._clock = clock
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        trace = HandlerTrace()
+        token = _current_trace.set(trace)
+        started = self._clock()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = self._clock() - started
+            _current_trace.reset(token)
+            self._observe(trace, elapsed)
+
+    def _observe(self, trace: HandlerTrace, elapsed: float) -> None:
+        backend_seconds = sum(seconds for _, seconds in trace.calls)
+        HANDLER_SECONDS.observe(elapsed, handler=trace.handler)
+        HANDLER_BACKEND_CALLS.observe(len(trace.calls), handler=trace.handler)
+        HANDLER_BACKEND_SECONDS.observe(backend_seconds, handler=trace.handler)
+        if self.slow_threshold_seconds > 0 and elapsed >= self.slow_threshold_seconds:
+            logger.warning(
+                "Slow handler %s: %.0fms, %d backend call(s) taking %.0fms [%s]",
+                trace.handler,
+                elapsed * 1000,
+                len(trace.calls),
+                backend_seconds * 1000,
+                trace.breakdown(),
+            )
+
+
+class _HandlerNameMiddleware(BaseMiddleware):
+    """Inner middleware: names the trace after the handler aiogram picked for the update."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        trace = _current_trace.get()
+        handler_object = data.get("handler")
+        if trace is not None and handler_object is not None:
+            trace.handler = getattr(handler_object.callback, "__name__", "handler")
+        return await handler(event, data)
+
+
+def install(dp: Dispatcher, slow_threshold_seconds: float = 1.0) -> HandlerTimingMiddleware:
+    timing = HandlerTimingMiddleware(slow_threshold_seconds)
+    dp.update.outer_middleware(timing)
+    naming = _HandlerNameMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(naming)
+    return timing
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serve `registry` on http://host:port/metrics. Call `cleanup()` on the result to stop."""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
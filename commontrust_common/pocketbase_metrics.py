@@ -0,0 +1,72 @@
+"""PocketBase request metrics and slow-query logging, shared by the bot's and the API's clients."""
+
+from __future__ import annotations
+
+import logging
+import re
+
+import httpx
+
+from commontrust_common.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Quoted strings and bare numbers in a filter; replaced by "?" to get the filter's shape.
+_FILTER_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|(?<![\w.])-?\d+(?:\.\d+)?\b')
+_REPEATED_CLAUSE = re.compile(r"([\w.]+\s*[=!<>~?]+\s*\?)(?:\s*\|\|\s*\1)+")
+# Past this many distinct shapes new ones are counted as "other", bounding label cardinality.
+_MAX_FILTER_SHAPES = 200
+_filter_shapes: set[str] = set()
+
+PB_REQUEST_SECONDS = registry.histogram(
+    "pocketbase_request_seconds",
+    "PocketBase round-trip time by method, collection and filter shape",
+    ["method", "collection", "filter"],
+)
+PB_RESPONSES = registry.counter(
+    "pocketbase_responses_total",
+    "PocketBase responses by method, collection and status code",
+    ["method", "collection", "status"],
+)
+PB_RESPONSE_BYTES = registry.histogram(
+    "pocketbase_response_bytes",
+    "PocketBase response body size by method and collection",
+    ["method", "collection"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+
+def filter_shape(filter: str) -> str:
+    """`telegram_id=42 && status="open"` -> `telegram_id=? && status=?`.
+
+    A chain of the same clause (`id="a" || id="b" || ...`) collapses to `id=? || ...`, so a
+    batched lookup has one shape whatever its size.
+    """
+    return _REPEATED_CLAUSE.sub(r"\1 || ...", _FILTER_LITERAL.sub("?", filter))
+
+
+def observe_request(
+    method: str,
+    collection: str,
+    filter: str | None,
+    response: httpx.Response | None,
+    seconds: float,
+    slow_query_seconds: float,
+) -> None:
+    shape = filter_shape(filter) if filter else ""
+    if shape and shape not in _filter_shapes:
+        if len(_filter_shapes) >= _MAX_FILTER_SHAPES:
+            shape = "other"
+        else:
+            _filter_shapes.add(shape)
+    status = str(response.status_code) if response is not None else "error"
+    PB_REQUEST_SECONDS.observe(seconds, method=method, collection=collection, filter=shape)
+    PB_RESPONSES.inc(method=method, collection=collection, status=status)
+    size = len(response.content) if response is not None else 0
+    if response is not None:
+        PB_RESPONSE_BYTES.observe(size, method=method, collection=collection)
+    if slow_query_seconds > 0 and seconds >= slow_query_seconds:
+        logger.warning(
+            "Slow PocketBase query: %s %s filter=%r status=%s %d bytes in %.0fms",
+            method, collection, shape, status, size, seconds * 1000,
+        )
@@ -0,0 +1,199 @@
+"""Webhook ingestion: an aiohttp endpoint feeding a per-chat ordered update dispatcher.
+
+Shared by `commontrust_bot` and `commontrust_credit_bot`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import secrets
+import signal
+from collections import deque
+from collections.abc import Hashable
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def update_chat_key(update: Update) -> Hashable:
+    """Key whose updates must be handled in order: the chat, else the user, else the update."""
+    try:
+        event = update.event
+    except Exception:
+        return ("update", update.update_id)
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None) or getattr(event, "user", None)
+    if user is not None:
+        # Private chat ids equal user ids, so inline/callback updates share the user's DM lane.
+        return user.id
+    return ("update", update.update_id)
+
+
+class UpdateDispatcher:
+    """Feeds updates to aiogram from `workers` tasks: in order per chat, in parallel across chats.
+
+    Every chat has its own FIFO lane and a lane is worked on by at most one worker at a time, so
+    a busy group never holds up the others. At most `max_pending` updates are buffered; `submit`
+    waits up to `enqueue_timeout` for room and then raises QueueFullError, which the webhook turns
+    into a 503 so Telegram redelivers the update later.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        workers: int = 8,
+        max_pending: int = 1000,
+        enqueue_timeout: float = 5.0,
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.enqueue_timeout = enqueue_timeout
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._lanes: dict[Hashable, deque[Update]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self.join(), timeout=drain_timeout)
+        if self._pending:
+            logger.warning("Dropping %d queued update(s) on shutdown", self._pending)
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def join(self) -> None:
+        """Wait until every submitted update has been handled."""
+        await self._idle.wait()
+
+    async def submit(self, update: Update) -> None:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.enqueue_timeout)
+        except TimeoutError:
+            raise QueueFullError(f"{self.max_pending} updates already queued") from None
+        key = update_chat_key(update)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            # Only an idle lane is put on the ready queue; a busy one is re-queued by its worker.
+            self._ready.put_nowait(key)
+        lane.append(update)
+        self._pending += 1
+        self._idle.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            update = lane.popleft()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Failed to handle update %s", update.update_id)
+            finally:
+                self._pending -= 1
+                self._slots.release()
+                if lane:
+                    # Back of the queue, so one busy chat can't starve the others.
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+                if not self._pending:
+                    self._idle.set()
+
+
+def webhook_app(dispatcher: UpdateDispatcher, secret: str, path: str) -> web.Application:
+    expected = secret.encode()
+
+    async def handle(request: web.Request) -> web.Response:
+        given = request.headers.get(SECRET_HEADER, "").encode()
+        if not secrets.compare_digest(given, expected):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": dispatcher.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        try:
+            await dispatcher.submit(update)
+        except QueueFullError as e:
+            logger.warning("Rejecting update %s: %s", update.update_id, e)
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    url: str,
+    secret: str,
+    path: str,
+    host: str,
+    port: int,
+    workers: int,
+    max_pending: int,
+    **workflow_data: Any,
+) -> None:
+    """Serve updates over a webhook until SIGINT/SIGTERM, mirroring `dp.start_polling`."""
+    dispatcher = UpdateDispatcher(dp, bot, workers=workers, max_pending=max_pending)
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data, **workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+
+    await dispatcher.start()
+    runner = web.AppRunner(webhook_app(dispatcher, secret, path))
+    await runner.setup()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        await web.TCPSite(runner, host, port).start()
+        await bot.set_webhook(
+            url.rstrip("/") + path,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("Receiving updates on %s:%d%s", host, port, path)
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        # Stop accepting first: anything Telegram can't deliver now is redelivered after restart.
+        await runner.cleanup()
+        await dispatcher.stop()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import re
+import time
 from typing import Any
 
 import httpx
 
+from commontrust_common.instrumentation import record_backend_call
 from commontrust_credit_bot.config import credit_settings
 
 
@@ -36,7 +39,13 @@ class CommonTrustApiClient:
 
     async def _request(self, method: str, path: str, json_body: dict[str, Any] | None = None) -> Any:
         url = f"{self.base_url}{path}"
-        r = await self.client.request(method, url, json=json_body, headers=self._headers())
+        started = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, json=json_body, headers=self._headers())
+        finally:
+            # Chat and user ids are folded out so the breakdown groups calls by endpoint.
+            operation = f"{method} {re.sub(r'/-?[0-9]+', '/{id}', path)}"
+            record_backend_call(operation, time.perf_counter() - started)
         if r.status_code >= 400:
             detail = ""
             try:
@@ -91,10 +100,17 @@ class CommonTrustApiClient:
             },
         )
 
-    async def transactions(self, telegram_chat_id: int, telegram_user_id: int, limit: int = 20) -> dict[str, Any]:
-        return await self._request(
-            "GET", f"/v1/ledger/groups/{telegram_chat_id}/accounts/{telegram_user_id}/transactions?limit={limit}"
-        )
+    async def transactions(
+        self,
+        telegram_chat_id: int,
+        telegram_user_id: int,
+        limit: int = 20,
+        cursor: str | None = None,
+    ) -> dict[str, Any]:
+        # Pass the previous response's next_cursor to fetch the following page.
+        query = f"limit={limit}" + (f"&cursor={cursor}" if cursor else "")
+        account = f"/v1/ledger/groups/{telegram_chat_id}/accounts/{telegram_user_id}"
+        return await self._request("GET", f"{account}/transactions?{query}")
 
     async def set_credit_limit(self, telegram_chat_id: int, telegram_user_id: int, credit_limit: int) -> dict[str, Any]:
         return await self._request(
@@ -23,6 +23,20 @@ class CreditBotSettings(BaseSettings):
 
     super_admin_user_ids: list[int] = Field(default_factory=list, alias="SUPER_ADMIN_USER_IDS")
 
+    # Local Prometheus /metrics endpoint (port 0 disables) and the slow handler log threshold.
+    metrics_port: int = Field(default=0, alias="CREDIT_METRICS_PORT")
+    metrics_host: str = Field(default="127.0.0.1", alias="CREDIT_METRICS_HOST")
+    slow_handler_seconds: float = Field(default=1.0, alias="CREDIT_SLOW_HANDLER_SECONDS")
+
+    # Webhook mode (empty URL: long polling).
+    webhook_url: str = Field(default="", alias="CREDIT_WEBHOOK_URL")
+    webhook_path: str = Field(default="/telegram/webhook", alias="CREDIT_WEBHOOK_PATH")
+    webhook_secret: str = Field(default="", alias="CREDIT_WEBHOOK_SECRET")
+    webhook_listen_host: str = Field(default="0.0.0.0", alias="CREDIT_WEBHOOK_LISTEN_HOST")
+    webhook_listen_port: int = Field(default=8081, alias="CREDIT_WEBHOOK_LISTEN_PORT")
+    update_workers: int = Field(default=8, alias="CREDIT_UPDATE_WORKERS")
+    update_queue_size: int = Field(default=1000, alias="CREDIT_UPDATE_QUEUE_SIZE")
+
     @property
     def effective_bot_token(self) -> str:
         return self.telegram_bot_token.strip() or self.telegram_bot_token_fallback.strip()
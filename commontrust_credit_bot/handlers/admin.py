@@ -119,13 +119,22 @@ async def cmd_checkzero(message: Message) -> None:
     try:
         result = await api_client.verify_zero_sum(message.chat.id)
         status = "Valid" if result.get("is_zero_sum") else "Invalid"
-        await message.answer(
+        text = (
             f"<b>Zero-Sum Verification</b>\n\n"
             f"<b>Status:</b> {status}\n"
             f"<b>Total Balance:</b> {result.get('total_balance')}\n"
-            f"<b>Accounts:</b> {result.get('account_count')}",
-            parse_mode="HTML",
+            f"<b>Accounts:</b> {result.get('account_count')}"
         )
+        if result.get("is_reconciled") is not None:
+            mismatched = result.get("mismatched_accounts") or []
+            reconciled = (
+                "Yes" if result.get("is_reconciled") else f"No ({len(mismatched)} accounts)"
+            )
+            text += (
+                f"\n<b>Entries:</b> {result.get('entry_count')}"
+                f"\n<b>Balances match entries:</b> {reconciled}"
+            )
+        await message.answer(text, parse_mode="HTML")
     except ApiError as e:
         await message.answer(f"Error: {e.detail}")
 
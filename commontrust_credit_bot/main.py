@@ -9,6 +9,9 @@ from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
+from commontrust_common.instrumentation import install as install_instrumentation
+from commontrust_common.instrumentation import start_metrics_server
+from commontrust_common.webhook import run_webhook
 from commontrust_credit_bot.api_client import api_client
 from commontrust_credit_bot.config import credit_settings
 from commontrust_credit_bot.handlers import router
@@ -33,6 +36,9 @@ async def main() -> None:
     if not credit_settings.is_configured:
         logger.error("Credit bot is not configured. Set CREDIT_TELEGRAM_BOT_TOKEN and COMMONTRUST_API_TOKEN.")
         sys.exit(1)
+    if credit_settings.webhook_url and not credit_settings.webhook_secret:
+        logger.error("CREDIT_WEBHOOK_SECRET is required when CREDIT_WEBHOOK_URL is set.")
+        sys.exit(1)
 
     bot = Bot(
         token=credit_settings.effective_bot_token,
@@ -40,13 +46,37 @@ async def main() -> None:
     )
     dp = Dispatcher()
     dp.include_router(router)
+    install_instrumentation(dp, credit_settings.slow_handler_seconds)
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
+    metrics_server = None
+    if credit_settings.metrics_port:
+        metrics_server = await start_metrics_server(
+            credit_settings.metrics_host, credit_settings.metrics_port
+        )
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if credit_settings.webhook_url:
+            await run_webhook(
+                dp,
+                bot,
+                url=credit_settings.webhook_url,
+                secret=credit_settings.webhook_secret,
+                path=credit_settings.webhook_path,
+                host=credit_settings.webhook_listen_host,
+                port=credit_settings.webhook_listen_port,
+                workers=credit_settings.update_workers,
+                max_pending=credit_settings.update_queue_size,
+            )
+        else:
+            # getUpdates is refused while a webhook is set, e.g. after switching modes.
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except KeyboardInterrupt:
         logger.info("Credit bot stopped by user")
+    finally:
+        if metrics_server is not None:
+            await metrics_server.cleanup()
 
 
 def run() -> None:
@@ -0,0 +1,54 @@
+/// <reference path="../pb_data/types.d.ts" />
+
+// Compare-and-swap for mc_accounts.
+//
+// Every update bumps `version` by one. A writer that wants optimistic concurrency sends
+// `version = <version it read> + 1`; if another write landed in between, the update is
+// rejected with 409 "version_conflict" and the caller re-reads and retries. Writers that
+// don't send a version get a plain bump.
+//
+// The check is a conditional UPDATE, and it runs in the same transaction as the record save
+// (e.next()), so no other write can land between the compare and the save: two concurrent
+// requests that read the same version can never both succeed. Batch sub-requests already run
+// inside the batch transaction, which runInTransaction reuses, so a conflict there rolls back
+// the whole batch.
+onRecordUpdateRequest((e) => {
+  const id = e.record.id;
+  const body = e.requestInfo().body;
+  const sent = body["version"];
+
+  e.app.runInTransaction((txApp) => {
+    if (sent === undefined || sent === null || sent === "") {
+      txApp
+        .db()
+        .newQuery("UPDATE mc_accounts SET version = version + 1 WHERE id = {:id}")
+        .bind({ id: id })
+        .execute();
+      // e.record was loaded before the row was locked. Without a version to compare, take
+      // every field the request didn't send from the stored row, so the save can't write back
+      // a balance that changed in between.
+      const stored = txApp.findRecordById("mc_accounts", id);
+      for (const [name, value] of Object.entries(stored.fieldsData())) {
+        if (!(name in body)) {
+          e.record.set(name, value);
+        }
+      }
+    } else {
+      const next = parseInt(sent, 10);
+      const result = txApp
+        .db()
+        .newQuery(
+          "UPDATE mc_accounts SET version = {:next} WHERE id = {:id} AND version = {:expected}",
+        )
+        .bind({ id: id, next: next, expected: next - 1 })
+        .execute();
+      if (result.rowsAffected() !== 1) {
+        throw new ApiError(409, "version_conflict", {});
+      }
+      e.record.set("version", next);
+    }
+
+    e.app = txApp;
+    e.next();
+  });
+}, "mc_accounts");
@@ -0,0 +1,32 @@
+/// <reference path="../pb_data/types.d.ts" />
+
+// Expire cached credit limits when a member's reputation changes.
+//
+// The API keeps each mc_account's credit limit until `limit_refreshed_at` is older than
+// CREDIT_LIMIT_REFRESH_TTL_SECONDS. When the verified deal count behind that limit changes,
+// clearing the timestamp makes the next payment, balance check or background sweep recompute
+// it right away, whichever service (bot, API, admin UI) wrote the reputation.
+//
+// `version` is bumped too, so a limit refresh that read the old reputation concurrently
+// fails its compare-and-swap and re-reads instead of stamping a stale limit as fresh.
+function expireCreditLimits(app, memberId) {
+  app
+    .db()
+    .newQuery(
+      "UPDATE mc_accounts SET limit_refreshed_at = '', version = version + 1 WHERE member_id = {:member}",
+    )
+    .bind({ member: memberId })
+    .execute();
+}
+
+onRecordAfterCreateSuccess((e) => {
+  expireCreditLimits(e.app, e.record.get("member_id"));
+  e.next();
+}, "reputation");
+
+onRecordAfterUpdateSuccess((e) => {
+  if (e.record.original().get("verified_deals") !== e.record.get("verified_deals")) {
+    expireCreditLimits(e.app, e.record.get("member_id"));
+  }
+  e.next();
+}, "reputation");
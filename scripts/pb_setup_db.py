@@ -3,7 +3,9 @@
 Idempotent PocketBase DB setup for this project.
 
 Creates the collections defined in pb_schema.json on the target PocketBase instance.
-By default, it only creates missing collections (no destructive updates).
+By default, it only creates missing collections (no destructive updates). Indexes the
+services depend on for correctness (REQUIRED_INDEXES) are always created, also on
+existing collections; the rest of pb_schema.json's indexes need --with-indexes.
 
 Prereqs:
 - .env.local contains POCKETBASE_URL and POCKETBASE_ADMIN_TOKEN (generated by pb_create_admin_token.py)
@@ -19,6 +21,7 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import re
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -31,6 +34,24 @@ class PBSetupError(Exception):
     pass
 
 
+# Keyed payments are only safe against replays with this unique index in place.
+REQUIRED_INDEXES = ("idx_mc_transactions_idempotency",)
+
+_INDEX_NAME = re.compile(r"\bINDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+
+def _index_name(sql: str) -> str | None:
+    m = _INDEX_NAME.search(sql)
+    return m.group(1) if m else None
+
+
+def _indexes(coll: dict[str, Any], include_indexes: bool) -> list[str]:
+    indexes = list(coll.get("indexes", []))
+    if include_indexes:
+        return indexes
+    return [sql for sql in indexes if _index_name(sql) in REQUIRED_INDEXES]
+
+
 def _load_env() -> None:
     # Prefer .env.local then .env (matches commontrust_bot/config.py behavior).
     load_dotenv(".env.local", override=False)
@@ -105,6 +126,8 @@ def _pb_field(field: dict[str, Any], name_to_id: dict[str, str]) -> dict[str, An
                 "displayFields": [],
             }
         )
+    elif pb_type == "json":
+        out.update({"maxSize": int(field.get("maxSize", 0))})
     elif pb_type == "autodate":
         # Automatically managed timestamps (useful for reliable sorting in some PocketBase builds
         # where the implicit system "created"/"updated" are not sortable).
@@ -179,7 +202,8 @@ def _pb_create_collection(
         "fields": [_pb_field(f, name_to_id) for f in coll.get("schema", [])],
         # WARNING: PocketBase stores field values in the 'data' JSON column and index expressions
         # must reference json_extract(...). The pb_schema.json indexes are legacy and may fail.
-        "indexes": coll.get("indexes", []) if include_indexes else [],
+        # REQUIRED_INDEXES are sent either way: a failure there must stop the setup.
+        "indexes": _indexes(coll, include_indexes),
     }
 
     if dry_run:
@@ -205,7 +229,7 @@ def _pb_update_collection(
         "name": coll["name"],
         "type": coll.get("type", "base"),
         "fields": [_pb_field(f, name_to_id) for f in coll.get("schema", [])],
-        "indexes": coll.get("indexes", []) if include_indexes else [],
+        "indexes": _indexes(coll, include_indexes),
     }
 
     if dry_run:
@@ -217,6 +241,49 @@ def _pb_update_collection(
         raise PBSetupError(f"Failed to update collection {coll['name']} ({r.status_code}): {r.text}")
 
 
+def _pb_ensure_required_indexes(
+    client: httpx.Client,
+    conn: PBConn,
+    existing: dict[str, Any],
+    coll: dict[str, Any],
+    dry_run: bool,
+) -> bool:
+    # Adds missing REQUIRED_INDEXES to a collection that is otherwise left alone.
+    current = list(existing.get("indexes") or [])
+    present = {_index_name(sql) for sql in current}
+    missing = [sql for sql in _indexes(coll, False) if _index_name(sql) not in present]
+    if not missing:
+        return False
+
+    if dry_run:
+        print(f"[dry-run] would add required indexes to {coll['name']}: {len(missing)}")
+        return True
+
+    r = client.patch(
+        f"{conn.base_url}/api/collections/{existing['id']}",
+        headers=conn.headers,
+        json={"indexes": current + missing},
+    )
+    if r.status_code != 200:
+        raise PBSetupError(
+            f"Failed to add required indexes to {coll['name']} ({r.status_code}): {r.text}"
+        )
+    return True
+
+
+def _pb_enable_batch(client: httpx.Client, conn: PBConn, dry_run: bool) -> None:
+    # Payments are posted through /api/batch (one transactional request), which is off by default.
+    payload = {"batch": {"enabled": True, "maxRequests": 50, "timeout": 3, "maxBodySize": 0}}
+
+    if dry_run:
+        print("[dry-run] would enable batch API")
+        return
+
+    r = client.patch(f"{conn.base_url}/api/settings", headers=conn.headers, json=payload)
+    if r.status_code != 200:
+        raise PBSetupError(f"Failed to enable batch API ({r.status_code}): {r.text}")
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--dry-run", action="store_true", help="Print actions without changing anything")
@@ -228,7 +295,7 @@ def main() -> int:
     parser.add_argument(
         "--with-indexes",
         action="store_true",
-        help="Also apply indexes from pb_schema.json (may fail on newer PocketBase)",
+        help="Also apply the optional indexes from pb_schema.json (may fail on newer PocketBase)",
     )
     args = parser.parse_args()
 
@@ -263,12 +330,16 @@ def main() -> int:
                         args.dry_run,
                     )
                     updated += 1
+                elif _pb_ensure_required_indexes(
+                    client, conn, existing[name], coll, args.dry_run
+                ):
+                    print(f"added required indexes to existing collection: {name}")
                 else:
                     print(f"skip existing collection: {name}")
                 continue
 
-            if coll.get("indexes") and not args.with_indexes:
-                print(f"note: skipping indexes for {name} (use --with-indexes to apply)")
+            if len(_indexes(coll, True)) > len(_indexes(coll, False)) and not args.with_indexes:
+                print(f"note: skipping optional indexes for {name} (use --with-indexes to apply)")
 
             created_coll = _pb_create_collection(
                 client, conn, coll, name_to_id, args.with_indexes, args.dry_run
@@ -278,6 +349,8 @@ def main() -> int:
             if isinstance(created_coll, dict) and "id" in created_coll:
                 name_to_id[name] = created_coll["id"]
 
+        _pb_enable_batch(client, conn, args.dry_run)
+
         print(f"done: created={created} updated={updated} dry_run={bool(args.dry_run)}")
 
     return 0
@@ -7,3 +7,33 @@ from tests.fake_pocketbase import FakePocketBase
 def fake_pb() -> FakePocketBase:
     return FakePocketBase()
 
+
+
+@pytest.fixture(autouse=True)
+def _reset_group_directory():
+    # Module-level like in the API; don't let one test's groups leak into the next.
+    from commontrust_api.ledger.directory import group_directory
+
+    group_directory.clear()
+    yield
+    group_directory.clear()
+
+
+@pytest.fixture(autouse=True)
+async def _reset_state_store():
+    # DM flow state is module-level too.
+    from commontrust_bot.state import state_store
+
+    await state_store.clear()
+    yield
+    await state_store.clear()
+
+
+def pytest_terminal_summary(terminalreporter) -> None:
+    # Measurements recorded by tests/test_roundtrip_budgets.py.
+    reports = terminalreporter.stats.get("passed", []) + terminalreporter.stats.get("failed", [])
+    rows = [value for r in reports for key, value in r.user_properties if key == "roundtrips"]
+    if rows:
+        terminalreporter.section("backend round-trips per flow")
+        for flow, summary in rows:
+            terminalreporter.write_line(f"{flow:<16}{summary}")
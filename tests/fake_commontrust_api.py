@@ -102,13 +102,21 @@ class FakeCommonTrustApiClient:
         mc_group_id = await self._mc_group_id(telegram_chat_id)
         return await self.mc.verify_zero_sum(mc_group_id)
 
-    async def transactions(self, telegram_chat_id: int, telegram_user_id: int, limit: int = 20) -> dict[str, Any]:
+    async def transactions(
+        self,
+        telegram_chat_id: int,
+        telegram_user_id: int,
+        limit: int = 20,
+        cursor: str | None = None,
+    ) -> dict[str, Any]:
         mc_group_id = await self._mc_group_id(telegram_chat_id)
         member = await self.pb.member_get_or_create(telegram_user_id)
-        items = await self.mc.get_transaction_history(mc_group_id, member["id"], limit=limit)
+        page = await self.mc.transaction_history_page(
+            mc_group_id, member["id"], limit=limit, cursor=cursor
+        )
         out: list[dict[str, Any]] = []
         # Provide the same shape the real API returns (direction + other).
-        for tx in items:
+        for tx in page["items"]:
             payer = await self.pb.get_record("members", tx["payer_id"])
             payee = await self.pb.get_record("members", tx["payee_id"])
             is_sender = int(payer.get("telegram_id", 0) or 0) == telegram_user_id
@@ -124,7 +132,7 @@ class FakeCommonTrustApiClient:
                     "other_display_name": other.get("display_name"),
                 }
             )
-        return {"items": out}
+        return {"items": out, "next_cursor": page["next_cursor"]}
 
     async def set_remote_ledger(self, telegram_chat_id: int, base_url: str, token: str) -> dict[str, Any]:
         return {"base_url": base_url}
@@ -1,57 +1,457 @@
 from __future__ import annotations
 
+import asyncio
+import bisect
+import functools
+import itertools
+import json
 import re
 import time
+from collections.abc import AsyncIterator, Iterable, Iterator
 from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
 from typing import Any
 
+from commontrust_api.pocketbase_client import PocketBaseConflictError
+from commontrust_api.pocketbase_client import PocketBaseDuplicateError as ApiDuplicateError
+from commontrust_bot.pocketbase_client import PocketBaseDuplicateError as BotDuplicateError
+from tests.fake_pocketbase_filter import (
+    Comparison,
+    Field,
+    Literal,
+    Node,
+    Or,
+    conjuncts,
+    parse_filter,
+)
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "pb_schema.json"
+
+
+class FakeDuplicateError(ApiDuplicateError, BotDuplicateError):
+    """Raised for unique-index violations; catchable as either package's error."""
+
 
 def _now_iso() -> str:
     # Deterministic enough for tests without pulling in datetime/timezones.
     return time.strftime("%Y-%m-%dT%H:%M:%S")
 
 
-def _eval_filter(record: dict[str, Any], filter_str: str | None) -> bool:
-    if not filter_str:
-        return True
-
-    # PocketBase filter language is fairly rich; for this repo we only need
-    # equality checks combined with && / || and parentheses.
-    expr = filter_str
-    expr = expr.replace("&&", " and ").replace("||", " or ")
-
-    # Strings: foo="bar"
-    expr = re.sub(
-        r'(\b[a-zA-Z_]\w*\b)\s*=\s*"([^"]*)"',
-        lambda m: f'record.get("{m.group(1)}") == "{m.group(2)}"',
-        expr,
-    )
-    # Booleans: foo=true/false
-    expr = re.sub(
-        r"(\b[a-zA-Z_]\w*\b)\s*=\s*(true|false)\b",
-        lambda m: f'record.get("{m.group(1)}") == {m.group(2).title()}',
-        expr,
-        flags=re.IGNORECASE,
-    )
-    # Ints: foo=123
-    expr = re.sub(
-        r"(\b[a-zA-Z_]\w*\b)\s*=\s*(\d+)\b",
-        lambda m: f'record.get("{m.group(1)}") == {int(m.group(2))}',
-        expr,
-    )
-
-    return bool(eval(expr, {"__builtins__": {}}, {"record": record}))
+def _pb_now() -> str:
+    # Same shape as PocketBase autodate values, which compare correctly as strings.
+    now = datetime.now(UTC)
+    return now.strftime("%Y-%m-%d %H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
+
+
+_INDEX_SQL = re.compile(
+    r"CREATE\s+(UNIQUE\s+)?INDEX\s+\w+\s+ON\s+(\w+)\s*\(([^)]*)\)(?:\s+WHERE\s+(.+))?",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    columns: tuple[str, ...]
+    unique: bool = False
+    # Partial indexes: only records matching this filter are covered.
+    where: Node | None = None
+
+
+@dataclass(frozen=True)
+class Schema:
+    indexes: dict[str, tuple[IndexSpec, ...]]
+    # collection -> relation field -> target collection
+    relations: dict[str, dict[str, str]]
+    # collection -> field -> field definition, e.g. {"type": "number", ...}
+    fields: dict[str, dict[str, dict[str, Any]]] = field(default_factory=dict)
+    # collection -> the CREATE INDEX statements it was declared with
+    index_sql: dict[str, tuple[str, ...]] = field(default_factory=dict)
+
+    @classmethod
+    def from_collections(cls, collections: list[dict[str, Any]]) -> Schema:
+        indexes: dict[str, tuple[IndexSpec, ...]] = {}
+        relations: dict[str, dict[str, str]] = {}
+        fields: dict[str, dict[str, dict[str, Any]]] = {}
+        index_sql: dict[str, tuple[str, ...]] = {}
+        for collection in collections:
+            definitions = collection.get("fields") or collection.get("schema") or []
+            specs = []
+            for sql in collection.get("indexes") or []:
+                m = _INDEX_SQL.match(sql.strip())
+                if m is None:
+                    continue
+                columns = tuple(c.strip() for c in m.group(3).split(","))
+                where = parse_filter(m.group(4)) if m.group(4) else None
+                specs.append(IndexSpec(columns, unique=bool(m.group(1)), where=where))
+            indexes[collection["name"]] = tuple(specs)
+            index_sql[collection["name"]] = tuple(collection.get("indexes") or [])
+            relations[collection["name"]] = {
+                f["name"]: f["collectionId"]
+                for f in definitions
+                if f.get("type") == "relation" and f.get("collectionId")
+            }
+            fields[collection["name"]] = {f["name"]: f for f in definitions}
+        return cls(indexes, relations, fields, index_sql)
+
+
+@functools.lru_cache(maxsize=1)
+def load_schema() -> Schema:
+    """Indexes and relations declared in the repo's pb_schema.json."""
+    return Schema.from_collections(json.loads(SCHEMA_PATH.read_text()))
+
+
+def _sort_key(value: Any) -> tuple[int, Any]:
+    # Blank first, then numbers, then text, whatever mix of types a field holds.
+    if value is None or value == "":
+        return (0, 0)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, repr(value))
+
+
+class _Table:
+    """One collection's records plus hash indexes on the leading column of each schema index.
+
+    `records` is the collection's dict in `FakePocketBase.data`. Writes must go through the
+    table so the indexes follow; a record changed in place by hand needs `reindex()`. Index
+    lookups only narrow the candidates, which are always checked against the full filter.
+    """
+
+    def __init__(self, records: dict[str, dict[str, Any]], specs: tuple[IndexSpec, ...]):
+        self.records = records
+        self.unique = tuple(spec for spec in specs if spec.unique)
+        self.fields = tuple(dict.fromkeys(spec.columns[0] for spec in specs))
+        self.index: dict[str, dict[Any, set[str]]] = {name: {} for name in self.fields}
+        # Values that can't be hashed (e.g. multi-relation lists) are always candidates.
+        self.unhashable: dict[str, set[str]] = {name: set() for name in self.fields}
+        self._sorted_ids: list[str] | None = None
+        for record_id, record in records.items():
+            self._index(record_id, record)
+
+    def _index(self, record_id: str, record: dict[str, Any]) -> None:
+        for name in self.fields:
+            value = record.get(name)
+            try:
+                self.index[name].setdefault(value, set()).add(record_id)
+            except TypeError:
+                self.unhashable[name].add(record_id)
+
+    def _unindex(self, record_id: str, record: dict[str, Any]) -> None:
+        for name in self.fields:
+            value = record.get(name)
+            try:
+                ids = self.index[name].get(value)
+            except TypeError:
+                self.unhashable[name].discard(record_id)
+                continue
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self.index[name][value]
+
+    def lookup(self, name: str, value: Any) -> set[str]:
+        """Ids whose `name` may equal `value` (blank values also match unset fields)."""
+        index = self.index[name]
+        try:
+            found = set(index.get(value, ()))
+        except TypeError:
+            return set(self.records)
+        if not value:
+            for blank in (None, ""):
+                found.update(index.get(blank, ()))
+        return found | self.unhashable[name]
+
+    def check_unique(self, record: dict[str, Any], record_id: str | None = None) -> None:
+        for spec in self.unique:
+            if spec.where and not spec.where.matches(record.get):
+                continue
+            first = spec.columns[0]
+            for other_id in self.lookup(first, record.get(first)):
+                other = self.records.get(other_id)
+                if (
+                    other_id != record_id
+                    and other is not None
+                    and all(other.get(c) == record.get(c) for c in spec.columns)
+                    and (spec.where is None or spec.where.matches(other.get))
+                ):
+                    raise FakeDuplicateError(f"validation_not_unique: {spec.columns[-1]}")
+
+    def insert(self, record: dict[str, Any]) -> None:
+        record_id = record["id"]
+        if record_id in self.records:
+            raise FakeDuplicateError(f"validation_not_unique: id ({record_id})")
+        self.check_unique(record)
+        self.records[record_id] = record
+        self._index(record_id, record)
+        if self._sorted_ids is not None:
+            bisect.insort(self._sorted_ids, record_id)
+
+    def update(self, record_id: str, changes: dict[str, Any]) -> dict[str, Any]:
+        record = self.records[record_id]
+        self.check_unique({**record, **changes}, record_id)
+        self._unindex(record_id, record)
+        record.update(changes)
+        self._index(record_id, record)
+        return record
+
+    def restore(self, record_id: str, previous: dict[str, Any]) -> None:
+        """Put back a record exactly as it was (undoing a failed batch)."""
+        record = self.records.get(record_id)
+        if record is None:
+            self.insert(previous)
+            return
+        self._unindex(record_id, record)
+        record.clear()
+        record.update(previous)
+        self._index(record_id, record)
+
+    def remove(self, record_id: str) -> None:
+        record = self.records.pop(record_id, None)
+        if record is None:
+            return
+        self._unindex(record_id, record)
+        if self._sorted_ids is not None:
+            i = bisect.bisect_left(self._sorted_ids, record_id)
+            if i < len(self._sorted_ids) and self._sorted_ids[i] == record_id:
+                del self._sorted_ids[i]
+
+    def ids_by_id(self, after: str | None = None, reverse: bool = False) -> Iterator[str]:
+        """Ids in id order, optionally only those past `after` in that order."""
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self.records)
+        ids = self._sorted_ids
+        if reverse:
+            end = bisect.bisect_left(ids, after) if after is not None else len(ids)
+            return (ids[i] for i in range(end - 1, -1, -1))
+        start = bisect.bisect_right(ids, after) if after is not None else 0
+        return itertools.islice(ids, start, None)
+
+
+@dataclass
+class RoundTripLog:
+    """Backend round-trips seen by a FakePocketBase, and how many of them had to run in series.
+
+    A call's depth is one more than the deepest call that had already finished when it started,
+    so calls issued together (e.g. under `asyncio.gather`) share a depth and `depth` is the
+    length of the longest chain of calls that waited on each other. Overlap is only visible when
+    the fake yields, i.e. with `latency` set.
+    """
+
+    calls: list[str] = field(default_factory=list)
+    depth: int = 0
+    _settled: int = 0
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.calls)
+
+    def begin(self, operation: str) -> int:
+        self.calls.append(operation)
+        depth = self._settled + 1
+        self.depth = max(self.depth, depth)
+        return depth
+
+    def end(self, depth: int) -> None:
+        self._settled = max(self._settled, depth)
 
 
 @dataclass
 class FakePocketBase:
+    """In-memory PocketBase: same method surface as the clients, indexed like pb_schema.json.
+
+    Filters are parsed once (see tests/fake_pocketbase_filter.py) and planned against hash
+    indexes on the schema's indexed columns, including one hop through a relation
+    (`account_id.mc_group_id="..."`), so equality lookups stay cheap at millions of records.
+    Use `load` to bulk-insert a dataset and tests/fake_pocketbase_http.py to serve it over HTTP.
+    """
+
     data: dict[str, dict[str, dict[str, Any]]] = field(default_factory=dict)
     _seq: int = 0
+    batch_calls: int = 0
+    # When set, every storage call awaits asyncio.sleep(latency) so concurrent callers interleave
+    # the way they would against a real server (0 just yields to the event loop).
+    latency: float | None = None
+    # When set, every storage call is recorded as one round-trip (see RoundTripLog).
+    round_trips: RoundTripLog | None = None
+    schema: Schema = field(default_factory=load_schema, repr=False)
+    _tables: dict[str, _Table] = field(default_factory=dict, repr=False)
+
+    async def _tick(self) -> None:
+        if self.latency is not None:
+            await asyncio.sleep(self.latency)
+
+    async def _round_trip(self, operation: str) -> None:
+        log = self.round_trips
+        if log is None:
+            await self._tick()
+            return
+        depth = log.begin(operation)
+        try:
+            await self._tick()
+        finally:
+            log.end(depth)
 
     def _next_id(self, prefix: str) -> str:
         self._seq += 1
         return f"{prefix}_{self._seq}"
 
+    def _table(self, collection: str) -> _Table:
+        records = self.data.setdefault(collection, {})
+        table = self._tables.get(collection)
+        if table is None or table.records is not records:
+            table = self._tables[collection] = _Table(
+                records, self.schema.indexes.get(collection, ())
+            )
+        return table
+
+    def reindex(self) -> None:
+        """Rebuild the indexes, after records were changed in place instead of through the API."""
+        self._tables.clear()
+
+    def _new_record(
+        self, collection: str, data: dict[str, Any], now: tuple[str, str] | None = None
+    ) -> dict[str, Any]:
+        record_id = data.get("id") or self._next_id(collection)
+        created, created_at = now or (_now_iso(), _pb_now())
+        return {"id": record_id, "created": created, "created_at": created_at, **data}
+
+    def load(self, collection: str, records: Iterable[dict[str, Any]]) -> int:
+        """Bulk-insert records without round-trips or hooks, e.g. a benchmark dataset.
+
+        Records get one shared creation time unless they bring their own.
+        """
+        table = self._table(collection)
+        now = (_now_iso(), _pb_now())
+        count = 0
+        for data in records:
+            table.insert(self._new_record(collection, data, now))
+            count += 1
+        return count
+
+    def _getter(self, record: dict[str, Any]) -> Any:
+        def get(path: str) -> Any:
+            if "." in path:
+                return self._resolve(record, path)
+            return record.get(path)
+
+        return get
+
+    def _candidates(self, collection: str, node: Node) -> set[str] | None:
+        """Ids that may match `node`, from the indexes; None when only a full scan will do."""
+        if isinstance(node, Comparison):
+            equals = node.field_equals()
+            if equals is None:
+                return None
+            path, value = equals
+            table = self._table(collection)
+            if path == "id":
+                return {value} if isinstance(value, str) and value in table.records else set()
+            if "." in path:
+                return self._join_candidates(collection, path, value)
+            return table.lookup(path, value) if path in table.fields else None
+        left = self._candidates(collection, node.left)
+        right = self._candidates(collection, node.right)
+        if isinstance(node, Or):
+            return None if left is None or right is None else left | right
+        if left is None or right is None:
+            return right if left is None else left
+        return left & right
+
+    def _join_candidates(self, collection: str, path: str, value: Any) -> set[str] | None:
+        # rel.field="x": find the related records first, then ours through the index on rel.
+        head, rest = path.split(".", 1)
+        target = self.schema.relations.get(collection, {}).get(head)
+        table = self._table(collection)
+        if target is None or head not in table.fields or not value:
+            return None
+        condition = Comparison(Field(rest), "=", Literal(value))
+        target_ids = self._candidates(target, condition)
+        target_records = self._table(target).records
+        if target_ids is None:
+            target_ids = set(target_records)
+        found: set[str] = set()
+        for target_id in target_ids:
+            record = target_records.get(target_id)
+            if record is not None and condition.matches(self._getter(record)):
+                found |= table.lookup(head, target_id)
+        return found
+
+    def _matching(
+        self, collection: str, node: Node | None, ids: Iterable[str] | None = None
+    ) -> Iterator[dict[str, Any]]:
+        records = self._table(collection).records
+        if ids is None and node is not None:
+            ids = self._candidates(collection, node)
+        if ids is None:
+            candidates: Iterable[dict[str, Any]] = records.values()
+        else:
+            candidates = (records[i] for i in ids if i in records)
+        if node is None:
+            yield from candidates
+            return
+        for record in candidates:
+            if node.matches(self._getter(record)):
+                yield record
+
+    def _id_order(self, collection: str, node: Node | None, reverse: bool) -> Iterator[str]:
+        # Keyset pages (`... && id>"last"` sorted by id) start right after the last id.
+        after = None
+        for term in conjuncts(node) if node is not None else ():
+            if (
+                isinstance(term, Comparison)
+                and isinstance(term.left, Field)
+                and term.left.path == "id"
+                and isinstance(term.right, Literal)
+                and isinstance(term.right.value, str)
+                and term.op == ("<" if reverse else ">")
+            ):
+                after = term.right.value if after is None else (
+                    min(after, term.right.value) if reverse else max(after, term.right.value)
+                )
+        return self._table(collection).ids_by_id(after, reverse)
+
+    def query(
+        self,
+        collection: str,
+        filter: str | None = None,
+        sort: str | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+        count: bool = True,
+    ) -> tuple[list[dict[str, Any]], int]:
+        """Records `offset:offset+limit` of the filtered, sorted collection, and the match count.
+
+        Without `count` the count is -1, and id-ordered or unsorted queries stop scanning once
+        the page is full.
+        """
+        node = parse_filter(filter) if filter and filter.strip() else None
+        end = None if limit is None else offset + limit
+        keys = [part.strip() for part in sort.split(",") if part.strip()] if sort else []
+        if keys in ([], ["id"], ["+id"], ["-id"]):
+            ids = None
+            candidates = self._candidates(collection, node) if node is not None else None
+            if keys and candidates is None:
+                ids = self._id_order(collection, node, reverse=keys[0] == "-id")
+            elif keys:
+                ids = sorted(candidates, reverse=keys[0] == "-id")
+            else:
+                ids = candidates
+            matches = self._matching(collection, node, ids)
+            if not count:
+                return list(itertools.islice(matches, offset, end)), -1
+            items = list(matches)
+            return items[offset:end], len(items)
+
+        items = list(self._matching(collection, node))
+        # Stable sorts applied last key first give PocketBase's "a,-b" multi-key ordering.
+        for part in reversed(keys):
+            name = part.lstrip("-+")
+            items.sort(key=lambda r: _sort_key(r.get(name)), reverse=part.startswith("-"))
+        return items[offset:end], len(items) if count else -1
+
     async def list_records(
         self,
         collection: str,
@@ -59,42 +459,184 @@ class FakePocketBase:
         per_page: int = 50,
         filter: str | None = None,
         sort: str | None = None,
+        consistency: str = "default",
+        expand: str | None = None,
+        skip_total: bool = False,
     ) -> dict[str, Any]:
-        items = list(self.data.get(collection, {}).values())
-        items = [r for r in items if _eval_filter(r, filter)]
+        # In-memory reads are always strongly consistent; `consistency` is accepted for parity.
+        await self._round_trip(f"list {collection}")
+        page_items, total = self.query(
+            collection,
+            filter=filter,
+            sort=sort,
+            offset=max(0, (page - 1) * per_page),
+            limit=per_page,
+            count=not skip_total,
+        )
+        if expand:
+            page_items = [self._expanded(r, expand) for r in page_items]
+        return {"page": page, "perPage": per_page, "items": page_items, "totalItems": total}
+
+    def _expanded(self, record: dict[str, Any], expand: str) -> dict[str, Any]:
+        related = {}
+        for name in expand.split(","):
+            target = self._resolve(record, f"{name}.id")
+            if target is not None:
+                related[name] = dict(self._resolve_record(target))
+        return {**record, "expand": related} if related else record
 
-        if sort:
-            reverse = sort.startswith("-")
-            key = sort[1:] if reverse else sort
-            items.sort(key=lambda r: r.get(key) or "", reverse=reverse)
+    def _resolve_record(self, record_id: str) -> dict[str, Any]:
+        return next(c[record_id] for c in self.data.values() if record_id in c)
 
-        # Very small paging support for callers that request per_page limits.
-        start = max(0, (page - 1) * per_page)
-        end = start + per_page
-        return {"page": page, "perPage": per_page, "items": items[start:end], "totalItems": len(items)}
+    def _resolve(self, record: dict[str, Any], path: str) -> Any:
+        # Follow relation fields the way PocketBase does for `a.b` in filters. Ids are unique
+        # across collections here, so the target collection doesn't need to be known.
+        value: Any = record
+        for name in path.split("."):
+            if isinstance(value, str):
+                value = next((c[value] for c in self.data.values() if value in c), None)
+            if not isinstance(value, dict):
+                return None
+            value = value.get(name)
+        return value
+
+    async def iter_records(
+        self, collection: str, filter: str | None = None, per_page: int = 500
+    ) -> AsyncIterator[dict[str, Any]]:
+        # Keyset on id like the real clients, so deep pages cost the same as the first.
+        last_id = ""
+        while True:
+            clauses = [f"({filter})"] if filter else []
+            if last_id:
+                clauses.append(f'id>"{last_id}"')
+            result = await self.list_records(
+                collection,
+                per_page=per_page,
+                filter=" && ".join(clauses) or None,
+                sort="id",
+                skip_total=True,
+            )
+            items = result.get("items", [])
+            for item in items:
+                yield item
+            if len(items) < per_page:
+                return
+            last_id = items[-1]["id"]
+
+    async def get_record(
+        self, collection: str, record_id: str, consistency: str = "default"
+    ) -> dict[str, Any]:
+        await self._round_trip(f"get {collection}")
+        return self._stored(collection, record_id)
 
-    async def get_record(self, collection: str, record_id: str) -> dict[str, Any]:
+    def _stored(self, collection: str, record_id: str) -> dict[str, Any]:
         rec = self.data.get(collection, {}).get(record_id)
         if not rec:
             raise KeyError(f"not found: {collection}/{record_id}")
         return rec
 
     async def create_record(self, collection: str, data: dict[str, Any]) -> dict[str, Any]:
-        self.data.setdefault(collection, {})
-        record_id = data.get("id") or self._next_id(collection)
-        rec = {"id": record_id, "created": _now_iso(), **data}
-        self.data[collection][record_id] = rec
+        await self._round_trip(f"create {collection}")
+        rec = self._new_record(collection, data)
+        self._table(collection).insert(rec)
+        if collection == "reputation":
+            self._expire_credit_limits(rec.get("member_id"))
         return rec
 
+    async def create_record_with_files(
+        self,
+        collection: str,
+        data: dict[str, Any],
+        files: list[tuple[str, str, Any, str]] | None = None,
+    ) -> dict[str, Any]:
+        # One multipart request; file fields store filenames, like PocketBase returns them.
+        names: dict[str, list[str]] = {}
+        for field_name, filename, _, _ in files or []:
+            names.setdefault(field_name, []).append(filename)
+        return await self.create_record(collection, {**data, **names})
+
     async def update_record(self, collection: str, record_id: str, data: dict[str, Any]) -> dict[str, Any]:
-        rec = await self.get_record(collection, record_id)
-        rec.update(data)
+        await self._round_trip(f"update {collection}")
+        rec = self._stored(collection, record_id)
+        previous_deals = rec.get("verified_deals")
+        rec = self._table(collection).update(record_id, self._versioned(collection, rec, data))
+        if collection == "reputation" and rec.get("verified_deals") != previous_deals:
+            self._expire_credit_limits(rec.get("member_id"))
         return rec
 
+    def _expire_credit_limits(self, member_id: Any) -> None:
+        # Mirrors pb_hooks/reputation_credit_limits.pb.js.
+        accounts = self._table("mc_accounts")
+        condition = Comparison(Field("member_id"), "=", Literal(member_id))
+        for account in list(self._matching("mc_accounts", condition)):
+            accounts.update(
+                account["id"],
+                {"limit_refreshed_at": "", "version": int(account.get("version") or 0) + 1},
+            )
+
+    @staticmethod
+    def _versioned(collection: str, rec: dict[str, Any], data: dict[str, Any]) -> dict[str, Any]:
+        # Mirrors pb_hooks/mc_accounts_version.pb.js.
+        if collection != "mc_accounts":
+            return data
+        current = int(rec.get("version") or 0)
+        if data.get("version") is None:
+            return {**data, "version": current + 1}
+        if data["version"] != current + 1:
+            raise PocketBaseConflictError("version_conflict")
+        return data
+
     async def delete_record(self, collection: str, record_id: str) -> None:
-        self.data.get(collection, {}).pop(record_id, None)
+        await self._round_trip(f"delete {collection}")
+        self._table(collection).remove(record_id)
 
-    async def get_first(self, collection: str, filter: str) -> dict[str, Any] | None:
+    async def batch(self, requests: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        # All-or-nothing like PocketBase's /api/batch: one round-trip, applied without yielding,
+        # and undone if any write fails.
+        await self._round_trip("batch")
+        self.batch_calls += 1
+        undo: list[tuple[str, str, dict[str, Any] | None]] = []
+        out: list[dict[str, Any]] = []
+        try:
+            for request in requests:
+                # /api/collections/{collection}/records[/{id}]
+                parts = request["url"].strip("/").split("/")
+                collection = parts[2]
+                table = self._table(collection)
+                body = dict(request.get("body") or {})
+                if request["method"] == "POST":
+                    rec = self._new_record(collection, body)
+                    if rec["id"] in table.records:
+                        raise ValueError(f"duplicate id: {collection}/{rec['id']}")
+                    table.insert(rec)
+                    undo.append((collection, rec["id"], None))
+                    out.append(dict(rec))
+                elif request["method"] in ("PATCH", "DELETE"):
+                    rec = table.records.get(parts[4])
+                    if rec is None:
+                        raise KeyError(f"not found: {collection}/{parts[4]}")
+                    previous = dict(rec)
+                    if request["method"] == "PATCH":
+                        table.update(parts[4], self._versioned(collection, rec, body))
+                        out.append(dict(rec))
+                    else:
+                        table.remove(parts[4])
+                        out.append({})
+                    undo.append((collection, parts[4], previous))
+                else:
+                    raise ValueError(f"unsupported batch method: {request['method']}")
+        except Exception:
+            for collection, record_id, previous in reversed(undo):
+                if previous is None:
+                    self._table(collection).remove(record_id)
+                else:
+                    self._table(collection).restore(record_id, previous)
+            raise
+        return out
+
+    async def get_first(
+        self, collection: str, filter: str, consistency: str = "default"
+    ) -> dict[str, Any] | None:
         result = await self.list_records(collection, page=1, per_page=1, filter=filter)
         items = result.get("items", [])
         return items[0] if items else None
@@ -140,6 +682,15 @@ class FakePocketBase:
             return None
         return await self.get_first("members", f'username="{username_norm}"')
 
+    async def members_get_many(self, member_ids: list[str]) -> dict[str, dict[str, Any]]:
+        ids = list(dict.fromkeys(member_ids))
+        if not ids:
+            return {}
+        result = await self.list_records(
+            "members", per_page=len(ids), filter=" || ".join(f'id="{i}"' for i in ids)
+        )
+        return {r["id"]: r for r in result.get("items", [])}
+
     async def group_get_or_create(self, telegram_id: int, title: str, mc_enabled: bool = False) -> dict[str, Any]:
         existing = await self.get_first("groups", f"telegram_id={telegram_id}")
         if existing:
@@ -210,25 +761,48 @@ class FakePocketBase:
             },
         )
 
-    async def reviews_for_member(self, member_id: str) -> list[dict[str, Any]]:
-        result = await self.list_records("reviews", filter=f'reviewee_id="{member_id}"')
-        return result.get("items", [])
+    async def reviews_for_member(self, member_id: str, per_page: int = 200) -> list[dict[str, Any]]:
+        # Page through everything; busy members easily exceed a single page of reviews.
+        items: list[dict[str, Any]] = []
+        page = 1
+        while True:
+            result = await self.list_records(
+                "reviews", page=page, per_page=per_page, filter=f'reviewee_id="{member_id}"'
+            )
+            batch = result.get("items", [])
+            items.extend(batch)
+            if len(batch) < per_page:
+                return items
+            page += 1
 
     async def reputation_get(self, member_id: str) -> dict[str, Any] | None:
         return await self.get_first("reputation", f'member_id="{member_id}"')
 
-    async def reputation_update(self, member_id: str, verified_deals: int, avg_rating: float) -> dict[str, Any]:
-        existing = await self.reputation_get(member_id)
-        if existing:
-            return await self.update_record(
-                "reputation",
-                existing["id"],
-                {"verified_deals": verified_deals, "avg_rating": avg_rating, "total_reviews": None},
-            )
-        return await self.create_record(
-            "reputation",
-            {"member_id": member_id, "verified_deals": verified_deals, "avg_rating": avg_rating},
-        )
+    async def reputation_update(
+        self,
+        member_id: str,
+        verified_deals: int,
+        avg_rating: float,
+        total_reviews: int | None = None,
+        reviewer_stats: dict[str, dict[str, int]] | None = None,
+        verified_deal_ids: list[str] | None = None,
+        record_id: str | None = None,
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = {"verified_deals": verified_deals, "avg_rating": avg_rating}
+        if total_reviews is not None:
+            data["total_reviews"] = total_reviews
+        if reviewer_stats is not None:
+            # Store a copy, like a JSON field round-trip would.
+            data["reviewer_stats"] = {k: dict(v) for k, v in reviewer_stats.items()}
+        if verified_deal_ids is not None:
+            data["verified_deal_ids"] = list(verified_deal_ids)
+
+        if record_id is None:
+            existing = await self.reputation_get(member_id)
+            record_id = existing["id"] if existing else None
+        if record_id:
+            return await self.update_record("reputation", record_id, data)
+        return await self.create_record("reputation", {"member_id": member_id, **data})
 
     async def mc_group_get(self, group_id: str) -> dict[str, Any] | None:
         return await self.get_first("mc_groups", f'group_id="{group_id}"')
@@ -250,18 +824,59 @@ class FakePocketBase:
             "mc_accounts", f'mc_group_id="{mc_group_id}" && member_id="{member_id}"'
         )
 
-    async def mc_account_create(self, mc_group_id: str, member_id: str, credit_limit: int = 0) -> dict[str, Any]:
-        return await self.create_record(
-            "mc_accounts",
-            {"mc_group_id": mc_group_id, "member_id": member_id, "balance": 0, "credit_limit": credit_limit},
-        )
+    async def mc_account_create(
+        self,
+        mc_group_id: str,
+        member_id: str,
+        credit_limit: int = 0,
+        limit_refreshed_at: str | None = None,
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "mc_group_id": mc_group_id,
+            "member_id": member_id,
+            "balance": 0,
+            "credit_limit": credit_limit,
+            "version": 0,
+        }
+        if limit_refreshed_at is not None:
+            data["limit_refreshed_at"] = limit_refreshed_at
+        return await self.create_record("mc_accounts", data)
 
-    async def mc_account_update(self, account_id: str, balance: int, credit_limit: int | None = None) -> dict[str, Any]:
+    async def mc_account_update(
+        self,
+        account_id: str,
+        balance: int,
+        credit_limit: int | None = None,
+        expected_version: int | None = None,
+        limit_refreshed_at: str | None = None,
+    ) -> dict[str, Any]:
         data: dict[str, Any] = {"balance": balance}
         if credit_limit is not None:
             data["credit_limit"] = credit_limit
+        if limit_refreshed_at is not None:
+            data["limit_refreshed_at"] = limit_refreshed_at
+        if expected_version is not None:
+            data["version"] = expected_version + 1
+        return await self.update_record("mc_accounts", account_id, data)
+
+    async def mc_account_set_limit(
+        self,
+        account_id: str,
+        credit_limit: int,
+        expected_version: int | None = None,
+        limit_refreshed_at: str | None = None,
+    ) -> dict[str, Any]:
+        data: dict[str, Any] = {"credit_limit": credit_limit}
+        if limit_refreshed_at is not None:
+            data["limit_refreshed_at"] = limit_refreshed_at
+        if expected_version is not None:
+            data["version"] = expected_version + 1
         return await self.update_record("mc_accounts", account_id, data)
 
+    async def mc_idempotency_indexed(self) -> bool:
+        sql = self.schema.index_sql.get("mc_transactions", ())
+        return any("idx_mc_transactions_idempotency" in s for s in sql)
+
     async def mc_transaction_get_by_idempotency(
         self, mc_group_id: str, idempotency_key: str
     ) -> dict[str, Any] | None:
@@ -298,6 +913,108 @@ class FakePocketBase:
             {"transaction_id": transaction_id, "account_id": account_id, "amount": amount, "balance_after": balance_after},
         )
 
+    async def mc_payment_create(
+        self,
+        mc_group_id: str,
+        payer_id: str,
+        payee_id: str,
+        payer_account_id: str,
+        payee_account_id: str,
+        amount: int,
+        new_payer_balance: int,
+        new_payee_balance: int,
+        description: str | None = None,
+        idempotency_key: str | None = None,
+        payer_version: int | None = None,
+        payee_version: int | None = None,
+    ) -> dict[str, Any]:
+        payer_update: dict[str, Any] = {"balance": new_payer_balance}
+        if payer_version is not None:
+            payer_update["version"] = payer_version + 1
+        payee_update: dict[str, Any] = {"balance": new_payee_balance}
+        if payee_version is not None:
+            payee_update["version"] = payee_version + 1
+        transaction_id = self._next_id("mc_transactions")
+        transaction, payer_entry, payee_entry, _, _ = await self.batch(
+            [
+                {
+                    "method": "POST",
+                    "url": "/api/collections/mc_transactions/records",
+                    "body": {
+                        "id": transaction_id,
+                        "mc_group_id": mc_group_id,
+                        "payer_id": payer_id,
+                        "payee_id": payee_id,
+                        "amount": amount,
+                        "description": description,
+                        "idempotency_key": idempotency_key,
+                    },
+                },
+                {
+                    "method": "POST",
+                    "url": "/api/collections/mc_entries/records",
+                    "body": {
+                        "transaction_id": transaction_id,
+                        "account_id": payer_account_id,
+                        "amount": -amount,
+                        "balance_after": new_payer_balance,
+                    },
+                },
+                {
+                    "method": "POST",
+                    "url": "/api/collections/mc_entries/records",
+                    "body": {
+                        "transaction_id": transaction_id,
+                        "account_id": payee_account_id,
+                        "amount": amount,
+                        "balance_after": new_payee_balance,
+                    },
+                },
+                {
+                    "method": "PATCH",
+                    "url": f"/api/collections/mc_accounts/records/{payer_account_id}",
+                    "body": payer_update,
+                },
+                {
+                    "method": "PATCH",
+                    "url": f"/api/collections/mc_accounts/records/{payee_account_id}",
+                    "body": payee_update,
+                },
+            ]
+        )
+        return {"transaction": transaction, "payer_entry": payer_entry, "payee_entry": payee_entry}
+
+    async def mc_snapshot_latest(self, mc_group_id: str) -> dict[str, Any] | None:
+        result = await self.list_records(
+            "mc_snapshots", per_page=1, filter=f'mc_group_id="{mc_group_id}"', sort="-created_at"
+        )
+        items = result.get("items", [])
+        return items[0] if items else None
+
+    async def mc_snapshot_save(
+        self,
+        mc_group_id: str,
+        checkpoint: str,
+        account_sums: dict[str, int],
+        entry_count: int,
+        total_balance: int,
+        snapshot_id: str | None = None,
+    ) -> dict[str, Any]:
+        """Write the group's checkpoint, overwriting `snapshot_id` so each group keeps one row."""
+        data = {
+            "mc_group_id": mc_group_id,
+            "checkpoint": checkpoint,
+            "account_sums": dict(account_sums),
+            "entry_count": entry_count,
+            "total_balance": total_balance,
+        }
+        if snapshot_id:
+            return await self.update_record("mc_snapshots", snapshot_id, data)
+        return await self.create_record("mc_snapshots", data)
+
+    async def ledger_remote_get(self, telegram_chat_id: int) -> dict[str, Any] | None:
+        return await self.get_first("ledger_remotes", f"telegram_chat_id={telegram_chat_id}")
+
     async def sanction_create(
         self,
         member_id: str,
@@ -0,0 +1,235 @@
+"""PocketBase filter expressions for the fake: parsed once into a small AST, then evaluated.
+
+Covers the subset of the filter language this repo uses: comparisons (`= != > >= < <= ~ !~`)
+between fields (dotted paths follow relations) and string, number, boolean or null literals,
+combined with `&&`, `||` and parentheses. `&&` binds tighter than `||`.
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+# Alternatives are tried in order: operators longest first, so ">=" isn't read as ">" and "=".
+_TOKEN = re.compile(
+    r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<number>-?\d+(?:\.\d+)?)(?![\w.])
+      | (?P<name>[A-Za-z_@][\w.@:]*)
+      | (?P<logic>&&|\|\|)
+      | (?P<op>!=|>=|<=|!~|=|>|<|~)
+      | (?P<paren>[()])
+    )
+    """,
+    re.VERBOSE,
+)
+
+
+class FilterError(ValueError):
+    """The filter isn't valid (PocketBase answers 400)."""
+
+
+@dataclass(frozen=True)
+class Field:
+    path: str
+
+
+@dataclass(frozen=True)
+class Literal:
+    value: Any
+
+
+Operand = Field | Literal
+Getter = Callable[[str], Any]
+
+
+@dataclass(frozen=True)
+class Comparison:
+    left: Operand
+    op: str
+    right: Operand
+
+    def matches(self, get: Getter) -> bool:
+        return _compare(_value(self.left, get), self.op, _value(self.right, get))
+
+    def field_equals(self) -> tuple[str, Any] | None:
+        """(path, literal) when this is `path = literal` in either order, else None."""
+        if self.op != "=":
+            return None
+        if isinstance(self.left, Field) and isinstance(self.right, Literal):
+            return self.left.path, self.right.value
+        if isinstance(self.right, Field) and isinstance(self.left, Literal):
+            return self.right.path, self.left.value
+        return None
+
+
+@dataclass(frozen=True)
+class And:
+    left: Node
+    right: Node
+
+    def matches(self, get: Getter) -> bool:
+        return self.left.matches(get) and self.right.matches(get)
+
+
+@dataclass(frozen=True)
+class Or:
+    left: Node
+    right: Node
+
+    def matches(self, get: Getter) -> bool:
+        return self.left.matches(get) or self.right.matches(get)
+
+
+Node = Comparison | And | Or
+
+
+def _value(operand: Operand, get: Getter) -> Any:
+    return get(operand.path) if isinstance(operand, Field) else operand.value
+
+
+def _blank(like: Any) -> Any:
+    # PocketBase stores unset fields as their zero value; a missing field compares like one.
+    if isinstance(like, bool):
+        return False
+    if isinstance(like, (int, float)):
+        return 0
+    return ""
+
+
+def _orderable(a: Any, b: Any) -> bool:
+    if isinstance(a, str) and isinstance(b, str):
+        return True
+    numbers = (int, float)
+    return isinstance(a, numbers) and isinstance(b, numbers)
+
+
+@functools.lru_cache(maxsize=256)
+def _like(pattern: str) -> re.Pattern[str]:
+    # `~` is SQL LIKE, wrapped in % when the pattern has no wildcard of its own.
+    if "%" not in pattern:
+        pattern = f"%{pattern}%"
+    parts = (re.escape(part) for part in pattern.split("%"))
+    return re.compile(".*".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def _compare(left: Any, op: str, right: Any) -> bool:
+    if left is None:
+        left = _blank(right)
+    if right is None:
+        right = _blank(left)
+    if op == "=":
+        return left == right
+    if op == "!=":
+        return left != right
+    if op in ("~", "!~"):
+        found = _like(str(right)).fullmatch(str(left)) is not None
+        return found if op == "~" else not found
+    if not _orderable(left, right):
+        return False
+    if op == ">":
+        return left > right
+    if op == ">=":
+        return left >= right
+    if op == "<":
+        return left < right
+    return left <= right
+
+
+def _unquote(token: str) -> str:
+    return re.sub(r"\\(.)", r"\1", token[1:-1])
+
+
+def _tokens(text: str) -> Iterator[tuple[str, str]]:
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            raise FilterError(f"invalid filter near {text[pos:pos + 20]!r}")
+        pos = m.end()
+        kind = m.lastgroup or ""
+        yield kind, m.group(kind)
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = list(_tokens(text))
+        self.pos = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise FilterError("unexpected end of filter")
+        self.pos += 1
+        return token
+
+    def parse(self) -> Node:
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise FilterError(f"unexpected {self.peek()[1]!r}")  # type: ignore[index]
+        return node
+
+    def parse_or(self) -> Node:
+        node = self.parse_and()
+        while self.peek() == ("logic", "||"):
+            self.take()
+            node = Or(node, self.parse_and())
+        return node
+
+    def parse_and(self) -> Node:
+        node = self.parse_term()
+        while self.peek() == ("logic", "&&"):
+            self.take()
+            node = And(node, self.parse_term())
+        return node
+
+    def parse_term(self) -> Node:
+        if self.peek() == ("paren", "("):
+            self.take()
+            node = self.parse_or()
+            if self.take() != ("paren", ")"):
+                raise FilterError("missing )")
+            return node
+        left = self.parse_operand()
+        kind, op = self.take()
+        if kind != "op":
+            raise FilterError(f"expected an operator, got {op!r}")
+        return Comparison(left, op, self.parse_operand())
+
+    def parse_operand(self) -> Operand:
+        kind, text = self.take()
+        if kind == "string":
+            return Literal(_unquote(text))
+        if kind == "number":
+            return Literal(float(text) if "." in text else int(text))
+        if kind == "name":
+            keyword = text.lower()
+            if keyword in ("true", "false"):
+                return Literal(keyword == "true")
+            if keyword == "null":
+                return Literal(None)
+            return Field(text)
+        raise FilterError(f"expected a field or value, got {text!r}")
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_filter(text: str) -> Node:
+    """Parse a filter into an AST. Results are cached: callers reuse the same filters a lot."""
+    return _Parser(text).parse()
+
+
+def conjuncts(node: Node) -> Iterator[Node]:
+    """The terms of a top-level `a && b && c` chain (just `node` if it isn't one)."""
+    if isinstance(node, And):
+        yield from conjuncts(node.left)
+        yield from conjuncts(node.right)
+    else:
+        yield node
@@ -0,0 +1,260 @@
+"""FakePocketBase behind PocketBase's REST API, for the real clients, load tests and local runs.
+
+Serves the endpoints the repo's PocketBase clients call (auth, record CRUD, `/api/batch`,
+multipart uploads) with PocketBase's status codes and error bodies. Not a general PocketBase:
+no rules, realtime or file downloads. Run it standalone with
+
+    python -m tests.fake_pocketbase_http --port 8090 --token dev-token
+"""
+
+from __future__ import annotations
+
+import argparse
+import email.parser
+import email.policy
+import json
+import math
+from typing import Any
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from commontrust_api.pocketbase_client import PocketBaseConflictError
+from tests.fake_pocketbase import FakeDuplicateError, FakePocketBase
+from tests.fake_pocketbase_filter import FilterError
+
+DEFAULT_TOKEN = "fake-pocketbase-token"
+MAX_PER_PAGE = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str, data: dict[str, Any] | None = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.data = data or {}
+
+    def body(self) -> dict[str, Any]:
+        return {"code": self.status, "message": self.message, "data": self.data}
+
+
+def _api_error(e: Exception) -> ApiError:
+    """The error PocketBase would answer for an exception raised by the fake."""
+    if isinstance(e, ApiError):
+        return e
+    if isinstance(e, KeyError):
+        return ApiError(404, "The requested resource wasn't found.")
+    if isinstance(e, FilterError):
+        return ApiError(400, f"Invalid filter parameters: {e}")
+    if isinstance(e, FakeDuplicateError):
+        name = (str(e).split(":", 1)[-1].split() or ["id"])[0]
+        return ApiError(
+            400,
+            "Failed to create record.",
+            {name: {"code": "validation_not_unique", "message": "Value must be unique."}},
+        )
+    if isinstance(e, PocketBaseConflictError):
+        # pb_hooks/mc_accounts_version.pb.js throws ApiError(409, "version_conflict").
+        return ApiError(409, "version_conflict")
+    if isinstance(e, ValueError):
+        return ApiError(400, str(e))
+    raise e
+
+
+def _coerce(definition: dict[str, Any] | None, values: list[str]) -> Any:
+    # Multipart fields arrive as text; PocketBase converts them by the field's type.
+    kind = (definition or {}).get("type")
+    multiple = (definition or {}).get("maxSelect", 1) != 1
+    if kind == "number":
+        value = float(values[-1] or 0)
+        return int(value) if value.is_integer() else value
+    if kind == "bool":
+        return values[-1].lower() in ("1", "true", "on")
+    if kind == "json":
+        return json.loads(values[-1]) if values[-1] else None
+    if kind in ("relation", "select", "file") and multiple:
+        return values
+    return values[-1]
+
+
+class PocketBaseApp:
+    def __init__(self, pb: FakePocketBase, token: str = DEFAULT_TOKEN):
+        self.pb = pb
+        self.token = token
+
+    def _authorize(self, request: Request) -> None:
+        header = request.headers.get("authorization", "")
+        if header.removeprefix("Bearer ").strip() != self.token:
+            raise ApiError(401, "The request requires valid record authorization token.")
+
+    def _public(self, request: Request, record: dict[str, Any]) -> dict[str, Any]:
+        names = [n.strip() for n in request.query_params.get("fields", "").split(",") if n.strip()]
+        if not names or "*" in names:
+            return dict(record)
+        return {name: record[name] for name in names if name in record}
+
+    async def health(self, request: Request) -> Response:
+        return JSONResponse({"code": 200, "message": "API is healthy.", "data": {}})
+
+    async def auth_with_password(self, request: Request) -> Response:
+        # Any superuser credentials will do; the token is what the other routes check.
+        body = await request.json()
+        if not body.get("identity") or not body.get("password"):
+            raise ApiError(400, "Failed to authenticate.")
+        return JSONResponse({"token": self.token, "record": {"email": body["identity"]}})
+
+    async def view_collection(self, request: Request) -> Response:
+        self._authorize(request)
+        name = request.path_params["collection"]
+        if name not in self.pb.schema.fields:
+            raise ApiError(404, "The requested resource wasn't found.")
+        return JSONResponse({"name": name, "indexes": list(self.pb.schema.index_sql.get(name, ()))})
+
+    async def list_records(self, request: Request) -> Response:
+        self._authorize(request)
+        params = request.query_params
+        try:
+            page = max(1, int(params.get("page", 1)))
+            per_page = min(MAX_PER_PAGE, max(1, int(params.get("perPage", 30))))
+        except ValueError as e:
+            raise ApiError(400, f"Invalid pagination parameters: {e}") from e
+        result = await self.pb.list_records(
+            request.path_params["collection"],
+            page=page,
+            per_page=per_page,
+            filter=params.get("filter") or None,
+            sort=params.get("sort") or None,
+            expand=params.get("expand") or None,
+            skip_total=params.get("skipTotal", "").lower() in ("1", "true"),
+        )
+        total = result["totalItems"]
+        return JSONResponse(
+            {
+                "page": page,
+                "perPage": per_page,
+                "totalItems": total,
+                "totalPages": math.ceil(total / per_page) if total >= 0 else -1,
+                "items": [self._public(request, r) for r in result["items"]],
+            }
+        )
+
+    async def view_record(self, request: Request) -> Response:
+        self._authorize(request)
+        record = await self.pb.get_record(
+            request.path_params["collection"], request.path_params["record_id"]
+        )
+        if expand := request.query_params.get("expand"):
+            record = self.pb._expanded(record, expand)
+        return JSONResponse(self._public(request, record))
+
+    async def create_record(self, request: Request) -> Response:
+        self._authorize(request)
+        collection = request.path_params["collection"]
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            data, files = await self._multipart(request, collection)
+            record = await self.pb.create_record_with_files(collection, data, files)
+        else:
+            record = await self.pb.create_record(collection, await request.json())
+        return JSONResponse(self._public(request, record))
+
+    async def _multipart(
+        self, request: Request, collection: str
+    ) -> tuple[dict[str, Any], list[tuple[str, str, bytes, str]]]:
+        # python-multipart isn't a dependency; the stdlib MIME parser reads form-data fine.
+        head = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            head + await request.body()
+        )
+        definitions = self.pb.schema.fields.get(collection, {})
+        values: dict[str, list[str]] = {}
+        files: list[tuple[str, str, bytes, str]] = []
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename() is not None:
+                files.append((name, part.get_filename(), payload, part.get_content_type()))
+            else:
+                values.setdefault(name, []).append(payload.decode())
+        data = {name: _coerce(definitions.get(name), v) for name, v in values.items()}
+        return data, files
+
+    async def update_record(self, request: Request) -> Response:
+        self._authorize(request)
+        collection, record_id = request.path_params["collection"], request.path_params["record_id"]
+        record = await self.pb.update_record(collection, record_id, await request.json())
+        return JSONResponse(self._public(request, record))
+
+    async def delete_record(self, request: Request) -> Response:
+        self._authorize(request)
+        collection, record_id = request.path_params["collection"], request.path_params["record_id"]
+        self.pb._stored(collection, record_id)
+        await self.pb.delete_record(collection, record_id)
+        return Response(status_code=204)
+
+    async def batch(self, request: Request) -> Response:
+        self._authorize(request)
+        body = await request.json()
+        try:
+            results = await self.pb.batch(body.get("requests") or [])
+        except Exception as e:
+            # The whole transaction was rolled back; the failing write's error is nested.
+            error = _api_error(e)
+            raise ApiError(
+                400,
+                "Batch transaction failed.",
+                {"requests": {"code": "batch_request_failed", "response": error.body()}},
+            ) from e
+        return JSONResponse(
+            [{"status": 204 if r == {} else 200, "body": r or None} for r in results]
+        )
+
+
+def pocketbase_app(pb: FakePocketBase | None = None, token: str = DEFAULT_TOKEN) -> Starlette:
+    """An ASGI app serving `pb` (a fresh, empty FakePocketBase by default)."""
+    api = PocketBaseApp(pb if pb is not None else FakePocketBase(), token)
+    records = "/api/collections/{collection}/records"
+
+    async def on_error(request: Request, e: Exception) -> Response:
+        error = _api_error(e)
+        return JSONResponse(error.body(), status_code=error.status)
+
+    app = Starlette(
+        routes=[
+            Route("/api/health", api.health, methods=["GET"]),
+            Route("/api/admins/auth-with-password", api.auth_with_password, methods=["POST"]),
+            Route(
+                "/api/collections/_superusers/auth-with-password",
+                api.auth_with_password,
+                methods=["POST"],
+            ),
+            Route("/api/collections/{collection}", api.view_collection, methods=["GET"]),
+            Route(records, api.list_records, methods=["GET"]),
+            Route(records, api.create_record, methods=["POST"]),
+            Route(records + "/{record_id}", api.view_record, methods=["GET"]),
+            Route(records + "/{record_id}", api.update_record, methods=["PATCH"]),
+            Route(records + "/{record_id}", api.delete_record, methods=["DELETE"]),
+            Route("/api/batch", api.batch, methods=["POST"]),
+        ],
+        exception_handlers=dict.fromkeys(
+            (ApiError, KeyError, ValueError, FakeDuplicateError, PocketBaseConflictError), on_error
+        ),
+    )
+    app.state.pb = api.pb
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--token", default=DEFAULT_TOKEN)
+    args = parser.parse_args()
+    uvicorn.run(pocketbase_app(token=args.token), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
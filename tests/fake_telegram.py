@@ -30,3 +30,34 @@ class FakeMessage:
     async def answer(self, text: str, **kwargs: Any) -> None:
         self.answers.append({"text": text, **kwargs})
 
+
+
+class FakeTelegramSender:
+    """Posts updates to a webhook the way the Bot API does: JSON body plus the secret header."""
+
+    def __init__(self, client: Any, path: str, secret: str) -> None:
+        self.client = client
+        self.path = path
+        self.secret = secret
+        self._update_id = 0
+
+    def message_update(self, chat_id: int, user_id: int, text: str) -> dict[str, Any]:
+        self._update_id += 1
+        return {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id,
+                "date": 1700000000,
+                "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                "text": text,
+            },
+        }
+
+    async def send(self, update: dict[str, Any], secret: str | None = None) -> int:
+        resp = await self.client.post(
+            self.path,
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": self.secret if secret is None else secret},
+        )
+        return resp.status
@@ -0,0 +1,187 @@
+import asyncio
+
+import pytest
+
+from commontrust_bot.services import report as report_mod
+from commontrust_bot.services.ai_queue import AIReviewQueue, AIReviewWorkerPool
+from commontrust_bot.services.ai_review import AIReviewError, AIReviewResult
+from commontrust_bot.services.report import ReportService
+from commontrust_bot.services.reputation import ReputationService
+
+
+async def _pending_report(fake_pb) -> dict:
+    reporter = await fake_pb.create_record("members", {"telegram_id": 1, "display_name": "A"})
+    reported = await fake_pb.create_record("members", {"telegram_id": 2, "display_name": "B"})
+    return await fake_pb.create_record(
+        "reports",
+        {
+            "reporter_id": reporter["id"],
+            "reported_id": reported["id"],
+            "description": "never delivered",
+            "status": "pending_ai",
+        },
+    )
+
+
+async def _run_until(pool: AIReviewWorkerPool, notified: list, count: int) -> None:
+    async def _notify(report: dict) -> None:
+        notified.append(report)
+
+    await pool.start(notify=_notify)
+    try:
+        for _ in range(200):
+            if len(notified) >= count:
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("AI review workers did not finish")
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_survives_reopen_and_hides_claimed_jobs(tmp_path) -> None:
+    path = str(tmp_path / "ai.sqlite3")
+    queue = AIReviewQueue(path)
+    await queue.put("r1")
+    await queue.put("r1")
+    await queue.put("r2")
+    queue.close()
+
+    reopened = AIReviewQueue(path)
+    assert await reopened.pending_count() == 2
+    first = await reopened.claim()
+    second = await reopened.claim()
+    assert {first, second} == {("r1", 0), ("r2", 0)}
+    assert await reopened.claim() is None
+
+    await reopened.retry("r1", 1, delay=3600, error="boom")
+    assert await reopened.claim() is None
+    assert await reopened.next_due_in() > 3500
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_retries_failed_analysis_then_notifies(fake_pb, monkeypatch) -> None:
+    report = await _pending_report(fake_pb)
+    calls: list[str] = []
+
+    async def flaky_analyze(**kwargs):
+        calls.append(kwargs["description"])
+        if len(calls) < 3:
+            raise AIReviewError("429 Too Many Requests")
+        return AIReviewResult(severity=8, summary="likely scam", recommendation="ban")
+
+    monkeypatch.setattr(report_mod, "analyze_report", flaky_analyze)
+    reports = ReportService(pb=fake_pb, reputation=ReputationService(pb=fake_pb))
+    pool = AIReviewWorkerPool(AIReviewQueue(), reports=reports, retry_base_delay=0.0)
+
+    notified: list[dict] = []
+    # Not submitted: start() picks up reports PocketBase still has in pending_ai.
+    await _run_until(pool, notified, 1)
+
+    assert len(calls) == 3
+    assert [r["id"] for r in notified] == [report["id"]]
+    stored = await fake_pb.get_record("reports", report["id"])
+    assert stored["status"] == "pending_admin" and stored["ai_severity"] == 8
+    assert await pool.queue.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_pool_hands_report_to_admins_after_max_attempts(fake_pb, monkeypatch) -> None:
+    report = await _pending_report(fake_pb)
+
+    async def failing_analyze(**kwargs):
+        raise AIReviewError("503 Service Unavailable")
+
+    monkeypatch.setattr(report_mod, "analyze_report", failing_analyze)
+    reports = ReportService(pb=fake_pb, reputation=ReputationService(pb=fake_pb))
+    pool = AIReviewWorkerPool(
+        AIReviewQueue(), reports=reports, max_attempts=2, retry_base_delay=0.0
+    )
+
+    notified: list[dict] = []
+    await _run_until(pool, notified, 1)
+
+    stored = await fake_pb.get_record("reports", report["id"])
+    assert stored["status"] == "pending_admin"
+    assert stored["ai_summary"].startswith("AI analysis failed")
+    assert notified[0]["id"] == report["id"]
+    assert await pool.queue.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_review_context_is_fetched_in_one_concurrent_wave(fake_pb, monkeypatch) -> None:
+    report = await _pending_report(fake_pb)
+    for member_id in (report["reporter_id"], report["reported_id"]):
+        await fake_pb.reputation_update(
+            member_id, 1, 4.0, reviewer_stats={"r": {"sum": 4, "count": 1}}, verified_deal_ids=["d"]
+        )
+    prompts: list[dict] = []
+
+    async def capture_analyze(**kwargs):
+        prompts.append(kwargs)
+        return AIReviewResult(severity=3)
+
+    monkeypatch.setattr(report_mod, "analyze_report", capture_analyze)
+
+    # Each fake round-trip takes a moment; calls that overlap belong to the same wave.
+    in_flight = 0
+    waves: list[int] = []
+    collections: list[str] = []
+    list_records = fake_pb.list_records
+
+    async def tracking_list(collection, *args, **kwargs):
+        collections.append(collection)
+        return await list_records(collection, *args, **kwargs)
+
+    async def slow_tick() -> None:
+        nonlocal in_flight
+        if in_flight == 0:
+            waves.append(0)
+        in_flight += 1
+        waves[-1] += 1
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    fake_pb._tick = slow_tick
+    fake_pb.list_records = tracking_list
+    reports = ReportService(pb=fake_pb, reputation=ReputationService(pb=fake_pb))
+    await reports.trigger_ai_review(report["id"])
+
+    # Report fetch, then members/reputation/prior reports together, then the write-back.
+    assert waves == [1, 5, 1]
+    assert "deals" not in collections
+    assert prompts[0]["reporter_deals"] == 1 and prompts[0]["prior_reports"] == 1
+
+
+@pytest.mark.asyncio
+async def test_submit_during_idle_due_time_query_wakes_worker(fake_pb, monkeypatch) -> None:
+    report = await _pending_report(fake_pb)
+
+    async def analyze(**kwargs):
+        return AIReviewResult(severity=2)
+
+    monkeypatch.setattr(report_mod, "analyze_report", analyze)
+    reports = ReportService(pb=fake_pb, reputation=ReputationService(pb=fake_pb))
+    pool = AIReviewWorkerPool(
+        AIReviewQueue(), reports=reports, concurrency=1, idle_poll_seconds=60
+    )
+    await fake_pb.update_record("reports", report["id"], {"status": "pending_admin"})
+    next_due_in = pool.queue.next_due_in
+    submitted = False
+
+    async def racing_next_due_in():
+        # The report arrives after the due-time query ran but before the worker sleeps.
+        nonlocal submitted
+        due_in = await next_due_in()
+        if not submitted:
+            submitted = True
+            await fake_pb.update_record("reports", report["id"], {"status": "pending_ai"})
+            await pool.submit(report["id"])
+        return due_in
+
+    pool.queue.next_due_in = racing_next_due_in
+    notified: list[dict] = []
+    await _run_until(pool, notified, 1)
+
+    assert [r["id"] for r in notified] == [report["id"]]
@@ -0,0 +1,87 @@
+import httpx
+import pytest
+
+from commontrust_api import pocketbase_client as api_pb
+from commontrust_api.app import create_app
+from commontrust_api.config import api_settings
+
+
+def _pb(handler) -> api_pb.PocketBaseClient:
+    pb = api_pb.PocketBaseClient(base_url="http://pb")
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return pb
+
+
+def _client(app) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api")
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_exports_request_and_pocketbase_metrics(monkeypatch) -> None:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"items": [], "totalItems": 0})
+
+    monkeypatch.setattr(api_settings, "api_token", "api-tok")
+    app = create_app()
+    app.state.pb = _pb(handler)
+    async with _client(app) as client:
+        auth = {"Authorization": "Bearer api-tok"}
+        missing = await client.get("/v1/identity/members/by_username/alice", headers=auth)
+        denied = await client.get("/v1/identity/members/by_username/bob")
+        resp = await client.get("/metrics")
+    await app.state.pb.close()
+
+    assert (missing.status_code, denied.status_code) == (404, 401)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    route = "/v1/identity/members/by_username/{username}"
+    assert f'api_request_seconds_count{{method="GET",route="{route}"}}' in text
+    assert f'api_responses_total{{method="GET",route="{route}",status="401"}}' in text
+    assert "alice" not in text and "bob" not in text
+    assert "api_requests_in_flight 1" in text  # the scrape itself
+    assert 'api_cache_hits_total{cache="group_directory"}' in text
+    assert 'api_http_pool_connections{upstream="pocketbase",state="idle"}' in text
+    assert 'pocketbase_responses_total{method="GET",collection="members",status="200"}' in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_token_is_separate_from_the_api_token(monkeypatch) -> None:
+    monkeypatch.setattr(api_settings, "api_token", "api-tok")
+    monkeypatch.setattr(api_settings, "metrics_token", "scrape-tok")
+    app = create_app()
+    async with _client(app) as client:
+        assert (await client.get("/metrics")).status_code == 401
+        api_token = {"Authorization": "Bearer api-tok"}
+        assert (await client.get("/metrics", headers=api_token)).status_code == 401
+        scrape = {"Authorization": "Bearer scrape-tok"}
+        assert (await client.get("/metrics", headers=scrape)).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_health_and_readiness_probes() -> None:
+    pocketbase_up = True
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if not pocketbase_up:
+            raise httpx.ConnectError("connection refused")
+        assert request.headers["Authorization"] == "t"
+        return httpx.Response(200, json={"items": [{"id": "m1"}]})
+
+    app = create_app()
+    app.state.pb = _pb(handler)
+    async with _client(app) as client:
+        assert (await client.get("/healthz")).json() == {"status": "ok"}
+        ready = await client.get("/readyz")
+        assert ready.status_code == 200
+
+        pocketbase_up = False
+        assert (await client.get("/healthz")).status_code == 200
+        unready = await client.get("/readyz")
+        assert unready.status_code == 503
+        assert unready.json() == {"status": "unavailable", "pocketbase": "ConnectError"}
+
+        app.state.pb.token = None
+        assert (await client.get("/readyz")).json()["pocketbase"] == "PocketBaseError"
+    await app.state.pb.close()
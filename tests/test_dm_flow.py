@@ -124,7 +124,7 @@ async def test_next_message_after_review_notification_submits_response(monkeypat
     )
 
     # Simulate the user receiving a review notification (sets pending state)
-    review_notify._PENDING_REVIEW_RESPONSE[2] = review["id"]
+    await review_notify.set_pending_review_response(2, review["id"])
 
     # User sends a message (any message in the chat)
     response_msg = FakeMessage(
@@ -143,7 +143,7 @@ async def test_next_message_after_review_notification_submits_response(monkeypat
     assert "published on the ledger" in response_msg.answers[-1]["text"]
 
     # Verify pending state was cleared
-    assert 2 not in review_notify._PENDING_REVIEW_RESPONSE
+    assert await review_notify.get_pending_review_response(2) is None
 
 
 @pytest.mark.asyncio
@@ -184,3 +184,33 @@ async def test_clicking_different_star_updates_existing_review(monkeypatch) -> N
     assert review["rating"] == 5
     assert review["comment"] == "initial"
     assert "Rating updated." in query.answers[-1]["text"]
+
+
+@pytest.mark.asyncio
+async def test_evidence_downloads_are_spooled_and_failures_skipped() -> None:
+    from types import SimpleNamespace
+
+    from commontrust_bot.handlers import report as report_handlers
+
+    photos = {"small": b"a" * 10, "large": b"b" * (report_handlers._EVIDENCE_SPOOL_BYTES + 1)}
+
+    class _DownloadBot:
+        async def get_file(self, file_id: str):
+            if file_id not in photos:
+                raise RuntimeError("file is too big")
+            return SimpleNamespace(file_path=file_id)
+
+        async def download_file(self, file_path: str, destination, **kwargs) -> None:
+            data = photos[file_path]
+            for start in range(0, len(data), 65536):
+                destination.write(data[start : start + 65536])
+
+    files = await report_handlers._download_evidence(_DownloadBot(), ["small", "gone", "large"])
+    try:
+        assert [name for name, _, _ in files] == ["evidence_0.jpg", "evidence_2.jpg"]
+        small, large = files[0][1], files[1][1]
+        assert not small._rolled and large._rolled
+        assert small.read() == photos["small"] and large.read() == photos["large"]
+    finally:
+        for _, content, _ in files:
+            content.close()
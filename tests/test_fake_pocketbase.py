@@ -0,0 +1,181 @@
+import httpx
+import pytest
+
+from commontrust_api.pocketbase_client import PocketBaseClient as ApiPocketBaseClient
+from commontrust_api.pocketbase_client import (
+    PocketBaseConflictError,
+    PocketBaseDuplicateError,
+    PocketBaseError,
+)
+from commontrust_bot.pocketbase_client import PocketBaseClient as BotPocketBaseClient
+from tests.fake_pocketbase import FakeDuplicateError, FakePocketBase, RoundTripLog
+from tests.fake_pocketbase_filter import And, FilterError, Or, parse_filter
+from tests.fake_pocketbase_http import DEFAULT_TOKEN, pocketbase_app
+
+
+def test_filter_precedence_and_semantics() -> None:
+    node = parse_filter('a=1 || b="x" && (c>2 || d~"Ab%")')
+    assert isinstance(node, Or)
+    assert isinstance(node.right, And)
+    assert parse_filter('a=1 || b="x"') is parse_filter('a=1 || b="x"')
+
+    record = {"a": 0, "b": "x", "c": 1, "d": "abc", "flag": True}
+    assert node.matches(record.get)
+    assert parse_filter("flag=TRUE && missing=null && missing=0").matches(record.get)
+    assert parse_filter('d!~"z" && b>"w" && c<"2"').matches(record.get) is False
+    assert parse_filter("d~'b'").matches(record.get)
+
+    with pytest.raises(FilterError):
+        parse_filter("a=1 &&")
+    with pytest.raises(FilterError):
+        parse_filter("(a=1")
+
+
+@pytest.mark.asyncio
+async def test_indexes_narrow_candidates_including_one_relation_hop() -> None:
+    pb = FakePocketBase()
+    pb.load("members", ({"id": f"m{i:05d}", "telegram_id": i} for i in range(5000)))
+    pb.load("mc_accounts", ({"id": f"a{i}", "mc_group_id": f"g{i % 3}"} for i in range(300)))
+    pb.load(
+        "mc_entries",
+        ({"id": f"e{i:04d}", "account_id": f"a{i % 300}", "amount": i} for i in range(3000)),
+    )
+
+    assert pb._candidates("members", parse_filter("telegram_id=4321")) == {"m04321"}
+    assert pb._candidates("members", parse_filter('username~"bob"')) is None
+    either = parse_filter("telegram_id=1 || telegram_id=2")
+    assert pb._candidates("members", either) == {"m00001", "m00002"}
+
+    joined = 'account_id.mc_group_id="g1" && amount>=2990'
+    assert len(pb._candidates("mc_entries", parse_filter(joined))) == 1000
+    result = await pb.list_records("mc_entries", filter=joined, sort="-amount")
+    assert [r["amount"] for r in result["items"]] == [2998, 2995, 2992]
+    assert result["totalItems"] == 3
+
+
+@pytest.mark.asyncio
+async def test_iter_records_pages_by_keyset_without_totals() -> None:
+    pb = FakePocketBase(round_trips=RoundTripLog())
+    statuses = ("pending", "completed")
+    pb.load("deals", ({"id": f"d{i:04d}", "status": statuses[i % 2]} for i in range(1000)))
+
+    seen = [r["id"] async for r in pb.iter_records("deals", 'status="completed"', per_page=100)]
+
+    assert seen == [f"d{i:04d}" for i in range(1, 1000, 2)]
+    assert pb.round_trips.round_trips == 6
+    page = await pb.list_records("deals", page=3, per_page=10, sort="-id", skip_total=True)
+    assert page["totalItems"] == -1
+    assert [r["id"] for r in page["items"]][:2] == ["d0979", "d0978"]
+
+
+@pytest.mark.asyncio
+async def test_unique_indexes_and_batch_rollback() -> None:
+    pb = FakePocketBase()
+    await pb.create_record("reputation", {"member_id": "m1"})
+    with pytest.raises(FakeDuplicateError, match="member_id"):
+        await pb.create_record("reputation", {"member_id": "m1"})
+
+    # Partial index: blank idempotency keys never collide.
+    for _ in range(2):
+        await pb.create_record("mc_transactions", {"mc_group_id": "g", "idempotency_key": ""})
+    await pb.create_record("mc_transactions", {"mc_group_id": "g", "idempotency_key": "k"})
+    with pytest.raises(PocketBaseDuplicateError):
+        await pb.create_record("mc_transactions", {"mc_group_id": "g", "idempotency_key": "k"})
+
+    account = await pb.create_record("mc_accounts", {"mc_group_id": "g", "balance": 0})
+    with pytest.raises(FakeDuplicateError):
+        await pb.batch(
+            [
+                {
+                    "method": "PATCH",
+                    "url": f"/api/collections/mc_accounts/records/{account['id']}",
+                    "body": {"balance": 5},
+                },
+                {
+                    "method": "POST",
+                    "url": "/api/collections/mc_transactions/records",
+                    "body": {"mc_group_id": "g", "idempotency_key": "k"},
+                },
+            ]
+        )
+    assert pb.data["mc_accounts"][account["id"]]["balance"] == 0
+    assert (await pb.get_first("mc_accounts", 'mc_group_id="g" && balance=0')) is not None
+    assert len(pb.data["mc_transactions"]) == 3
+
+
+def _api_client(app) -> ApiPocketBaseClient:
+    client = ApiPocketBaseClient(base_url="http://pb", admin_token=DEFAULT_TOKEN)
+    client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_http_front_end_serves_the_real_api_client() -> None:
+    pb = FakePocketBase()
+    pb.load("members", ({"id": f"m{i:03d}", "telegram_id": i} for i in range(120)))
+    client = _api_client(pocketbase_app(pb))
+    await client.authenticate()
+
+    await client.ping()
+    member = await client.get_first("members", "telegram_id=77")
+    assert member is not None and member["id"] == "m077"
+    ids = [r["id"] async for r in client.iter_records("members", "telegram_id>=10", per_page=50)]
+    assert len(ids) == 110 and ids == sorted(ids)
+    page = await client.list_records("members", page=2, per_page=50, sort="-telegram_id")
+    assert page["totalItems"] == 120 and page["totalPages"] == 3
+    assert page["items"][0]["telegram_id"] == 69
+
+    group = await client.mc_group_create("grp")
+    payer = await client.mc_account_create(group["id"], "m001")
+    payee = await client.mc_account_create(group["id"], "m002")
+    await client.mc_payment_create(
+        group["id"], "m001", "m002", payer["id"], payee["id"], 5, -5, 5,
+        idempotency_key="pay-1", payer_version=0, payee_version=0,
+    )
+    assert pb.data["mc_accounts"][payer["id"]]["balance"] == -5
+    assert pb.data["mc_accounts"][payer["id"]]["version"] == 1
+    assert len(pb.data["mc_entries"]) == 2
+
+    with pytest.raises(PocketBaseConflictError):
+        await client.mc_account_update(payee["id"], 9, expected_version=0)
+    with pytest.raises(PocketBaseConflictError):
+        await client.mc_payment_create(
+            group["id"], "m001", "m002", payer["id"], payee["id"], 1, -6, 6,
+            payer_version=0, payee_version=1,
+        )
+    assert len(pb.data["mc_entries"]) == 2
+    await client.create_record("reputation", {"member_id": "m001"})
+    with pytest.raises(PocketBaseDuplicateError):
+        await client.create_record("reputation", {"member_id": "m001"})
+    with pytest.raises(PocketBaseError, match="400"):
+        await client.list_records("members", filter="telegram_id=")
+    with pytest.raises(PocketBaseError, match="404"):
+        await client.get_record("members", "missing")
+
+    client.token = "wrong"
+    with pytest.raises(PocketBaseError, match="401"):
+        await client.ping()
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_http_front_end_accepts_multipart_uploads() -> None:
+    pb = FakePocketBase()
+    client = BotPocketBaseClient(base_url="http://pb", admin_token=DEFAULT_TOKEN)
+    client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=pocketbase_app(pb)))
+    await client.authenticate()
+
+    record = await client.create_record_with_files(
+        "reports",
+        {"reporter_id": "m1", "ai_severity": 3, "forwarded_messages": [{"text": "hi"}]},
+        files=[
+            ("evidence_photos", "a.png", b"\x89PNG", "image/png"),
+            ("evidence_photos", "b.jpg", b"\xff\xd8", "image/jpeg"),
+        ],
+    )
+
+    stored = pb.data["reports"][record["id"]]
+    assert stored["ai_severity"] == 3
+    assert stored["forwarded_messages"] == [{"text": "hi"}]
+    assert stored["evidence_photos"] == ["a.png", "b.jpg"]
+    await client.close()
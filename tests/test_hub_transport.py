@@ -0,0 +1,196 @@
+import pytest
+from cryptography.fernet import Fernet
+
+from commontrust_api.config import api_settings
+from commontrust_api.hub.crypto import encrypt_token
+from commontrust_api.hub.transport import HubTransport
+
+
+@pytest.mark.asyncio
+async def test_resolve_caches_remote_and_decrypted_token(fake_pb, monkeypatch) -> None:
+    key = Fernet.generate_key().decode("ascii")
+    monkeypatch.setattr(api_settings, "hub_remote_token_encryption_key", key)
+    await fake_pb.create_record(
+        "ledger_remotes",
+        {
+            "telegram_chat_id": -100,
+            "base_url": "https://ledger.example/",
+            "token_encrypted": encrypt_token(key, "secret"),
+        },
+    )
+
+    lookups: list[int] = []
+    ledger_remote_get = fake_pb.ledger_remote_get
+
+    async def counting_get(telegram_chat_id: int):
+        lookups.append(telegram_chat_id)
+        return await ledger_remote_get(telegram_chat_id)
+
+    fake_pb.ledger_remote_get = counting_get
+    transport = HubTransport()
+
+    remote = await transport.resolve(fake_pb, -100)
+    assert remote is not None
+    assert (remote.base_url, remote.token) == ("https://ledger.example", "secret")
+    assert await transport.resolve(fake_pb, -100) == remote
+    # Chats without a remote are cached too; they are the common case on a hub.
+    assert await transport.resolve(fake_pb, -200) is None
+    assert await transport.resolve(fake_pb, -200) is None
+    assert lookups == [-100, -200]
+
+    await transport.invalidate(-100)
+    await transport.resolve(fake_pb, -100)
+    assert lookups == [-100, -200, -100]
+
+
+@pytest.mark.asyncio
+async def test_invalidate_closes_the_client_of_a_remote_the_chat_left() -> None:
+    transport = HubTransport()
+    old = transport.client_for("https://old.example")
+    transport.breaker_for("https://old.example").record_failure()
+    kept = transport.client_for("https://kept.example")
+
+    # Token rotation on the same URL keeps the pooled connections.
+    await transport.invalidate(-100, "https://kept.example", "https://kept.example")
+    assert not kept.is_closed
+
+    await transport.invalidate(-100, "https://old.example", "https://kept.example")
+    assert old.is_closed
+    assert set(transport.clients()) == {"https://kept.example"}
+    assert transport.breaker_for("https://old.example").state == "closed"
+
+    await transport.invalidate(-100, "https://kept.example")
+    assert kept.is_closed and transport.clients() == {}
+    await transport.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_for_reuses_one_pooled_client_per_remote() -> None:
+    transport = HubTransport(max_connections=5)
+    a = transport.client_for("https://a.example")
+    assert transport.client_for("https://a.example") is a
+    assert transport.client_for("https://b.example") is not a
+    assert transport.stats()["clients"] == 2
+
+    await transport.aclose()
+    assert a.is_closed
+    assert transport.client_for("https://a.example") is not a
+    await transport.aclose()
+
+
+def test_circuit_breaker_opens_probes_and_closes() -> None:
+    from commontrust_api.hub.breaker import CircuitBreaker
+
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    now[0] = 10.0
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_send_fails_fast_once_a_remote_keeps_failing() -> None:
+    import httpx
+
+    from commontrust_api.hub.breaker import CircuitOpenError
+    from commontrust_api.hub.transport import RemoteLedger
+
+    hits: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        hits.append(request.headers["Authorization"])
+        if request.url.host == "down.example":
+            return httpx.Response(502, text="bad gateway")
+        return httpx.Response(200, json={"ok": True})
+
+    transport = HubTransport(
+        breaker_failure_threshold=3, transport=httpx.MockTransport(handler)
+    )
+    down = RemoteLedger(base_url="https://down.example", token="t1")
+    up = RemoteLedger(base_url="https://up.example", token="t2")
+
+    for _ in range(3):
+        response = await transport.send(down, "GET", "/v1/ledger/groups/1/verify_zero_sum")
+        await response.aclose()
+        assert response.status_code == 502
+    with pytest.raises(CircuitOpenError):
+        await transport.send(down, "GET", "/v1/ledger/groups/1/verify_zero_sum")
+    assert hits == ["Bearer t1"] * 3
+
+    # Other remotes are unaffected.
+    response = await transport.send(up, "GET", "/v1/ledger/groups/2/verify_zero_sum")
+    assert response.status_code == 200 and (await response.aread()) == b'{"ok":true}'
+    await response.aclose()
+
+    stats = transport.stats()["remotes"]
+    assert stats["https://down.example"]["state"] == "open"
+    assert stats["https://down.example"]["errors"] == 3
+    assert stats["https://down.example"]["rejected"] == 1
+    assert stats["https://up.example"]["requests"] == 1
+    await transport.aclose()
+
+
+@pytest.mark.asyncio
+async def test_proxied_payment_maps_a_remote_dropping_mid_body_to_502(monkeypatch) -> None:
+    import json
+
+    import httpx
+
+    from commontrust_api.app import create_app
+    from commontrust_api.hub.transport import RemoteLedger
+    from commontrust_api.ledger import routes
+
+    forwarded: list[dict] = []
+
+    class DroppedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"transaction_id":'
+            raise httpx.ReadError("connection reset")
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        forwarded.append(json.loads(await request.aread()))
+        return httpx.Response(
+            200, headers={"content-type": "application/json"}, stream=DroppedStream()
+        )
+
+    transport = HubTransport(breaker_failure_threshold=1, transport=httpx.MockTransport(handler))
+    remote = RemoteLedger(base_url="https://remote.example", token="t")
+
+    async def resolve(pb, telegram_chat_id: int) -> RemoteLedger:
+        return remote
+
+    monkeypatch.setattr(transport, "resolve", resolve)
+    monkeypatch.setattr(routes, "hub_transport", transport)
+    monkeypatch.setattr(api_settings, "ledger_mode", "hub")
+    monkeypatch.setattr(api_settings, "api_token", "api-tok")
+    payment = {"payer_telegram_user_id": 1, "payee_telegram_user_id": 2, "amount": 5}
+
+    app = create_app()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://api"
+    ) as client:
+        resp = await client.post(
+            "/v1/ledger/groups/-100/payments",
+            json=payment,
+            headers={"Authorization": "Bearer api-tok"},
+        )
+
+    assert resp.status_code == 502
+    assert forwarded[0]["amount"] == 5 and forwarded[0]["payer_telegram_user_id"] == 1
+    stats = transport.stats()["remotes"]["https://remote.example"]
+    assert (stats["errors"], stats["state"]) == (1, "open")
+    await transport.aclose()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import Message, Update
+
+from commontrust_bot.pocketbase_client import PocketBaseClient
+from commontrust_common import instrumentation
+from commontrust_common.metrics import registry
+from tests.fake_telegram import FakeTelegramSender
+
+
+@pytest.mark.asyncio
+async def test_handler_time_and_backend_calls_are_recorded_per_handler(caplog) -> None:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    pb = PocketBaseClient(base_url="http://test")
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    router = Router()
+
+    @router.message(Command("stats"))
+    async def cmd_stats(message: Message) -> None:
+        # Calls made from gathered tasks still count towards this update.
+        await asyncio.gather(pb.get_record("members", "m1"), pb.get_record("members", "m2"))
+        await pb.get_record("deals", "d1")
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    instrumentation.install(dp, slow_threshold_seconds=0.001)
+    bot = Bot(token="42:TEST")
+    sender = FakeTelegramSender(None, "", "")
+    before = instrumentation.HANDLER_SECONDS.count(handler="cmd_stats")
+
+    try:
+        with caplog.at_level(logging.WARNING, logger="commontrust_common.instrumentation"):
+            for text in ("/stats", "hello"):
+                update = Update.model_validate(
+                    sender.message_update(-100, 7, text), context={"bot": bot}
+                )
+                await dp.feed_update(bot, update)
+    finally:
+        await bot.session.close()
+        await pb.close()
+
+    assert instrumentation.HANDLER_SECONDS.count(handler="cmd_stats") == before + 1
+    assert instrumentation.HANDLER_SECONDS.count(handler="unhandled") >= 1
+    slow = [r.getMessage() for r in caplog.records if "cmd_stats" in r.getMessage()]
+    assert len(slow) == 1
+    assert "3 backend call(s)" in slow[0]
+    assert "GET members x2" in slow[0] and "GET deals x1" in slow[0]
+
+    text = registry.render()
+    assert "# TYPE bot_handler_seconds histogram" in text
+    assert 'bot_handler_backend_calls_bucket{handler="cmd_stats",le="3"}' in text
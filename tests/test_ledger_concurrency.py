@@ -0,0 +1,119 @@
+import asyncio
+import random
+
+import pytest
+
+from commontrust_api.ledger.locks import AccountLockManager
+from commontrust_api.ledger.service import (
+    InsufficientCreditError,
+    LedgerMetrics,
+    MutualCreditService,
+)
+from commontrust_api.reputation.service import ReputationService
+
+
+@pytest.mark.asyncio
+async def test_lock_manager_orders_stripes_and_serializes(tmp_path) -> None:
+    locks = AccountLockManager(stripes=8, lock_dir=str(tmp_path))
+    events: list[str] = []
+
+    async def worker(name: str, a: tuple[str, str], b: tuple[str, str]) -> None:
+        async with locks.hold(a, b):
+            events.append(f"{name}:in")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}:out")
+
+    # Opposite acquisition order over the same accounts must neither deadlock nor overlap.
+    await asyncio.wait_for(
+        asyncio.gather(
+            worker("x", ("g", "m1"), ("g", "m2")),
+            worker("y", ("g", "m2"), ("g", "m1")),
+        ),
+        timeout=5,
+    )
+    assert events in (["x:in", "x:out", "y:in", "y:out"], ["y:in", "y:out", "x:in", "x:out"])
+    assert list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_concurrent_payments_stay_zero_sum(fake_pb) -> None:
+    fake_pb.latency = 0  # yield on every storage call so payments interleave
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep, locks=AccountLockManager())
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    members = [await fake_pb.create_record("members", {"telegram_id": i}) for i in range(12)]
+
+    rng = random.Random(7)
+    pairs = [tuple(rng.sample(members, 2)) for _ in range(1000)]
+
+    async def pay(payer: dict, payee: dict) -> bool:
+        try:
+            amount = rng.randint(1, 40)
+            await mc.create_payment(group["id"], payer["id"], payee["id"], amount=amount)
+        except InsufficientCreditError:
+            return False
+        return True
+
+    results = await asyncio.gather(*(pay(a, b) for a, b in pairs))
+    assert sum(results) > 500
+
+    zero_sum = await mc.verify_zero_sum(group["id"])
+    assert zero_sum["is_zero_sum"] is True
+    assert zero_sum["is_reconciled"] is True
+
+    # No lost updates: every stored balance equals the sum of its ledger entries.
+    entries = list(fake_pb.data.get("mc_entries", {}).values())
+    assert len(entries) == 2 * sum(results)
+    for account in fake_pb.data["mc_accounts"].values():
+        posted = sum(e["amount"] for e in entries if e["account_id"] == account["id"])
+        assert account["balance"] == posted
+        assert account["balance"] >= -account["credit_limit"]
+
+
+@pytest.mark.asyncio
+async def test_workers_without_shared_lock_resolve_conflicts_by_version(fake_pb) -> None:
+    fake_pb.latency = 0
+    rep = ReputationService(pb=fake_pb)
+    metrics = LedgerMetrics()
+    # Each "worker" has its own in-process locks, like separate uvicorn processes.
+    workers = [
+        MutualCreditService(
+            pb=fake_pb,
+            reputation=rep,
+            locks=AccountLockManager(),
+            metrics=metrics,
+            max_attempts=100,
+            retry_base_delay=0.0001,
+        )
+        for _ in range(4)
+    ]
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    members = [await fake_pb.create_record("members", {"telegram_id": i}) for i in range(6)]
+    for m in members:
+        await workers[0].get_or_create_account(group["id"], m["id"])
+
+    rng = random.Random(11)
+    jobs = [(workers[i % 4], *rng.sample(members, 2)) for i in range(200)]
+
+    async def pay(mc: MutualCreditService, payer: dict, payee: dict) -> bool:
+        try:
+            amount = rng.randint(1, 20)
+            await mc.create_payment(group["id"], payer["id"], payee["id"], amount=amount)
+        except InsufficientCreditError:
+            return False
+        return True
+
+    results = await asyncio.gather(*(pay(*job) for job in jobs))
+
+    assert metrics.conflicts > 0
+    assert metrics.retries == metrics.conflicts
+    assert metrics.exhausted == 0
+    entries = list(fake_pb.data.get("mc_entries", {}).values())
+    assert len(entries) == 2 * sum(results)
+    for account in fake_pb.data["mc_accounts"].values():
+        assert account["balance"] == sum(
+            e["amount"] for e in entries if e["account_id"] == account["id"]
+        )
+    assert (await workers[0].verify_zero_sum(group["id"]))["is_zero_sum"] is True
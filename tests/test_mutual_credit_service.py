@@ -1,3 +1,6 @@
+import os
+from datetime import UTC, datetime, timedelta
+
 import pytest
 
 from commontrust_api.ledger.service import InsufficientCreditError, MutualCreditService
@@ -55,3 +58,465 @@ async def test_update_credit_limit(fake_pb) -> None:
 
     updated = await mc.update_credit_limit(group["id"], member["id"], new_limit=7)  # type: ignore[arg-type]
     assert updated["credit_limit"] == 7
+
+
+@pytest.mark.asyncio
+async def test_create_payment_posts_one_atomic_batch(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake_pb.create_record("members", {"telegram_id": 1})
+    payee = await fake_pb.create_record("members", {"telegram_id": 2})
+
+    result = await mc.create_payment(group["id"], payer["id"], payee["id"], amount=30)
+    assert fake_pb.batch_calls == 1
+
+    entries = await fake_pb.list_records(
+        "mc_entries", filter=f'transaction_id="{result["transaction"]["id"]}"'
+    )
+    assert sorted(e["amount"] for e in entries["items"]) == [-30, 30]
+
+
+@pytest.mark.asyncio
+async def test_payment_batch_failure_leaves_ledger_untouched(fake_pb) -> None:
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer_account = await fake_pb.mc_account_create(group["id"], "m1", credit_limit=100)
+
+    with pytest.raises(KeyError):
+        await fake_pb.mc_payment_create(
+            mc_group_id=group["id"],
+            payer_id="m1",
+            payee_id="m2",
+            payer_account_id=payer_account["id"],
+            payee_account_id="missing",
+            amount=10,
+            new_payer_balance=-10,
+            new_payee_balance=10,
+        )
+
+    assert fake_pb.data.get("mc_transactions", {}) == {}
+    assert fake_pb.data.get("mc_entries", {}) == {}
+    assert (await fake_pb.mc_account_get(group["id"], "m1"))["balance"] == 0
+
+
+@pytest.mark.asyncio
+async def test_keyed_payment_is_insert_first_and_replays_once(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake_pb.create_record("members", {"telegram_id": 1})
+    payee = await fake_pb.create_record("members", {"telegram_id": 2})
+
+    lookups = 0
+    original = fake_pb.mc_transaction_get_by_idempotency
+
+    async def counting_lookup(*args, **kwargs):
+        nonlocal lookups
+        lookups += 1
+        return await original(*args, **kwargs)
+
+    fake_pb.mc_transaction_get_by_idempotency = counting_lookup  # type: ignore[method-assign]
+
+    # The whole credit limit, so the replay would also fail the credit check on its own.
+    first = await mc.create_payment(
+        group["id"], payer["id"], payee["id"], amount=100, idempotency_key="k1"
+    )
+    assert first["already_applied"] is False
+    assert lookups == 0
+
+    replay = await mc.create_payment(
+        group["id"], payer["id"], payee["id"], amount=100, idempotency_key="k1"
+    )
+    assert replay["already_applied"] is True
+    assert replay["transaction"]["id"] == first["transaction"]["id"]
+    assert replay["new_payer_balance"] == -100
+    assert len(fake_pb.data["mc_transactions"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_key_batch_resolves_to_existing_transaction(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake_pb.create_record("members", {"telegram_id": 1})
+    payee = await fake_pb.create_record("members", {"telegram_id": 2})
+
+    await mc.create_payment(group["id"], payer["id"], payee["id"], amount=10, idempotency_key="k")
+    replay = await mc.create_payment(
+        group["id"], payer["id"], payee["id"], amount=10, idempotency_key="k"
+    )
+    assert replay["already_applied"] is True
+    assert (await mc.verify_zero_sum(group["id"]))["is_zero_sum"] is True
+    assert (await fake_pb.mc_account_get(group["id"], payer["id"]))["balance"] == -10
+
+
+def test_idempotency_index_replays_stored_response() -> None:
+    from commontrust_api.ledger.idempotency import IdempotencyIndex
+    from commontrust_api.ledger.models import PaymentOut
+
+    index = IdempotencyIndex(maxsize=2, ttl_seconds=60)
+    out = PaymentOut(transaction_id="t1", new_payer_balance=-5, new_payee_balance=5, symbol="Cr")
+    index.remember(100, "k", out)
+
+    replay = index.get(100, "k")
+    assert replay is not None and replay.already_applied is True
+    assert replay.transaction_id == "t1"
+    assert index.get(200, "k") is None
+
+
+@pytest.mark.asyncio
+async def test_bot_service_payment_replay_is_idempotent(fake_pb) -> None:
+    from commontrust_bot.services.mutual_credit import MutualCreditService as BotMutualCreditService
+    from commontrust_bot.services.reputation import ReputationService as BotReputationService
+
+    mc = BotMutualCreditService(pb=fake_pb, reputation=BotReputationService(pb=fake_pb))
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+
+    first = await mc.create_payment(group["id"], "m1", "m2", amount=10, idempotency_key="chat:1")
+    replay = await mc.create_payment(group["id"], "m1", "m2", amount=10, idempotency_key="chat:1")
+    assert replay["already_applied"] is True
+    assert replay["transaction"]["id"] == first["transaction"]["id"]
+    assert (await fake_pb.mc_account_get(group["id"], "m1"))["balance"] == -10
+
+
+@pytest.mark.asyncio
+async def test_verify_zero_sum_reconciles_entries_and_checkpoints(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake_pb.create_record("members", {"telegram_id": 1})
+    payee = await fake_pb.create_record("members", {"telegram_id": 2})
+    for _ in range(3):
+        await mc.create_payment(group["id"], payer["id"], payee["id"], amount=5)
+    # Spread the entries out in (PocketBase) time, long before the settle window.
+    for i, entry in enumerate(fake_pb.data["mc_entries"].values(), start=1):
+        entry["created_at"] = f"2020-01-01 00:00:0{i}.000Z"
+
+    scanned: list[str] = []
+    iter_records = fake_pb.iter_records
+
+    async def counting_iter(collection, filter=None, per_page=500):
+        async for record in iter_records(collection, filter=filter, per_page=per_page):
+            scanned.append(collection)
+            yield record
+
+    fake_pb.iter_records = counting_iter
+
+    first = await mc.verify_zero_sum(group["id"])
+    assert first["is_zero_sum"] is True and first["is_reconciled"] is True
+    assert first["entry_count"] == 6
+    assert scanned.count("mc_entries") == 6
+    # The checkpoint never runs ahead of the newest stored entry.
+    assert first["checkpoint"] == "2020-01-01 00:00:06.000Z"
+    assert fake_pb.data["mc_snapshots"][first["snapshot_id"]]["entry_count"] == 5
+
+    # Later runs only read entries from the checkpoint on.
+    scanned.clear()
+    await mc.create_payment(group["id"], payer["id"], payee["id"], amount=5)
+    second = await mc.verify_zero_sum(group["id"])
+    assert second["is_reconciled"] is True and second["entry_count"] == 8
+    assert scanned.count("mc_entries") == 3
+    # The checkpoint moved forward in place: one snapshot row per group.
+    assert second["snapshot_id"] == first["snapshot_id"]
+    assert list(fake_pb.data["mc_snapshots"]) == [first["snapshot_id"]]
+    assert fake_pb.data["mc_snapshots"][first["snapshot_id"]]["entry_count"] == 6
+
+    # A balance that drifted from its entries is reported and no snapshot is taken.
+    payer_account = await fake_pb.mc_account_get(group["id"], payer["id"])
+    payee_account = await fake_pb.mc_account_get(group["id"], payee["id"])
+    await fake_pb.update_record("mc_accounts", payer_account["id"], {"balance": -25})
+    await fake_pb.update_record("mc_accounts", payee_account["id"], {"balance": 25})
+    snapshots = len(fake_pb.data["mc_snapshots"])
+    drifted = await mc.verify_zero_sum(group["id"])
+    assert drifted["is_zero_sum"] is True and drifted["is_reconciled"] is False
+    assert set(drifted["mismatched_accounts"]) == {payer_account["id"], payee_account["id"]}
+    assert len(fake_pb.data["mc_snapshots"]) == snapshots
+
+
+@pytest.mark.asyncio
+async def test_verify_zero_sum_counts_past_one_page(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    for i in range(501):
+        await fake_pb.mc_account_create(group["id"], f"m{i}")
+    last = await fake_pb.mc_account_create(group["id"], "m-last")
+    await fake_pb.update_record("mc_accounts", last["id"], {"balance": 3})
+
+    result = await mc.verify_zero_sum(group["id"])
+    assert result["account_count"] == 502
+    assert result["total_balance"] == 3 and result["is_zero_sum"] is False
+    assert result["mismatched_accounts"] == [last["id"]]
+
+
+@pytest.mark.asyncio
+async def test_transaction_history_joins_members_in_one_query_and_pages(fake_pb) -> None:
+    from types import SimpleNamespace
+
+    from commontrust_api.ledger.routes import get_transactions
+
+    group = await fake_pb.create_record("groups", {"telegram_id": -100, "mc_enabled": True})
+    mc_group = await fake_pb.mc_group_create(group["id"])
+    me = await fake_pb.create_record("members", {"telegram_id": 1})
+    others = [await fake_pb.create_record("members", {"telegram_id": 10 + i}) for i in range(5)]
+    for i in range(120):
+        other = others[i % len(others)]
+        payer, payee = (me, other) if i % 2 else (other, me)
+        await fake_pb.create_record(
+            "mc_transactions",
+            {
+                "mc_group_id": mc_group["id"],
+                "payer_id": payer["id"],
+                "payee_id": payee["id"],
+                "amount": i + 1,
+                "created_at": f"2024-01-01 00:{i // 60:02d}:{i % 60:02d}.000Z",
+            },
+        )
+
+    calls: list[str] = []
+    list_records, get_record = fake_pb.list_records, fake_pb.get_record
+
+    async def counting_list(collection, *args, **kwargs):
+        calls.append(collection)
+        return await list_records(collection, *args, **kwargs)
+
+    async def counting_get(collection, *args, **kwargs):
+        calls.append(collection)
+        return await get_record(collection, *args, **kwargs)
+
+    fake_pb.list_records, fake_pb.get_record = counting_list, counting_get
+    req = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(pb=fake_pb)))
+
+    first = await get_transactions(req, -100, 1, limit=100, cursor=None)  # type: ignore[arg-type]
+    assert len(first["items"]) == 100
+    assert first["items"][0]["amount"] == 120  # newest first
+    assert first["items"][0]["direction"] == "sent"
+    assert first["items"][1]["direction"] == "received"
+    assert first["items"][1]["other_telegram_user_id"] == 10 + (118 % 5)
+    # Group + caller lookups, then a single query that brings the members along expanded.
+    assert calls == ["groups", "mc_groups", "members", "mc_transactions"]
+
+    second = await get_transactions(  # type: ignore[arg-type]
+        req, -100, 1, limit=100, cursor=first["next_cursor"]
+    )
+    assert [tx["amount"] for tx in second["items"]] == list(range(20, 0, -1))
+    assert second["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_transaction_history_rejects_bad_cursor(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep)
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        await mc.transaction_history_page("g", "m", cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_group_directory_skips_group_lookups_on_repeat_payments(fake_pb) -> None:
+    from types import SimpleNamespace
+
+    from commontrust_api.ledger.models import EnableLedgerIn, PaymentIn
+    from commontrust_api.ledger.routes import create_payment, enable_ledger, get_balance
+
+    req = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(pb=fake_pb)))
+    await enable_ledger(req, -100, EnableLedgerIn(currency_symbol="Tk"))  # type: ignore[arg-type]
+
+    calls: list[str] = []
+    list_records, get_record = fake_pb.list_records, fake_pb.get_record
+
+    async def counting_list(collection, *args, **kwargs):
+        calls.append(collection)
+        return await list_records(collection, *args, **kwargs)
+
+    async def counting_get(collection, *args, **kwargs):
+        calls.append(collection)
+        return await get_record(collection, *args, **kwargs)
+
+    fake_pb.list_records, fake_pb.get_record = counting_list, counting_get
+
+    pay = PaymentIn(payer_telegram_user_id=1, payee_telegram_user_id=2, amount=5)
+    first = await create_payment(req, -100, pay)  # type: ignore[arg-type]
+    second = await create_payment(req, -100, pay)  # type: ignore[arg-type]
+    balance = await get_balance(req, -100, 2)  # type: ignore[arg-type]
+    assert first.symbol == second.symbol == balance.symbol == "Tk"
+    assert calls.count("groups") == 1 and calls.count("mc_groups") == 1
+
+    # Re-enabling with a new currency is picked up immediately.
+    await enable_ledger(req, -100, EnableLedgerIn(currency_symbol="Zz"))  # type: ignore[arg-type]
+    assert (await get_balance(req, -100, 2)).symbol == "Zz"  # type: ignore[arg-type]
+
+
+def _stepping_clock(start: datetime):
+    now = [start]
+    return now, lambda: now[0]
+
+
+@pytest.mark.asyncio
+async def test_credit_limit_is_reused_until_ttl_or_reputation_change(fake_pb) -> None:
+    now, clock = _stepping_clock(datetime(2024, 1, 1, tzinfo=UTC))
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep, limit_refresh_ttl_seconds=300, clock=clock)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake_pb.create_record("members", {"telegram_id": 1})
+    payee = await fake_pb.create_record("members", {"telegram_id": 2})
+    await mc.create_payment(group["id"], payer["id"], payee["id"], amount=5)
+
+    reads: list[str] = []
+    reputation_get = fake_pb.reputation_get
+
+    async def counting_get(member_id: str):
+        reads.append(member_id)
+        return await reputation_get(member_id)
+
+    fake_pb.reputation_get = counting_get
+
+    # Fresh limits: payments and balance checks don't touch reputation.
+    await mc.create_payment(group["id"], payer["id"], payee["id"], amount=5)
+    base_limit = (await mc.get_account_balance(group["id"], payer["id"]))["credit_limit"]
+    assert reads == []
+
+    # A reputation change expires the member's limit right away.
+    await fake_pb.reputation_update(
+        payer["id"],
+        2,
+        5.0,
+        reviewer_stats={"r1": {"sum": 10, "count": 2}},
+        verified_deal_ids=["d1", "d2"],
+    )
+    assert (await fake_pb.mc_account_get(group["id"], payer["id"]))["limit_refreshed_at"] == ""
+    reads.clear()
+    balance = await mc.get_account_balance(group["id"], payer["id"])
+    assert balance["credit_limit"] == rep.compute_credit_limit(2) > base_limit
+    assert reads == [payer["id"]]
+
+    # Past the TTL the limit is recomputed (and re-stamped) once.
+    reads.clear()
+    now[0] += timedelta(seconds=301)
+    await mc.get_account_balance(group["id"], payer["id"])
+    await mc.get_account_balance(group["id"], payer["id"])
+    assert reads == [payer["id"]]
+
+
+@pytest.mark.asyncio
+async def test_limit_writes_never_send_the_balance(fake_pb) -> None:
+    # A limit write that carried the balance it read could undo a payment landing in between.
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep, limit_refresh_ttl_seconds=300)
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake_pb.create_record("members", {"telegram_id": 1})
+    payee = await fake_pb.create_record("members", {"telegram_id": 2})
+    await mc.create_payment(group["id"], payer["id"], payee["id"], amount=5)
+
+    writes: list[dict] = []
+    update_record = fake_pb.update_record
+
+    async def recording_update(collection: str, record_id: str, data: dict):
+        writes.append(dict(data))
+        return await update_record(collection, record_id, data)
+
+    fake_pb.update_record = recording_update
+    await mc.refresh_credit_limit(group["id"], payer["id"], force=True)
+    await mc.update_credit_limit(group["id"], payer["id"], 7)
+
+    assert len(writes) == 2 and all("balance" not in w and "version" in w for w in writes)
+    account = await fake_pb.mc_account_get(group["id"], payer["id"])
+    assert account["balance"] == -5 and account["credit_limit"] == 7
+
+
+@pytest.mark.asyncio
+async def test_refresh_stale_limits_sweeps_expired_and_active_accounts_only(fake_pb) -> None:
+    # FakePocketBase stamps entries with the wall clock, so the service clock starts there too.
+    now, clock = _stepping_clock(datetime.now(UTC))
+    rep = ReputationService(pb=fake_pb)
+    mc = MutualCreditService(pb=fake_pb, reputation=rep, limit_refresh_ttl_seconds=300, clock=clock)
+
+    group = await fake_pb.create_record("mc_groups", {"group_id": "g1"})
+    members = [await fake_pb.create_record("members", {"telegram_id": i}) for i in range(1, 4)]
+    for member in members:
+        await mc.get_or_create_account(group["id"], member["id"])
+    # An account from before limit_refreshed_at existed is always due.
+    legacy = await fake_pb.mc_account_create(group["id"], "legacy", credit_limit=1)
+
+    assert await mc.refresh_stale_limits() == 1
+    assert (await fake_pb.get_record("mc_accounts", legacy["id"]))["credit_limit"] == (
+        rep.compute_credit_limit(0)
+    )
+
+    # Only the two accounts that just moved are refreshed ahead of the TTL; the idle one isn't.
+    stamped = (await fake_pb.mc_account_get(group["id"], members[2]["id"]))["limit_refreshed_at"]
+    await mc.create_payment(group["id"], members[0]["id"], members[1]["id"], amount=5)
+    now[0] += timedelta(seconds=151)
+    assert await mc.refresh_stale_limits() == 2
+    assert await mc.refresh_stale_limits() == 0
+    active = [await fake_pb.mc_account_get(group["id"], m["id"]) for m in members[:2]]
+    assert all(mc._limit_is_fresh(account) for account in active)
+    idle = await fake_pb.mc_account_get(group["id"], members[2]["id"])
+    assert idle["limit_refreshed_at"] == stamped
+
+    # Once the activity is older than the TTL, nothing is swept until a reputation change.
+    now[0] += timedelta(seconds=300)
+    assert await mc.refresh_stale_limits() == 0
+    await fake_pb.reputation_update(members[2]["id"], 1, 5.0)
+    assert await mc.refresh_stale_limits() == 1
+
+
+@pytest.mark.asyncio
+async def test_limit_sweeper_only_runs_in_the_process_holding_the_role(tmp_path) -> None:
+    from commontrust_api.ledger import locks
+
+    assert locks.claim_process_role("sweeper", None)
+    assert locks.claim_process_role("sweeper", str(tmp_path))
+    # A second process can't take the role while the first holds the lock.
+    held = locks._claimed_roles.pop("sweeper")
+    try:
+        assert not locks.claim_process_role("sweeper", str(tmp_path))
+    finally:
+        os.close(held)
+    assert locks.claim_process_role("sweeper", str(tmp_path))
+    os.close(locks._claimed_roles.pop("sweeper"))
+
+
+@pytest.mark.asyncio
+async def test_keyed_replay_without_unique_index_is_not_posted_twice() -> None:
+    import json
+
+    import httpx
+
+    from commontrust_api.pocketbase_client import IDEMPOTENCY_INDEX, PocketBaseClient
+    from tests.fake_pocketbase import SCHEMA_PATH, FakePocketBase, Schema
+    from tests.fake_pocketbase_http import DEFAULT_TOKEN, pocketbase_app
+
+    # A PocketBase set up without the unique index, reached over HTTP by the real client. The
+    # service is called directly, so the API's per-worker replay cache plays no part.
+    collections = json.loads(SCHEMA_PATH.read_text())
+    for collection in collections:
+        indexes = collection.get("indexes") or []
+        collection["indexes"] = [sql for sql in indexes if IDEMPOTENCY_INDEX not in sql]
+    fake = FakePocketBase(schema=Schema.from_collections(collections))
+    pb = PocketBaseClient(base_url="http://pb", admin_token=DEFAULT_TOKEN)
+    pb._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=pocketbase_app(fake)))
+    await pb.authenticate()
+    mc = MutualCreditService(pb=pb, reputation=ReputationService(pb=pb))
+
+    group = await fake.create_record("mc_groups", {"group_id": "g1"})
+    payer = await fake.create_record("members", {"telegram_id": 1})
+    payee = await fake.create_record("members", {"telegram_id": 2})
+    first = await mc.create_payment(
+        group["id"], payer["id"], payee["id"], amount=10, idempotency_key="k"
+    )
+    replay = await mc.create_payment(
+        group["id"], payer["id"], payee["id"], amount=10, idempotency_key="k"
+    )
+    await pb.close()
+
+    assert await pb.mc_idempotency_indexed() is False
+    assert replay["already_applied"] is True
+    assert replay["transaction"]["id"] == first["transaction"]["id"]
+    assert len(fake.data["mc_transactions"]) == 1
+    assert (await fake.mc_account_get(group["id"], payer["id"]))["balance"] == -10
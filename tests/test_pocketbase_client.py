@@ -1,3 +1,5 @@
+import json
+
 import pytest
 import httpx
 
@@ -51,3 +53,288 @@ async def test_request_raises_on_4xx() -> None:
         await pb._request("GET", "/api/x")  # type: ignore[attr-defined]
     await pb.close()
 
+
+
+@pytest.mark.asyncio
+async def test_member_cache_read_through_and_write_refresh() -> None:
+    member = {"id": "m1", "telegram_id": 42, "username": "alice", "display_name": "Alice"}
+    requests: list[tuple[str, str]] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append((request.method, request.url.path))
+        if request.method == "GET":
+            return httpx.Response(200, json={"items": [member]})
+        if request.method == "PATCH":
+            return httpx.Response(200, json={**member, **json.loads(request.content)})
+        return httpx.Response(404)
+
+    pb = PocketBaseClient(base_url="http://test", member_cache_size=10, member_cache_ttl_seconds=60)
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    assert (await pb.member_get(42))["id"] == "m1"
+    # Same telegram id, same id, and an unchanged profile: no further HTTP calls.
+    assert (await pb.member_get_or_create(42, "@Alice", "Alice"))["id"] == "m1"
+    assert (await pb.get_record("members", "m1"))["username"] == "alice"
+    assert requests == [("GET", "/api/collections/members/records")]
+    assert pb.member_cache_stats()["hits"] == 2
+
+    await pb.member_set_scammer("m1")
+    assert requests[-1] == ("PATCH", "/api/collections/members/records/m1")
+    assert (await pb.member_get(42))["scammer"] is True
+    assert len(requests) == 2
+    await pb.close()
+
+
+@pytest.mark.asyncio
+async def test_consistency_levels_and_response_cache() -> None:
+    requests: list[httpx.Request] = []
+    group = {"id": "g1", "group_id": "grp", "currency_name": "Credit", "currency_symbol": "Cr"}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.method == "PATCH":
+            group.update(json.loads(request.content))
+            return httpx.Response(200, json=group)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"items": [group]}, headers={"ETag": '"v1"'})
+
+    pb = PocketBaseClient(
+        base_url="http://test", response_cache_size=10, response_cache_ttl_seconds=60
+    )
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    await pb.list_records("reviews", consistency="strong")
+    assert "_ts" in requests[-1].url.params
+    assert requests[-1].headers["Cache-Control"].startswith("no-cache")
+    await pb.list_records("reviews")
+    assert "_ts" not in requests[-1].url.params
+    assert "Cache-Control" not in requests[-1].headers
+
+    # Cached reads are served locally until a write to the same collection.
+    assert (await pb.mc_group_get("grp"))["currency_name"] == "Credit"
+    count = len(requests)
+    assert (await pb.mc_group_get("grp"))["currency_name"] == "Credit"
+    assert len(requests) == count
+
+    await pb.mc_group_update_currency("g1", "Hours", "h")
+    group_after = await pb.mc_group_get("grp")
+    assert group_after["currency_name"] == "Hours"
+    assert len(requests) == count + 2
+
+    # Expired entries with an ETag are revalidated rather than refetched.
+    pb.response_cache.clear()
+    group["currency_name"] = "ignored"
+    assert (await pb.mc_group_get("grp"))["currency_name"] == "Hours"
+    assert requests[-1].headers["If-None-Match"] == '"v1"'
+    await pb.close()
+
+
+@pytest.mark.asyncio
+async def test_mc_payment_create_sends_single_batch() -> None:
+    seen: list[httpx.Request] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        payload = json.loads(request.content)
+        return httpx.Response(
+            200, json=[{"status": 200, "body": r["body"]} for r in payload["requests"]]
+        )
+
+    pb = PocketBaseClient(base_url="http://test")
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    posted = await pb.mc_payment_create(
+        mc_group_id="g",
+        payer_id="p",
+        payee_id="q",
+        payer_account_id="a1",
+        payee_account_id="a2",
+        amount=5,
+        new_payer_balance=-5,
+        new_payee_balance=5,
+    )
+
+    assert [r.url.path for r in seen] == ["/api/batch"]
+    requests = json.loads(seen[0].content)["requests"]
+    assert [(r["method"], r["url"]) for r in requests] == [
+        ("POST", "/api/collections/mc_transactions/records"),
+        ("POST", "/api/collections/mc_entries/records"),
+        ("POST", "/api/collections/mc_entries/records"),
+        ("PATCH", "/api/collections/mc_accounts/records/a1"),
+        ("PATCH", "/api/collections/mc_accounts/records/a2"),
+    ]
+    transaction_id = posted["transaction"]["id"]
+    assert len(transaction_id) == 15
+    assert posted["payer_entry"]["transaction_id"] == transaction_id
+    await pb.close()
+
+
+@pytest.mark.asyncio
+async def test_api_client_maps_version_conflicts() -> None:
+    from commontrust_api.pocketbase_client import PocketBaseClient as ApiPocketBaseClient
+    from commontrust_api.pocketbase_client import PocketBaseConflictError
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content) == {"balance": 5, "version": 4}
+        return httpx.Response(409, json={"status": 409, "message": "version_conflict"})
+
+    pb = ApiPocketBaseClient(base_url="http://test")
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    with pytest.raises(PocketBaseConflictError):
+        await pb.mc_account_update("a1", balance=5, expected_version=3)
+    await pb.close()
+
+
+@pytest.mark.asyncio
+async def test_iter_records_pages_by_id_keyset() -> None:
+    rows = [{"id": f"r{i:03d}"} for i in range(5)]
+    seen: list[dict[str, str]] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        seen.append(params)
+        assert params["sort"] == "id" and params["page"] == "1"
+        after = params.get("filter", "").rpartition('id>"')[2].rstrip('"')
+        items = [r for r in rows if r["id"] > after][: int(params["perPage"])]
+        return httpx.Response(200, json={"items": items})
+
+    pb = PocketBaseClient(base_url="http://test")
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    out = [r async for r in pb.iter_records("mc_accounts", filter='mc_group_id="g"', per_page=2)]
+    assert [r["id"] for r in out] == [r["id"] for r in rows]
+    assert len(seen) == 3
+    assert seen[0]["filter"] == '(mc_group_id="g")'
+    assert seen[2]["filter"] == '(mc_group_id="g") && id>"r003"'
+    await pb.close()
+
+
+@pytest.mark.asyncio
+async def test_api_members_get_many_batches_misses_through_cache() -> None:
+    from commontrust_api.pocketbase_client import PocketBaseClient as ApiPocketBaseClient
+
+    filters: list[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        flt = request.url.params["filter"]
+        filters.append(flt)
+        ids = [part.split('"')[1] for part in flt.split(" || ")]
+        return httpx.Response(
+            200, json={"items": [{"id": i, "telegram_id": int(i[1:])} for i in ids]}
+        )
+
+    pb = ApiPocketBaseClient(
+        base_url="http://test", member_cache_size=1000, member_cache_ttl_seconds=60
+    )
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    ids = [f"m{i}" for i in range(120)]
+    found = await pb.members_get_many(ids + ["m0"])
+    assert sorted(found) == sorted(ids)
+    assert len(filters) == 3  # chunks of 50, not one GET per member
+
+    again = await pb.members_get_many(["m1", "m7"])
+    assert again["m7"]["telegram_id"] == 7
+    assert len(filters) == 3  # served from the member cache
+    await pb.close()
+
+
+@pytest.mark.asyncio
+async def test_create_record_with_files_streams_multipart_body() -> None:
+    import email
+    import tempfile
+
+    seen: dict = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        seen["headers"] = request.headers
+        seen["body"] = body
+        return httpx.Response(200, json={"id": "r1"})
+
+    pb = PocketBaseClient(base_url="http://test")
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    with tempfile.TemporaryFile() as spooled:
+        spooled.write(b"\x89PNG" + b"x" * 200_000)
+        spooled.seek(0)
+        out = await pb.create_record_with_files(
+            "reports",
+            {"description": 'said "hi"', "forwarded_messages": [{"text": "a"}]},
+            [
+                ("evidence_photos", "evidence_0.jpg", spooled, "image/jpeg"),
+                ("evidence_photos", "evidence_1.jpg", b"small", "image/jpeg"),
+            ],
+        )
+    await pb.close()
+
+    assert out == {"id": "r1"}
+    headers = seen["headers"]
+    assert int(headers["Content-Length"]) == len(seen["body"])
+    assert "Transfer-Encoding" not in headers
+
+    message = email.message_from_bytes(
+        f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + seen["body"]
+    )
+    parts = {
+        (part.get_param("name", header="content-disposition"), part.get_filename()): part
+        for part in message.get_payload()
+    }
+    assert parts[("description", None)].get_payload() == 'said "hi"'
+    assert json.loads(parts[("forwarded_messages", None)].get_payload()) == [{"text": "a"}]
+    photo = parts[("evidence_photos", "evidence_0.jpg")].get_payload(decode=True)
+    assert photo.startswith(b"\x89PNG") and len(photo) == 200_004
+    assert parts[("evidence_photos", "evidence_1.jpg")].get_payload(decode=True) == b"small"
+
+
+def test_filter_shape_strips_ids_and_collapses_batched_lookups() -> None:
+    from commontrust_common.pocketbase_metrics import filter_shape
+
+    assert filter_shape('telegram_id=-42 && status="open"') == "telegram_id=? && status=?"
+    assert filter_shape('(member_id="ab\\"c") && id>"x1"') == "(member_id=?) && id>?"
+    assert filter_shape('id="a" || id="b" || id="c"') == filter_shape('id="d" || id="e"')
+    assert filter_shape("is_active=true && score>=4.5") == "is_active=true && score>=?"
+
+
+@pytest.mark.asyncio
+async def test_requests_are_timed_by_filter_shape_and_slow_ones_logged(caplog) -> None:
+    import logging
+
+    from commontrust_common import pocketbase_metrics as pb_mod
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "PATCH":
+            return httpx.Response(404, json={"message": "missing"})
+        return httpx.Response(200, json={"items": [], "totalItems": 0})
+
+    pb = PocketBaseClient(base_url="http://test", slow_query_seconds=0.000001)
+    pb.token = "t"
+    pb._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    labels = {"method": "GET", "collection": "sanctions", "filter": "member_id=? && is_active=true"}
+    before = pb_mod.PB_REQUEST_SECONDS.count(**labels)
+    not_found = pb_mod.PB_RESPONSES.value(method="PATCH", collection="members", status="404")
+
+    with caplog.at_level(logging.WARNING, logger="commontrust_common.pocketbase_metrics"):
+        for member_id in ("m1", "m2"):
+            await pb.get_first("sanctions", f'member_id="{member_id}" && is_active=true')
+        with pytest.raises(PocketBaseError):
+            await pb.update_record("members", "m1", {"scammer": True})
+    await pb.close()
+
+    assert pb_mod.PB_REQUEST_SECONDS.count(**labels) == before + 2
+    assert pb_mod.PB_RESPONSES.value(method="PATCH", collection="members", status="404") == (
+        not_found + 1
+    )
+    assert pb_mod.PB_RESPONSE_BYTES.count(method="GET", collection="sanctions") >= 2
+    slow = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow PocketBase")]
+    assert any("GET sanctions filter='member_id=? && is_active=true'" in m for m in slow)
+    assert not any("m1" in m or "m2" in m for m in slow)
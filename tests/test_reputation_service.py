@@ -1,6 +1,9 @@
+import asyncio
+
 import pytest
 
-from commontrust_bot.services.reputation import ReputationService
+from commontrust_bot.services.locks import AccountLockManager
+from commontrust_bot.services.reputation import ReputationService, ReviewDelta
 
 
 @pytest.mark.asyncio
@@ -45,3 +48,108 @@ def test_compute_credit_limit_defaults() -> None:
     rep = ReputationService(pb=None)
     assert rep.compute_credit_limit(verified_deals=0) >= 0
     assert rep.compute_credit_limit(verified_deals=2) > rep.compute_credit_limit(verified_deals=1)
+
+
+@pytest.mark.asyncio
+async def test_get_reputation_reads_persisted_aggregate(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    member = await fake_pb.create_record("members", {"telegram_id": 1})
+    await fake_pb.review_create(deal_id="d1", reviewer_id="r1", reviewee_id=member["id"], rating=4)
+    await fake_pb.review_create(deal_id="d1", reviewer_id=member["id"], reviewee_id="r1", rating=5)
+
+    # First read has no aggregate yet and rebuilds it; later reads only fetch the record.
+    first = await rep.get_reputation(member["id"])
+    assert first == {"verified_deals": 1, "avg_rating": 4.0, "total_reviews": 1}
+
+    calls: list[str] = []
+    original = fake_pb.list_records
+
+    async def counting_list_records(collection, *args, **kwargs):
+        calls.append(collection)
+        return await original(collection, *args, **kwargs)
+
+    fake_pb.list_records = counting_list_records  # type: ignore[method-assign]
+    assert await rep.get_reputation(member["id"]) == first
+    assert calls == ["reputation"]
+
+
+@pytest.mark.asyncio
+async def test_apply_review_deltas_updates_aggregate(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    member = await fake_pb.create_record("members", {"telegram_id": 1})
+    await rep.calculate_reputation(member["id"])
+
+    stats = await rep.apply_review_deltas(
+        member["id"], [ReviewDelta("r1", "d1", 5, 1), ReviewDelta("r2", "d2", 3, 1)]
+    )
+    assert stats == {"verified_deals": 2, "avg_rating": 4.0, "total_reviews": 2}
+
+    # An edited rating shifts the reviewer's sum without adding a vote.
+    stats = await rep.apply_review_deltas(member["id"], [ReviewDelta("r1", "d1", -4, 0)])
+    assert stats == {"verified_deals": 2, "avg_rating": 2.0, "total_reviews": 2}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_review_deltas_for_one_member_are_not_lost(fake_pb) -> None:
+    fake_pb.latency = 0  # yield on every storage call so the updates interleave
+    rep = ReputationService(pb=fake_pb, locks=AccountLockManager())
+    member = await fake_pb.create_record("members", {"telegram_id": 1})
+    await rep.calculate_reputation(member["id"])
+
+    await asyncio.gather(
+        *(
+            rep.apply_review_deltas(member["id"], [ReviewDelta(f"r{i}", f"d{i}", 4, 1)])
+            for i in range(10)
+        )
+    )
+
+    stats = await rep.get_reputation(member["id"])
+    assert stats == {"verified_deals": 10, "avg_rating": 4.0, "total_reviews": 10}
+
+
+@pytest.mark.asyncio
+async def test_verify_reputation_repairs_drift(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    member = await fake_pb.create_record("members", {"telegram_id": 1})
+    await fake_pb.review_create(deal_id="d1", reviewer_id="r1", reviewee_id=member["id"], rating=5)
+    await fake_pb.review_create(deal_id="d1", reviewer_id=member["id"], reviewee_id="r1", rating=5)
+    await rep.calculate_reputation(member["id"])
+    assert await rep.verify_reputation(member["id"]) is False
+
+    # Simulate a lost incremental update.
+    await rep.apply_review_deltas(member["id"], [ReviewDelta("r9", "d9", 1, 1)])
+    assert await rep.verify_all() == 1
+    assert await rep.get_reputation(member["id"]) == {
+        "verified_deals": 1,
+        "avg_rating": 5.0,
+        "total_reviews": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_calculate_reputation_batches_fully_reviewed_check(fake_pb) -> None:
+    rep = ReputationService(pb=fake_pb)
+    member = await fake_pb.create_record("members", {"telegram_id": 1})
+    for i in range(300):
+        deal_id = f"deal_{i:04d}"
+        await fake_pb.review_create(
+            deal_id=deal_id, reviewer_id=f"r{i}", reviewee_id=member["id"], rating=4
+        )
+        # Only even deals have the counterparty review too.
+        if i % 2 == 0:
+            await fake_pb.review_create(
+                deal_id=deal_id, reviewer_id=member["id"], reviewee_id=f"r{i}", rating=5
+            )
+
+    calls: list[str] = []
+    original = fake_pb.list_records
+
+    async def counting_list_records(collection, *args, **kwargs):
+        calls.append(collection)
+        return await original(collection, *args, **kwargs)
+
+    fake_pb.list_records = counting_list_records  # type: ignore[method-assign]
+    stats = await rep.calculate_reputation(member["id"])
+    assert stats == {"verified_deals": 150, "avg_rating": 4.0, "total_reviews": 150}
+    # A handful of chunked queries instead of one per deal.
+    assert 1 <= calls.count("reviews") <= 10
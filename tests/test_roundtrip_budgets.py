@@ -0,0 +1,312 @@
+"""Backend round-trip budgets for the user-facing flows.
+
+Each flow runs against a FakePocketBase that injects `ROUNDTRIP_LATENCY_MS` of latency per call
+(default 2) and logs every call. A flow fails when it makes more round-trips than its budget,
+when more of them wait on each other than budgeted (serial depth), or when its wall time is
+well beyond what its budgeted depth explains. The measurements are printed after the run.
+
+When a change legitimately needs another call, raise the budget in the same commit; when one
+saves calls, lower it so the saving can't quietly regress.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+import pytest
+
+from commontrust_api.app import create_app
+from commontrust_api.config import api_settings
+from commontrust_bot.handlers import deal as deal_handlers
+from commontrust_bot.handlers import dm as dm_handlers
+from commontrust_bot.handlers import report as report_handlers
+from commontrust_bot.handlers import reputation as reputation_handlers
+from commontrust_bot.send_scheduler import drain_notifications
+from commontrust_bot.services.ai_queue import AIReviewQueue, AIReviewWorkerPool
+from commontrust_bot.services.deal import DealService
+from commontrust_bot.services.report import ReportService
+from commontrust_bot.services.reputation import ReputationService
+from commontrust_credit_bot.api_client import CommonTrustApiClient
+from commontrust_credit_bot.handlers import credit as credit_handlers
+from tests.fake_pocketbase import FakePocketBase, RoundTripLog
+from tests.fake_telegram import FakeChat, FakeMessage, FakeUser
+
+LATENCY = float(os.environ.get("ROUNDTRIP_LATENCY_MS", "2")) / 1000
+# Handler CPU time and event loop overhead on top of the injected latency.
+WALL_SLACK_SECONDS = 0.25
+
+
+@dataclass(frozen=True)
+class Budget:
+    round_trips: int
+    depth: int
+    # Credit bot flows only: requests from the bot to the CommonTrust API.
+    api_calls: int = 0
+
+
+BUDGETS = {
+    "newdeal": Budget(round_trips=6, depth=6),
+    "accept_invite": Budget(round_trips=9, depth=9),
+    "complete": Budget(round_trips=8, depth=8),
+    "review": Budget(round_trips=7, depth=7),
+    "review_final": Budget(round_trips=19, depth=14),
+    "reputation": Budget(round_trips=4, depth=4),
+    "stats": Budget(round_trips=7, depth=7),
+    "report_submit": Budget(round_trips=4, depth=4),
+    "pay": Budget(round_trips=21, depth=21, api_calls=3),
+    "balance": Budget(round_trips=10, depth=10, api_calls=2),
+}
+
+
+@dataclass
+class Measurement:
+    round_trips: int
+    depth: int
+    wall_seconds: float
+    api_calls: int
+    calls: list[str]
+
+    def summary(self) -> str:
+        return (
+            f"{self.round_trips} round-trip(s), depth {self.depth}, {self.api_calls} API call(s), "
+            f"{self.wall_seconds * 1000:.1f}ms"
+        )
+
+
+class _FakeBot:
+    def __init__(self) -> None:
+        self.sent: list[tuple[int, str]] = []
+
+    async def get_me(self):
+        return SimpleNamespace(username="testbot")
+
+    async def send_message(self, chat_id: int, text: str, **kwargs: Any):
+        self.sent.append((chat_id, text))
+        return FakeMessage(text=text, from_user=FakeUser(0), chat=FakeChat(chat_id, "private"))
+
+    async def get_file(self, file_id: str):
+        return SimpleNamespace(file_path=file_id)
+
+    async def download_file(self, file_path: str, destination: Any, **kwargs: Any) -> None:
+        destination.write(b"\xff\xd8" + file_path.encode())
+
+
+class _EditableMessage(FakeMessage):
+    async def edit_text(self, text: str, **kwargs: Any) -> None:
+        self.answers.append({"text": text, **kwargs})
+
+
+class _FakeCallbackQuery:
+    def __init__(self, data: str, from_user: FakeUser, message: FakeMessage, bot: Any) -> None:
+        self.data = data
+        self.from_user = from_user
+        self.message = message
+        self.bot = bot
+        self.answers: list[dict[str, Any]] = []
+
+    async def answer(self, text: str, **kwargs: Any) -> None:
+        self.answers.append({"text": text, **kwargs})
+
+
+def _message(text: str, user: FakeUser, chat: FakeChat, **kwargs: Any) -> FakeMessage:
+    msg = FakeMessage(text=text, from_user=user, chat=chat, **kwargs)
+    msg.bot = _FakeBot()  # type: ignore[attr-defined]
+    return msg
+
+
+ALICE = FakeUser(1, "alice", "Alice")
+BOB = FakeUser(2, "bob", "Bob")
+GROUP = FakeChat(-100, "supergroup", "Traders")
+
+
+class Bench:
+    """Bot services and the credit bot's API client over one latency-injecting FakePocketBase."""
+
+    def __init__(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        self.pb = FakePocketBase(latency=LATENCY)
+        self.reputation = ReputationService(pb=self.pb)
+        self.deals = DealService(pb=self.pb, reputation=self.reputation)
+        reports = ReportService(pb=self.pb, reputation=self.reputation)
+        for module in (dm_handlers, deal_handlers, reputation_handlers):
+            monkeypatch.setattr(module, "deal_service", self.deals)
+        monkeypatch.setattr(reputation_handlers, "reputation_service", self.reputation)
+        monkeypatch.setattr(dm_handlers, "pb_client", self.pb)
+        monkeypatch.setattr(report_handlers, "pb_client", self.pb)
+        monkeypatch.setattr(report_handlers, "report_service", reports)
+        monkeypatch.setattr(
+            report_handlers, "ai_review_pool", AIReviewWorkerPool(AIReviewQueue(), reports=reports)
+        )
+
+        # The credit bot talks to the real API app, which runs on the same fake.
+        monkeypatch.setattr(api_settings, "api_token", "bench-token")
+        app = create_app()
+        app.state.pb = self.pb
+        self.api_requests = 0
+
+        async def count_request(request: httpx.Request) -> None:
+            self.api_requests += 1
+
+        self.api = CommonTrustApiClient(base_url="http://api", token="bench-token")
+        self.api._client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), event_hooks={"request": [count_request]}
+        )
+        monkeypatch.setattr(credit_handlers, "api_client", self.api)
+
+    async def measure(self, step: Callable[[], Awaitable[Any]]) -> Measurement:
+        log = self.pb.round_trips = RoundTripLog()
+        api_before = self.api_requests
+        started = time.perf_counter()
+        try:
+            await step()
+        finally:
+            wall = time.perf_counter() - started
+            self.pb.round_trips = None
+        api_calls = self.api_requests - api_before
+        return Measurement(log.round_trips, log.depth, wall, api_calls, log.calls)
+
+    async def completed_deal(self) -> str:
+        created = await self.deals.create_deal(
+            initiator_telegram_id=ALICE.id,
+            counterparty_telegram_id=BOB.id,
+            group_telegram_id=GROUP.id,
+            description="bike",
+        )
+        deal_id = created["deal"]["id"]
+        await self.deals.confirm_deal(deal_id, confirmer_telegram_id=BOB.id)
+        await self.deals.complete_deal(deal_id, completer_telegram_id=ALICE.id)
+        return deal_id
+
+
+@pytest.fixture
+async def bench(monkeypatch) -> Any:
+    bench = Bench(monkeypatch)
+    yield bench
+    await bench.api.close()
+
+
+def _check(name: str, measured: Measurement, record_property: Callable[[str, Any], None]) -> None:
+    budget = BUDGETS[name]
+    record_property("roundtrips", (name, measured.summary()))
+    detail = f"{name}: {measured.summary()} (budget {budget}); calls: {measured.calls}"
+    assert measured.round_trips <= budget.round_trips, detail
+    assert measured.depth <= budget.depth, detail
+    assert measured.api_calls <= budget.api_calls, detail
+    assert measured.wall_seconds <= budget.depth * LATENCY + WALL_SLACK_SECONDS, detail
+
+
+async def test_newdeal(bench: Bench, record_property) -> None:
+    msg = _message("/newdeal bike for 50", ALICE, FakeChat(ALICE.id, "private"))
+    measured = await bench.measure(lambda: dm_handlers.cmd_newdeal(msg))  # type: ignore[arg-type]
+    assert "?start=deal_" in msg.answers[-1]["text"]
+    _check("newdeal", measured, record_property)
+
+
+async def test_accept_invite(bench: Bench, record_property) -> None:
+    created = await bench.deals.create_invite_deal(
+        initiator_telegram_id=ALICE.id, description="bike"
+    )
+    msg = _message(f"/start deal_{created['deal']['id']}", BOB, FakeChat(BOB.id, "private"))
+    measured = await bench.measure(lambda: dm_handlers.cmd_start_deeplink(msg))  # type: ignore[arg-type]
+    assert "Deal accepted and confirmed" in msg.answers[-1]["text"]
+    _check("accept_invite", measured, record_property)
+
+
+async def test_complete(bench: Bench, record_property) -> None:
+    created = await bench.deals.create_deal(
+        initiator_telegram_id=ALICE.id,
+        counterparty_telegram_id=BOB.id,
+        group_telegram_id=GROUP.id,
+        description="bike",
+    )
+    deal_id = created["deal"]["id"]
+    await bench.deals.confirm_deal(deal_id, confirmer_telegram_id=BOB.id)
+    msg = _message(f"/complete {deal_id}", ALICE, GROUP)
+    measured = await bench.measure(lambda: deal_handlers.cmd_complete(msg))  # type: ignore[arg-type]
+    assert "Deal completed" in msg.answers[-1]["text"]
+    # The review prompts go out in the background, after the handler has answered.
+    await drain_notifications()
+    assert len(msg.bot.sent) == 2  # type: ignore[attr-defined]
+    _check("complete", measured, record_property)
+
+
+async def test_review(bench: Bench, record_property) -> None:
+    deal_id = await bench.completed_deal()
+    msg = _message(f"/review {deal_id} 5 smooth", ALICE, GROUP)
+    measured = await bench.measure(lambda: deal_handlers.cmd_review(msg))  # type: ignore[arg-type]
+    assert msg.answers[-1]["text"] == "waiting on their review"
+    _check("review", measured, record_property)
+
+
+async def test_review_that_completes_the_deal(bench: Bench, record_property) -> None:
+    deal_id = await bench.completed_deal()
+    await bench.deals.create_review(deal_id, reviewer_telegram_id=ALICE.id, rating=5)
+    msg = _message(f"/review {deal_id} 4 fine", BOB, GROUP)
+    measured = await bench.measure(lambda: deal_handlers.cmd_review(msg))  # type: ignore[arg-type]
+    assert msg.answers[-1]["text"] == "Review submitted."
+    _check("review_final", measured, record_property)
+
+
+async def test_reputation(bench: Bench, record_property) -> None:
+    deal_id = await bench.completed_deal()
+    await bench.deals.create_review(deal_id, reviewer_telegram_id=ALICE.id, rating=5)
+    await bench.deals.create_review(deal_id, reviewer_telegram_id=BOB.id, rating=4)
+    replied = FakeMessage(text="hi", from_user=BOB, chat=GROUP)
+    msg = _message("/reputation", ALICE, GROUP, reply_to_message=replied)
+    measured = await bench.measure(lambda: reputation_handlers.cmd_reputation(msg))  # type: ignore[arg-type]
+    assert "Reputation Profile" in msg.answers[-1]["text"]
+    _check("reputation", measured, record_property)
+
+
+async def test_stats(bench: Bench, record_property) -> None:
+    await bench.completed_deal()
+    msg = _message("/stats", ALICE, GROUP)
+    measured = await bench.measure(lambda: reputation_handlers.cmd_stats(msg))  # type: ignore[arg-type]
+    assert "Completed:</b> 1" in msg.answers[-1]["text"]
+    _check("stats", measured, record_property)
+
+
+async def test_report_submit(bench: Bench, record_property) -> None:
+    reported = await bench.pb.member_get_or_create(BOB.id, BOB.username, BOB.full_name)
+    draft = report_handlers.ReportDraft(
+        reported_member_id=reported["id"],
+        reported_telegram_id=BOB.id,
+        reported_display="Bob",
+        description="never paid",
+        photo_file_ids=["photo_1", "photo_2"],
+        step="confirm",
+    )
+    await report_handlers.save_pending_report(ALICE.id, draft)
+    bot = _FakeBot()
+    message = _EditableMessage(
+        text="confirm?", from_user=FakeUser(0), chat=FakeChat(ALICE.id, "private")
+    )
+    query = _FakeCallbackQuery(f"report_submit:{ALICE.id}", ALICE, message, bot)
+    measured = await bench.measure(lambda: report_handlers.cb_report_submit(query))  # type: ignore[arg-type]
+    assert "report has been submitted" in message.answers[-1]["text"]
+    stored = (await bench.pb.list_records("reports"))["items"]
+    assert stored[0]["evidence_photos"] == ["evidence_0.jpg", "evidence_1.jpg"]
+    _check("report_submit", measured, record_property)
+
+
+async def test_pay(bench: Bench, record_property) -> None:
+    await bench.api.enable_credit(GROUP.id, GROUP.title, "Hours", "h")
+    replied = FakeMessage(text="hi", from_user=BOB, chat=GROUP)
+    msg = _message("/pay 10 lunch", ALICE, GROUP, reply_to_message=replied, message_id=7)
+    measured = await bench.measure(lambda: credit_handlers.cmd_pay(msg))  # type: ignore[arg-type]
+    assert "Payment successful" in msg.answers[-1]["text"]
+    _check("pay", measured, record_property)
+
+
+async def test_balance(bench: Bench, record_property) -> None:
+    await bench.api.enable_credit(GROUP.id, GROUP.title, "Hours", "h")
+    await bench.api.upsert_member(ALICE.id, ALICE.username, ALICE.full_name)
+    msg = _message("/balance", ALICE, GROUP)
+    measured = await bench.measure(lambda: credit_handlers.cmd_balance(msg))  # type: ignore[arg-type]
+    assert "Your Balance" in msg.answers[-1]["text"]
+    _check("balance", measured, record_property)
@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetChatMember, SendMessage
+
+from commontrust_bot.send_scheduler import (
+    NOTIFICATION,
+    SendScheduler,
+    TokenBucket,
+    drain_notifications,
+    notification_priority,
+    send_notification,
+)
+
+
+@pytest.mark.asyncio
+async def test_bucket_serves_interactive_waiters_before_notifications() -> None:
+    bucket = TokenBucket(rate=50.0, capacity=1)
+    await bucket.acquire()
+    order: list[str] = []
+
+    async def take(name: str, priority: int) -> None:
+        await bucket.acquire(priority)
+        order.append(name)
+
+    notifications = [asyncio.create_task(take(f"n{i}", NOTIFICATION)) for i in range(2)]
+    await asyncio.sleep(0)
+    reply = asyncio.create_task(take("reply", 0))
+    await asyncio.gather(reply, *notifications)
+
+    assert order == ["reply", "n0", "n1"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_paces_each_chat_and_leaves_lookups_alone() -> None:
+    scheduler = SendScheduler(global_rate=1000.0, chat_rate=20.0, chat_burst=1)
+    sent: list[tuple[int, float]] = []
+
+    async def make_request(bot, method):
+        sent.append((method.chat_id, time.monotonic()))
+        return True
+
+    start = time.monotonic()
+    await asyncio.gather(
+        *(scheduler(make_request, None, SendMessage(chat_id=c, text="x")) for c in (1, 2, 1, 2, 1))
+    )
+    await scheduler(make_request, None, GetChatMember(chat_id=1, user_id=5))
+
+    chat_one = [t for chat, t in sent if chat == 1]
+    assert len(chat_one) == 4  # three sends plus the unthrottled lookup
+    assert chat_one[2] - start >= 0.09  # third send waited for two 50ms refills
+    assert chat_one[3] - chat_one[2] < 0.04
+    stats = scheduler.stats()
+    assert stats["sent_interactive"] == 5 and stats["throttled"] == 3 and stats["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_retries_after_flood_control() -> None:
+    scheduler = SendScheduler(group_rate=100.0, max_retries=2)
+    method = SendMessage(chat_id=-100, text="deal completed")
+    calls = 0
+
+    async def flooded(bot, m):
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=0)
+        return "ok"
+
+    with notification_priority():
+        assert await scheduler(flooded, None, method) == "ok"
+    stats = scheduler.stats()
+    assert calls == 3
+    assert stats["retry_after"] == 2 and stats["sent_notification"] == 1
+
+    async def always_flooded(bot, m):
+        raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        await scheduler(always_flooded, None, method)
+
+
+@pytest.mark.asyncio
+async def test_flood_control_in_several_chats_pauses_every_send() -> None:
+    scheduler = SendScheduler(global_rate=1000.0, chat_rate=1000.0, group_rate=1000.0)
+    flooded: set[int] = {1, 2}
+
+    async def make_request(bot, m):
+        if m.chat_id in flooded:
+            flooded.discard(m.chat_id)
+            raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=0.1)
+        return "ok"
+
+    # One chat flooding only pauses that chat.
+    await scheduler(make_request, None, SendMessage(chat_id=1, text="x"))
+    started = time.monotonic()
+    await scheduler(make_request, None, SendMessage(chat_id=3, text="x"))
+    assert time.monotonic() - started < 0.05
+    assert scheduler.stats()["global_pauses"] == 0
+
+    # A second chat flooded while the first is still paused: that's the global limit, so an
+    # unrelated chat waits too.
+    async def unrelated_chat() -> float:
+        await asyncio.sleep(0.01)
+        await scheduler(make_request, None, SendMessage(chat_id=4, text="x"))
+        return time.monotonic()
+
+    flooded.add(1)
+    started = time.monotonic()
+    *_, sent_at = await asyncio.gather(
+        scheduler(make_request, None, SendMessage(chat_id=1, text="x")),
+        scheduler(make_request, None, SendMessage(chat_id=2, text="x")),
+        unrelated_chat(),
+    )
+    assert sent_at - started >= 0.09
+    assert scheduler.stats()["global_pauses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_notifications_are_sent_in_the_background_lane() -> None:
+    scheduler = SendScheduler(group_rate=100.0, max_retries=1)
+    release = asyncio.Event()
+    priorities: list[int] = []
+
+    async def slow_request(bot, m):
+        await release.wait()
+        return "ok"
+
+    async def notify() -> None:
+        from commontrust_bot.send_scheduler import _send_priority
+
+        priorities.append(_send_priority.get())
+        await scheduler(slow_request, None, SendMessage(chat_id=-100, text="x"))
+
+    async def failing() -> None:
+        raise RuntimeError("bot was blocked by the user")
+
+    task = send_notification(notify())
+    send_notification(failing())
+    await asyncio.sleep(0)
+    # The caller isn't held while the notification waits.
+    assert not task.done()
+    release.set()
+    await drain_notifications(timeout=1)
+    assert task.done() and priorities == [NOTIFICATION]
+    assert scheduler.stats()["sent_notification"] == 1
@@ -0,0 +1,50 @@
+import pytest
+
+from commontrust_bot.state import MemoryStateStore, SQLiteStateStore
+
+
+@pytest.mark.asyncio
+async def test_memory_store_is_bounded_and_expires() -> None:
+    now = [0.0]
+    store = MemoryStateStore(maxsize=2, ttl_seconds=10, clock=lambda: now[0])
+
+    await store.set("draft", 1, {"step": "description"})
+    value = await store.get("draft", 1)
+    value["step"] = "evidence"
+    # Values are stored by value, like any out-of-process backend.
+    assert await store.get("draft", 1) == {"step": "description"}
+
+    await store.set("draft", 2, {"step": "a"})
+    await store.set("draft", 3, {"step": "b"})
+    assert await store.get("draft", 1) is None
+
+    now[0] = 11.0
+    assert await store.get("draft", 3) is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_store_survives_reopen_and_trims(tmp_path) -> None:
+    path = str(tmp_path / "state.sqlite3")
+    now = [1000.0]
+    store = SQLiteStateStore(path, maxsize=2, ttl_seconds=60, clock=lambda: now[0], purge_every=3)
+    await store.set("review_comment", 7, ["deal1", 5])
+    await store.set("review_response", 7, "rev1")
+    store.close()
+
+    reopened = SQLiteStateStore(path, maxsize=2, ttl_seconds=60, clock=lambda: now[0])
+    assert await reopened.get("review_comment", 7) == ["deal1", 5]
+    assert await reopened.get("review_response", "7") == "rev1"
+    await reopened.delete("review_response", 7)
+    assert await reopened.get("review_response", 7) is None
+
+    now[0] += 61
+    assert await reopened.get("review_comment", 7) is None
+    reopened.close()
+
+    trimmed = SQLiteStateStore(path, maxsize=2, ttl_seconds=60, clock=lambda: now[0], purge_every=3)
+    for user_id in range(3):
+        now[0] += 1
+        await trimmed.set("draft", user_id, {"n": user_id})
+    assert await trimmed.get("draft", 0) is None
+    assert await trimmed.get("draft", 2) == {"n": 2}
+    trimmed.close()
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from commontrust_common import webhook
+from tests.fake_telegram import FakeTelegramSender
+
+SECRET = "s3cret"
+PATH = "/telegram/webhook"
+
+
+async def _serve(dp: Dispatcher, **kwargs):
+    bot = Bot(token="42:TEST")
+    dispatcher = webhook.UpdateDispatcher(dp, bot, **kwargs)
+    await dispatcher.start()
+    client = TestClient(TestServer(webhook.webhook_app(dispatcher, SECRET, PATH)))
+    await client.start_server()
+    return bot, dispatcher, client
+
+
+async def _close(bot: Bot, dispatcher, client: TestClient) -> None:
+    await client.close()
+    await dispatcher.stop(drain_timeout=1.0)
+    await bot.session.close()
+
+
+@pytest.mark.asyncio
+async def test_updates_stay_ordered_per_chat_and_run_in_parallel_across_chats() -> None:
+    handled: dict[int, list[str]] = {}
+    running = 0
+    peak = 0
+    router = Router()
+
+    @router.message()
+    async def record(message: Message) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Earlier messages take longer, so a racing worker would reorder them.
+        await asyncio.sleep(0.02 / int(message.text))
+        handled.setdefault(message.chat.id, []).append(message.text)
+        running -= 1
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot, dispatcher, client = await _serve(dp, workers=4)
+    sender = FakeTelegramSender(client, PATH, SECRET)
+    try:
+        for n in range(1, 6):
+            for chat_id in (-100, -200, -300):
+                assert await sender.send(sender.message_update(chat_id, 1, str(n))) == 200
+        await dispatcher.join()
+    finally:
+        await _close(bot, dispatcher, client)
+
+    expected = [str(n) for n in range(1, 6)]
+    assert handled == {-100: expected, -200: expected, -300: expected}
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_bad_secret_and_applies_backpressure() -> None:
+    release = asyncio.Event()
+    handled: list[str] = []
+    router = Router()
+
+    @router.message()
+    async def blocked(message: Message) -> None:
+        await release.wait()
+        handled.append(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot, dispatcher, client = await _serve(dp, workers=1, max_pending=2, enqueue_timeout=0.01)
+    sender = FakeTelegramSender(client, PATH, SECRET)
+    try:
+        assert await sender.send(sender.message_update(1, 1, "forged"), secret="wrong") == 401
+        assert await sender.send(sender.message_update(1, 1, "a")) == 200
+        assert await sender.send(sender.message_update(2, 2, "b")) == 200
+        # Both slots are taken; Telegram is told to redeliver instead of the bot buffering more.
+        assert await sender.send(sender.message_update(3, 3, "c")) == 503
+
+        release.set()
+        await dispatcher.join()
+        assert await sender.send(sender.message_update(3, 3, "c")) == 200
+        await dispatcher.join()
+    finally:
+        await _close(bot, dispatcher, client)
+
+    assert handled == ["a", "b", "c"]
+    assert dispatcher.pending == 0